@@ -0,0 +1,78 @@
+"""
+Выбор обработчика кнопки: цепочка if/elif из прежнего button_handler
+против таблицы маршрутов CallbackRouter.
+
+Цепочка воспроизводит порядок проверок (== и startswith, в конце —
+проверка вхождения в chat_ids). Смесь callback_data включает кнопки
+диалога инвентаризации, которые раньше доходили до конца цепочки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_callback_router --lookups 200000
+"""
+import argparse
+import random
+import time
+
+from utils.callback_router import CallbackRouter
+
+CHAIN = [
+    ('==', 'start_process'), ('==', 'process_start'), ('startswith', 'select_'), ('==', 'inventory'),
+    ('==', 'add_event'), ('==', 'show_events'), ('startswith', 'show_event_details_'),
+    ('startswith', 'delete_event_'), ('startswith', 'edit_event_'), ('startswith', 'confirm_delete_'),
+    ('==', 'back_to_items'), ('==', 'back_to_categories'), ('==', 'confirm_event'), ('==', 'select_all_groups'),
+]
+
+
+def chain_match(data, chat_ids):
+    for kind, key in CHAIN:
+        if data == key if kind == '==' else data.startswith(key):
+            return key
+    if data in chat_ids.keys():
+        return 'chat'
+    return None
+
+
+def build_router():
+    router = CallbackRouter()
+
+    async def handler(*args):
+        pass
+
+    for kind, key in CHAIN:
+        router.add(key, handler, prefix=kind == 'startswith')
+    for key in ('select_chat_', 'category_', 'item_', 'type_raw_', 'type_semi_', 'edit_item_'):
+        router.add(key, handler, prefix=True, scope='inventory')
+    for key in ('back_to_menu', 'back_to_select_edit_items', 'edit_inventory', 'back_to_items', 'back_to_categories'):
+        router.add(key, handler, scope='inventory')
+    return router
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--chats', type=int, default=300)
+    args = parser.parse_args()
+
+    chat_ids = {f"Филиал {i}": -1_000_000 - i for i in range(args.chats)}
+    samples = ['category_Овощи и фрукты', 'item_Картофель мытый', 'type_raw_Картофель мытый', 'back_to_categories',
+               'back_to_menu', 'edit_item_Лук', 'show_events', 'confirm_event', 'select_Филиал 5', 'edit_inventory']
+    data = [random.choice(samples) for _ in range(args.lookups)]
+    router = build_router()
+
+    start = time.perf_counter()
+    for item in data:
+        chain_match(item, chat_ids)
+    chain_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for item in data:
+        router.resolve(item)
+    router_time = time.perf_counter() - start
+
+    print(f"Поисков: {args.lookups}, чатов: {args.chats}")
+    print(f"{'цепочка if/elif':<18} {chain_time / args.lookups * 1e6:>8.2f} мкс/кнопка")
+    print(f"{'CallbackRouter':<18} {router_time / args.lookups * 1e6:>8.2f} мкс/кнопка")
+
+
+if __name__ == '__main__':
+    main()
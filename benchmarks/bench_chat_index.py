@@ -0,0 +1,87 @@
+"""
+Поиск имени чата по ID: линейный перебор chat_ids против обратного индекса ChatManager.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_chat_index --chats 5000
+"""
+import argparse
+import random
+import time
+
+from chat_manager import ChatManager
+
+
+class MemoryStorage:
+    """Хранилище в памяти, чтобы бенчмарк не трогал файлы бота."""
+
+    def __init__(self, chat_ids):
+        self.chat_ids = chat_ids
+
+    def load_chat_ids(self):
+        return dict(self.chat_ids)
+
+    def save_chat_ids(self, chat_ids):
+        pass
+
+    def load_events(self):
+        return {}
+
+    def load_admins(self):
+        return set()
+
+    def load_chat_members(self):
+        return {}
+
+    def save_events(self, events):
+        pass
+
+    def save_admins(self, allowed_users):
+        pass
+
+    def save_chat_members(self, chat_members):
+        pass
+
+
+def linear_get_chat_name_by_id(chat_ids, chat_id):
+    for name, id in chat_ids.items():
+        if id == chat_id:
+            return name
+    return None
+
+
+def measure(label, lookups, fn):
+    start = time.perf_counter()
+    for chat_id in lookups:
+        fn(chat_id)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / len(lookups) * 1e6:>10.2f} мкс/поиск")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    chat_ids = {f"Филиал {i}": -1_000_000_000 - i for i in range(args.chats)}
+    chat_manager = ChatManager(None, MemoryStorage(chat_ids))
+    lookups = [random.choice(list(chat_ids.values())) for _ in range(args.lookups)]
+
+    print(f"Чатов: {args.chats}, поисков: {args.lookups}")
+    linear = measure("линейный перебор", lookups, lambda chat_id: linear_get_chat_name_by_id(chat_manager.chat_ids, chat_id))
+    indexed = measure("обратный индекс", lookups, chat_manager.get_chat_name_by_id)
+    print(f"Ускорение: x{linear / indexed:.0f}")
+
+    # Индекс остаётся согласованным при изменениях
+    start = time.perf_counter()
+    for i in range(1000):
+        chat_manager.set_chat_id(f"Филиал {i}", -2_000_000_000 - i)
+    elapsed = time.perf_counter() - start
+    print(f"{'set_chat_id (миграция)':<24} {elapsed / 1000 * 1e6:>10.2f} мкс/вызов")
+    assert chat_manager.get_chat_name_by_id(-2_000_000_000) == "Филиал 0"
+    assert chat_manager.get_chat_name_by_id(-1_000_000_000) is None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Память и скорость копирования/сброса инвентарей: вложенные словари
+(формат inventory.json) против CompactInventory (array('d') + битовая маска
+по слотам InventoryCatalog).
+
+  * память всех филиалов (tracemalloc);
+  * инвентарь нового филиала: copy.deepcopy(шаблон), copy_json_tree,
+    InventoryCatalog.new_inventory_dict() и CompactInventory.copy();
+  * сброс всех филиалов: обход словарей против CompactInventory.clear().
+
+Сравниваются представления по отдельности. В боте рабочее состояние
+остаётся в словарях, а CompactInventory строится из них по запросу для
+аналитики и архива, поэтому для бота важна последняя строка — стоимость
+такого преобразования.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_compact_inventory --categories 50 --items 100 --branches 100
+"""
+import argparse
+import copy
+import logging
+import time
+import tracemalloc
+
+from benchmarks.stress_inventory_sessions import build_template
+from utils.file_utils import copy_json_tree
+from utils.inventory_catalog import InventoryCatalog
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    data = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return data, size
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def clear_dicts(inventories):
+    for group_inventory in inventories.values():
+        for category in group_inventory.values():
+            for item in category.values():
+                for item_type in item.values():
+                    item_type['quantity'] = 0
+                    item_type['filled'] = False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--branches', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    template = build_template(args.categories, args.items)
+    catalog = InventoryCatalog(template)
+    print(f"Филиалов: {args.branches}, позиций в шаблоне: {catalog.size}")
+
+    dicts, dict_bytes = measure_memory(
+        lambda: {str(-1_000_000 - b): copy_json_tree(template) for b in range(args.branches)})
+    compact, compact_bytes = measure_memory(
+        lambda: {chat_id: catalog.compact(inventory) for chat_id, inventory in dicts.items()})
+    print(f"{'память, словари':<34} {dict_bytes / 2**20:>9.1f} МБ")
+    print(f"{'память, CompactInventory':<34} {compact_bytes / 2**20:>9.1f} МБ "
+          f"({dict_bytes / compact_bytes:.0f}x меньше)")
+
+    print("Инвентарь нового филиала:")
+    for label, func in (
+        ("copy.deepcopy(шаблон)", lambda: copy.deepcopy(template)),
+        ("copy_json_tree(шаблон)", lambda: copy_json_tree(template)),
+        ("catalog.new_inventory_dict()", catalog.new_inventory_dict),
+        ("catalog.new_inventory()", catalog.new_inventory),
+    ):
+        print(f"  {label:<32} {per_call(func, args.repeat) * 1e3:>9.3f} мс")
+
+    print("Сброс всех филиалов:")
+    print(f"  {'обход словарей':<32} {per_call(lambda: clear_dicts(dicts), args.repeat) * 1e3:>9.3f} мс")
+    clear_compact = per_call(lambda: [inventory.clear() for inventory in compact.values()], args.repeat)
+    print(f"  {'CompactInventory.clear()':<32} {clear_compact * 1e3:>9.3f} мс")
+
+    start = time.perf_counter()
+    for inventory in dicts.values():
+        catalog.compact(inventory)
+    print(f"Преобразование словарей в CompactInventory: "
+          f"{(time.perf_counter() - start) / args.branches * 1e3:.2f} мс на филиал")
+
+
+if __name__ == '__main__':
+    main()
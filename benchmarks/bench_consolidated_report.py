@@ -0,0 +1,54 @@
+"""
+Время сборки сводного отчёта по филиалам в зависимости от числа процессов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_consolidated_report --branches 200 --items 300 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from utils.inventory_report import build_consolidated_report
+
+
+def build_branch(items, seed, categories=10):
+    inventory = {f"Категория {c}": {} for c in range(categories)}
+    for n in range(items):
+        inventory[f"Категория {n % categories}"][f"Товар №{n} (гр.)"] = {
+            'raw': {'quantity': (n + seed) % 50, 'filled': (n + seed) % 50 > 0},
+            'semi': {'quantity': (n * seed) % 7, 'filled': (n * seed) % 7 > 0},
+        }
+    return inventory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=200)
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--mode', choices=['zip', 'xlsx'], default='zip')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    branches = [(f"Филиал {b}", build_branch(args.items, b + 1)) for b in range(args.branches)]
+    print(f"Филиалов: {args.branches}, товаров в филиале: {args.items}, режим: {args.mode}, ядер: {os.cpu_count()}")
+
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            path = asyncio.run(build_consolidated_report(
+                branches, os.path.join(tmp, "consolidated"), args.mode, max_workers=workers
+            ))
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(path)
+        baseline = baseline or elapsed
+        print(f"процессов: {workers:>3}  время: {elapsed:>7.2f} с  ускорение: x{baseline / elapsed:.2f}  "
+              f"размер: {size / 2**20:.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
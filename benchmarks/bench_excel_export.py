@@ -0,0 +1,91 @@
+"""
+Экспорт инвентаря: json_to_excel (полная книга в памяти) против потоковой
+записи (write-only лист) и CSV. Измеряются время, пик памяти (tracemalloc)
+и максимальная задержка цикла событий при асинхронном экспорте.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_excel_export --sizes 1000 10000 50000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from date_manager import json_to_excel, export_inventory, export_inventory_async
+
+
+def build_inventory(items, categories=20):
+    inventory = {f"Категория {c}": {} for c in range(categories)}
+    for n in range(items):
+        inventory[f"Категория {n % categories}"][f"Товар №{n} (гр.)"] = {
+            'raw': {'quantity': n % 97 + 1, 'filled': True},
+            'semi': {'quantity': n % 13, 'filled': n % 13 > 0},
+        }
+    return inventory
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+async def max_loop_lag(export):
+    """Максимальная задержка тика цикла событий, пока идёт экспорт."""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    await export()
+    done = True
+    await task
+    return lag
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 50_000])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'товаров':>8} {'режим':<16} {'время, с':>10} {'пик памяти, МБ':>16} {'задержка цикла, мс':>20}")
+        for size in args.sizes:
+            inventory = build_inventory(size)
+            path = os.path.join(tmp, f"inventory_{size}")
+
+            async def sync_on_loop():
+                json_to_excel(inventory, path + '_full.xlsx', "Филиал")
+
+            async def streaming_on_executor():
+                await export_inventory_async(inventory, path + '_stream.xlsx', "Филиал")
+
+            cases = [
+                ("json_to_excel", lambda: json_to_excel(inventory, path + '_full.xlsx', "Филиал"), sync_on_loop),
+                ("xlsx потоково", lambda: export_inventory(inventory, path + '_stream.xlsx', "Филиал"), streaming_on_executor),
+                ("csv", lambda: export_inventory(inventory, path + '.csv', "Филиал", 'csv'), None),
+            ]
+            for label, fn, on_loop in cases:
+                elapsed, peak = measure(fn)
+                lag = asyncio.run(max_loop_lag(on_loop)) if on_loop else None
+                lag_str = f"{lag * 1e3:>20.0f}" if lag is not None else f"{'-':>20}"
+                print(f"{size:>8} {label:<16} {elapsed:>10.2f} {peak / 2**20:>16.1f} {lag_str}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Сводная аналитика по филиалам: InventoryAnalytics (матрица NumPy) против
+обхода вложенных словарей InventoryManager.inventories.
+
+Филиалы заполняются случайными количествами (часть позиций не заполнена).
+Измеряются сборка матрицы из CompactInventory, итоги по позициям
+и категориям, доля заполненности, выбросы, рейтинг и полная текстовая
+сводка; для сравнения — итог по одному товару и по всем позициям обходом
+словарей и построение снимка филиалов из словарей, которое в боте
+предшествует сборке матрицы.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_inventory_analytics --branches 500 --categories 50 --items 100
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from array import array
+
+from benchmarks.stress_inventory_sessions import build_template
+from utils.inventory_analytics import InventoryAnalytics
+from utils.inventory_catalog import InventoryCatalog
+
+
+def build_branches(catalog, count, fill_rate):
+    branches = {}
+    for b in range(count):
+        compact = catalog.new_inventory()
+        quantities = [random.randint(1, 100) if random.random() < fill_rate else 0 for _ in range(catalog.size)]
+        compact.quantities = array('d', quantities)
+        for slot, quantity in enumerate(quantities):
+            compact.set_filled(slot, quantity > 0)
+        branches[str(-1_000_000 - b)] = compact
+    return branches
+
+
+def timed(func, repeat):
+    # Медиана: первые выделения памяти под матрицу заметно дороже повторных
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def dict_item_total(inventories, category, item):
+    total = 0
+    for inventory in inventories.values():
+        for option in inventory.get(category, {}).get(item, {}).values():
+            total += option.get('quantity') or 0
+    return total
+
+
+def dict_totals(inventories):
+    totals = {}
+    for inventory in inventories.values():
+        for category, items in inventory.items():
+            for item, options in items.items():
+                for item_type, option in options.items():
+                    key = (category, item, item_type)
+                    totals[key] = totals.get(key, 0) + (option.get('quantity') or 0)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=500)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--fill-rate', type=float, default=0.9)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    random.seed(1)
+
+    template = build_template(args.categories, args.items)
+    catalog = InventoryCatalog(template)
+    branches = build_branches(catalog, args.branches, args.fill_rate)
+    print(f"Филиалов: {args.branches}, товаров: {args.categories * args.items}, позиций: {catalog.size}")
+
+    # Первая сборка включает импорт NumPy и первое выделение памяти под матрицу
+    first_time, analytics = timed(lambda: InventoryAnalytics(catalog, branches), 1)
+    build_time, analytics = timed(lambda: InventoryAnalytics(catalog, branches), args.repeat)
+    # Проба — средний товар средней категории, чтобы подходил каталог любого размера
+    categories = list(catalog.layout)
+    category = categories[len(categories) // 2]
+    items = list(catalog.layout[category])
+    item = items[len(items) // 2]
+    rows = [
+        ("первая сборка матрицы", first_time),
+        ("сборка матрицы", build_time),
+        ("итог по товару", timed(lambda: analytics.item_total(category, item), args.repeat)[0]),
+        ("итоги по всем позициям", timed(analytics.totals, args.repeat)[0]),
+        ("итоги по категориям", timed(analytics.category_totals, args.repeat)[0]),
+        ("заполненность филиалов", timed(analytics.fill_rates, args.repeat)[0]),
+        ("филиалы без товара", timed(lambda: analytics.branches_missing(category, item), args.repeat)[0]),
+        ("выбросы (z > 3)", timed(analytics.outliers, args.repeat)[0]),
+        ("рейтинг филиалов", timed(analytics.ranking, args.repeat)[0]),
+        ("текстовая сводка", timed(analytics.summary, args.repeat)[0]),
+    ]
+    print("InventoryAnalytics:")
+    for label, elapsed in rows:
+        print(f"  {label:<28} {elapsed * 1e3:>9.2f} мс")
+
+    inventories = {chat_id: compact.to_dict() for chat_id, compact in branches.items()}
+    item_time, dict_total = timed(lambda: dict_item_total(inventories, category, item), args.repeat)
+    assert dict_total == analytics.item_total(category, item)
+    totals_time, _ = timed(lambda: dict_totals(inventories), 1)
+    # В боте матрица строится из словарей: сначала catalog.compact() каждого филиала
+    compile_time, _ = timed(lambda: {chat_id: catalog.compact(inventory) for chat_id, inventory in inventories.items()}, 1)
+    print("Обход словарей:")
+    print(f"  {'итог по товару':<28} {item_time * 1e3:>9.2f} мс")
+    print(f"  {'итоги по всем позициям':<28} {totals_time * 1e3:>9.2f} мс")
+    print(f"  {'снимок филиалов (compact)':<28} {compile_time * 1e3:>9.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Архив ежедневных снимков инвентаризации (InventoryArchive) за год.
+
+Каждый день всем филиалам меняется часть количеств, затем снимок
+дописывается в архив (как перед ежедневной очисткой). Измеряются:
+  * стоимость снимка за день (все филиалы; включает перевод закрытого
+    месяца в колоночный формат в первый день месяца);
+  * запрос истории одной позиции филиала за 90 и 365 дней;
+  * для сравнения — чтение всей истории филиала целиком без разбора
+    (нижняя граница для хранения снимков строками или в JSON).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_inventory_archive --days 365 --branches 20 --categories 20 --items 50
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.stress_inventory_sessions import build_template
+from utils.inventory_archive import InventoryArchive
+from utils.inventory_catalog import InventoryCatalog
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def load_everything(archive, chat_id):
+    # Нижняя граница для хранения без колонок: прочитать все файлы филиала целиком
+    branch_dir = os.path.join(archive.directory, chat_id)
+    total = 0
+    for name in os.listdir(branch_dir):
+        with open(os.path.join(branch_dir, name), 'rb') as f:
+            total += len(f.read())
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--branches', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--changes', type=int, default=200, help="изменений количеств на филиал в день")
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    random.seed(1)
+
+    catalog = InventoryCatalog(build_template(args.categories, args.items))
+    branches = {str(-1_000_000 - b): catalog.new_inventory() for b in range(args.branches)}
+    start_day = date.today() - timedelta(days=args.days - 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = InventoryArchive(os.path.join(tmp, 'inventory_archive'))
+        snapshot_times, month_start_times = [], []
+        for offset in range(args.days):
+            day = start_day + timedelta(days=offset)
+            for compact in branches.values():
+                for _ in range(args.changes):
+                    compact.set_quantity(random.randrange(catalog.size), random.randint(1, 500))
+            copies = {chat_id: compact.copy() for chat_id, compact in branches.items()}
+            started = time.perf_counter()
+            archive.write_snapshot(day, catalog, copies)
+            elapsed = time.perf_counter() - started
+            (month_start_times if day.day == 1 and offset else snapshot_times).append(elapsed)
+
+        print(f"Дней: {args.days}, филиалов: {args.branches}, позиций: {catalog.size}, "
+              f"размер архива: {directory_size(archive.directory) / 2**20:.1f} МБ")
+        print(f"{'снимок за день (все филиалы)':<42} медиана {statistics.median(snapshot_times) * 1e3:>8.2f} мс")
+        if month_start_times:
+            print(f"{'снимок + уплотнение месяца':<42} медиана {statistics.median(month_start_times) * 1e3:>8.2f} мс")
+
+        chat_ids = list(branches)
+        for days in (90, 365):
+            times = []
+            for _ in range(args.queries):
+                category, item, item_type = catalog.slots[random.randrange(catalog.size)]
+                started = time.perf_counter()
+                history = archive.history(random.choice(chat_ids), category, item, item_type, days)
+                times.append(time.perf_counter() - started)
+            print(f"{f'история позиции за {days} дней':<42} медиана {statistics.median(times) * 1e3:>8.3f} мс "
+                  f"({len(history)} значений)")
+
+        times = []
+        for chat_id in chat_ids:
+            started = time.perf_counter()
+            size = load_everything(archive, chat_id)
+            times.append(time.perf_counter() - started)
+        print(f"{'чтение всей истории филиала (без разбора)':<42} медиана {statistics.median(times) * 1e3:>8.3f} мс "
+              f"({size / 2**20:.1f} МБ)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Сравнение поиска товара: прежний перебор всех товаров с fuzz.partial_ratio
+против индекса ItemSearchIndex (нормализация + отбор кандидатов по триграммам).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_item_search --items 10000 --queries 50
+"""
+import argparse
+import logging
+import random
+import time
+
+from fuzzywuzzy import fuzz
+
+from utils.item_search import ItemSearchIndex
+
+BASES = [
+    "Орегано", "Базилик", "Паприка", "Куркума", "Кориандр", "Тимьян", "Розмарин", "Имбирь",
+    "Сыр моцарелла", "Сыр пармезан", "Сыр чеддер", "Соус томатный", "Соус сырный", "Соус терияки",
+    "Лосось", "Тунец", "Креветка", "Курица", "Говядина", "Свинина", "Бекон", "Ветчина",
+    "Рис", "Нори", "Тесто", "Мука", "Сахар", "Соль", "Масло сливочное", "Масло оливковое",
+    "Огурец", "Помидор", "Перец болгарский", "Лук красный", "Чеснок", "Шампиньоны", "Авокадо",
+    "Кола", "Спрайт", "Сок апельсиновый", "Вода минеральная", "Контейнер", "Крышка", "Палочки",
+]
+MODIFIERS = ["", "молотый", "сушёный", "свежий", "копчёный", "замороженный", "острый", "премиум", "фас."]
+UNITS = ["(гр.)", "(кг.)", "(шт.)", "(л.)", "(уп.)"]
+
+
+def build_catalog(items, categories=20):
+    rng = random.Random(42)
+    catalog = {f"Категория {c}": {} for c in range(categories)}
+    names = set()
+    while len(names) < items:
+        name = " ".join(part for part in (
+            rng.choice(BASES), rng.choice(MODIFIERS), f"№{rng.randint(1, 999)}", rng.choice(UNITS)
+        ) if part)
+        names.add(name)
+    for n, name in enumerate(sorted(names)):
+        catalog[f"Категория {n % categories}"][name] = {
+            'raw': {'quantity': 0, 'filled': False},
+            'semi': {'quantity': 0, 'filled': False},
+        }
+    return catalog
+
+
+def make_queries(catalog, count):
+    rng = random.Random(7)
+    names = [item for items in catalog.values() for item in items]
+    queries = []
+    for _ in range(count):
+        words = rng.choice(names).split()
+        query = " ".join(words[:2]).lower()
+        if rng.random() < 0.5 and len(query) > 4:
+            # Опечатка: пропущенная буква
+            pos = rng.randrange(1, len(query) - 1)
+            query = query[:pos] + query[pos + 1:]
+        queries.append(query)
+    return queries
+
+
+def legacy_search(catalog, query):
+    found = []
+    for category, items in catalog.items():
+        for item in items.keys():
+            if fuzz.partial_ratio(query, item.lower()) > 60:
+                found.append(item)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    catalog = build_catalog(args.items)
+    queries = make_queries(catalog, args.queries)
+
+    start = time.perf_counter()
+    index = ItemSearchIndex(catalog)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy_results = [legacy_search(catalog, query) for query in queries]
+    legacy_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    index_results = [index.search(query, limit=args.limit) for query in queries]
+    index_time = (time.perf_counter() - start) / len(queries)
+
+    # Доля лучших совпадений прежнего поиска (score 100), найденных индексом
+    hits = total = 0
+    for query, legacy, found in zip(queries, legacy_results, index_results):
+        found_items = {item for _, item in found}
+        exact = [item for item in legacy if fuzz.partial_ratio(query, item.lower()) == 100]
+        if exact:
+            total += 1
+            hits += any(item in found_items for item in exact)
+
+    print(f"Товаров: {len(index)}, запросов: {len(queries)}, построение индекса: {build_time * 1e3:.0f} мс")
+    print(f"{'перебор partial_ratio':<28} {legacy_time * 1e3:>10.1f} мс/запрос")
+    print(f"{'ItemSearchIndex':<28} {index_time * 1e3:>10.1f} мс/запрос")
+    print(f"Ускорение: x{legacy_time / index_time:.1f}; "
+          f"точные совпадения в top-{args.limit}: {hits}/{total}")
+
+
+if __name__ == '__main__':
+    main()
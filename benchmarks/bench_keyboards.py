@@ -0,0 +1,105 @@
+"""
+Сборка inline-клавиатур: пересборка на каждое нажатие против KeyboardCache.
+
+Повторяется типичная навигация по диалогу инвентаризации (категории ->
+товары категории -> назад к категориям) и переключение чатов в клавиатуре
+выбора филиалов. Время ввода количества в измерение не входит: каждое
+изменение опции меняет версию счётчиков, и следующая клавиатура строится
+заново в обоих вариантах.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_keyboards --taps 20000 --categories 12 --items 25 --chats 100
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from benchmarks.stress_inventory_sessions import build_template
+from components.inventory_manager import InventoryManager, InventorySession
+from message_handler import CustomMessageHandler
+from utils.fill_status import InventoryFillStatus
+from utils.keyboards import KeyboardCache
+from utils.preferences import PreferenceStore
+
+
+class FakeChatManager:
+    def __init__(self, chat_ids):
+        self.chat_ids = chat_ids
+        self.chat_ids_version = 1
+
+
+class FakeMediator:
+    scheduler = None
+
+    def register_message_handler(self, handler):
+        pass
+
+
+def navigation_time(manager, session, categories, taps):
+    start = time.perf_counter()
+    for n in range(taps):
+        if n % 2:
+            manager.items_keyboard(session, random.choice(categories))
+        else:
+            manager.category_keyboard(session)
+    return time.perf_counter() - start
+
+
+def picker_time(handler, chat_ids, taps):
+    chat_list = list(chat_ids.values())
+    selected = []
+
+    async def run():
+        for n in range(taps):
+            # Пользователь отмечает и снимает несколько одних и тех же филиалов
+            chat_id = chat_list[n % 4]
+            if chat_id in selected:
+                selected.remove(chat_id)
+            else:
+                selected.append(chat_id)
+            await handler.get_chat_selection_keyboard(selected, chat_ids)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--taps', type=int, default=20_000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=12)
+    parser.add_argument('--items', type=int, default=25)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    inventory = build_template(args.categories, args.items)
+    categories = list(inventory)
+    session = InventorySession(1, '-1000001', inventory, InventoryFillStatus(inventory))
+    chat_ids = {f"Филиал {i}": -1_000_000 - i for i in range(args.chats)}
+
+    # Менеджер без загрузки данных: нужны только методы клавиатур и порядок предпочтений
+    manager = InventoryManager.__new__(InventoryManager)
+    handler = CustomMessageHandler(FakeMediator(), FakeChatManager(chat_ids), chat_ids)
+
+    results = []
+    for label, maxsize in (("пересборка", 0), ("KeyboardCache", 512)):
+        random.seed(1)
+        manager.keyboards = KeyboardCache(maxsize=maxsize)
+        manager.preferences = PreferenceStore()
+        handler.keyboards = KeyboardCache(maxsize=maxsize)
+        nav = navigation_time(manager, session, categories, args.taps)
+        picker = picker_time(handler, chat_ids, args.taps)
+        results.append((label, nav, picker, manager.keyboards.hits + handler.keyboards.hits))
+
+    items = sum(len(items) for items in inventory.values())
+    print(f"Нажатий: {args.taps}, категорий: {len(categories)}, товаров: {items}, чатов: {args.chats}")
+    for label, nav, picker, hits in results:
+        print(f"{label:<14} категории/товары {nav / args.taps * 1e6:>8.1f} мкс/нажатие, "
+              f"выбор чатов {picker / args.taps * 1e6:>8.1f} мкс/нажатие (попаданий: {hits})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Задержка обработчиков инвентаризации при разных настройках логирования:
+прежняя (корневой логгер на DEBUG, синхронный StreamHandler) против
+utils.logging_setup (очередь и фоновый поток, INFO по умолчанию, DEBUG
+для модуля, прореживание частых сообщений). Нагрузка — диалоги из
+stress_inventory_sessions; вывод идёт в файл, --write-delay добавляет
+задержку на каждую запись, как у медленного терминала или диска.
+
+Отдельно: стоимость отброшенного по уровню вызова с f-строкой и с
+%-аргументами и дампа инвентаря филиала, который раньше строился в
+update_group_inventory на каждый вызов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_logging --conversations 100 --steps 10 --write-delay 0.0002
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.stress_inventory_sessions import (
+    FakeAccessControl, FakeChatManager, FakeMediator, build_template, run_conversation,
+)
+from components.inventory_manager import InventoryManager
+from utils.logging_setup import configure_logging, stop_logging
+from utils.storage import JsonStorage
+
+MODES = [
+    # (название, общий уровень, уровни модулей, прореживание, очередь)
+    ("без логирования", None, None, None, False),
+    ("DEBUG, синхронно (прежняя)", logging.DEBUG, None, None, False),
+    ("DEBUG, очередь", logging.DEBUG, None, None, True),
+    ("DEBUG модуля, 1 из 20", logging.INFO, {'components': logging.DEBUG}, {'components': 20}, True),
+    ("INFO, очередь (по умолчанию)", logging.INFO, {'httpx': logging.WARNING}, None, True),
+]
+
+
+class SlowStream:
+    """Файл, каждая запись в который занимает не меньше delay секунд."""
+
+    def __init__(self, path, delay):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+async def run_workload(args, tmp):
+    random.seed(1)
+    template = build_template(args.categories, args.items)
+    branches = max(1, args.conversations // 2)
+    branch_ids = [-1_000_000 - b for b in range(branches)]
+    users = [(10_000 + n, branch_ids[n % branches], 'raw' if n < branches else 'semi')
+             for n in range(args.conversations)]
+    inventory_path = os.path.join(tmp, 'inventory.json')
+    storage = JsonStorage(inventory_path=inventory_path, preferences_path=os.path.join(tmp, 'user_preferences.json'))
+    manager = InventoryManager(
+        chat_manager=FakeChatManager({user_id: [branch_id] for user_id, branch_id, _ in users}),
+        chat_ids={f"Филиал {b}": b for b in branch_ids},
+        access_control=FakeAccessControl(),
+        mediator=FakeMediator(template, inventory_path),
+        scheduler=None,
+        storage=storage,
+    )
+    categories = list(template)
+    latencies = []
+    plans = {}
+    for user_id, _, _ in users:
+        plans[user_id] = []
+        for _ in range(args.steps):
+            category = random.choice(categories)
+            plans[user_id].append((category, random.choice(list(template[category])), random.randint(1, 1000)))
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_conversation(manager, user_id, item_type, plans[user_id], latencies)
+        for user_id, _, item_type in users
+    ))
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return sorted(latencies), elapsed
+
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--write-delay', type=float, default=0.0, help="задержка одной записи в вывод, сек.")
+    args = parser.parse_args()
+
+    print(f"{'режим':<30} {'p50, мс':>8} {'p99, мс':>8} {'всего, с':>9} {'строк':>7} {'дописано после, с':>18}")
+    for name, level, module_levels, sampling, use_queue in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            stream = SlowStream(os.path.join(tmp, 'bot.log'), args.write_delay)
+            if level is None:
+                logging.disable(logging.CRITICAL)
+            else:
+                logging.disable(logging.NOTSET)
+                configure_logging(level=level, module_levels=module_levels, sampling=sampling,
+                                  stream=stream, use_queue=use_queue)
+            latencies, elapsed = asyncio.run(run_workload(args, tmp))
+            drain = time.perf_counter()
+            stop_logging()
+            drain = time.perf_counter() - drain
+            for logger_name in (module_levels or {}):
+                logging.getLogger(logger_name).setLevel(logging.NOTSET)
+            stream.close()
+            with open(os.path.join(tmp, 'bot.log'), encoding='utf-8') as f:
+                lines = sum(1 for _ in f)
+        print(f"{name:<30} {latencies[len(latencies) // 2] * 1e3:>8.3f} "
+              f"{latencies[int(len(latencies) * 0.99)] * 1e3:>8.3f} {elapsed:>9.2f} {lines:>7} {drain:>18.2f}")
+
+    # Вызов, отброшенный по уровню: f-строка собирается всё равно, %-аргументы — нет
+    logging.disable(logging.NOTSET)
+    configure_logging(level=logging.INFO, stream=open(os.devnull, 'w'))
+    logger = logging.getLogger('bench')
+    template = build_template(args.categories, args.items)
+    category, item = "Категория 1", "Товар 1-1"
+    calls = 200_000
+    eager = per_call(lambda: logger.debug(f"Обновление количества: категория='{category}', товар='{item}', "
+                                          f"опции={template[category][item]}."), calls)
+    lazy = per_call(lambda: logger.debug("Обновление количества: категория='%s', товар='%s', опции=%s.",
+                                         category, item, template[category][item]), calls)
+    print(f"{'отброшенный debug, f-строка':<34} {eager * 1e6:>8.2f} мкс")
+    print(f"{'отброшенный debug, %-аргументы':<34} {lazy * 1e6:>8.2f} мкс")
+    dump = per_call(lambda: json.dumps(template, indent=2), 20)
+    print(f"{'json.dumps инвентаря, indent=2':<34} {dump * 1e3:>8.2f} мс (дважды на update_group_inventory "
+          f"до изменения, теперь только при DEBUG)")
+    stop_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Накладные расходы метрик (utils.metrics): вызов обработчика без обёртки
+и через instrument_callback, одно наблюдение гистограммы и счётчика,
+выгрузка реестра в формате Prometheus и сводка для /stats.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_metrics --calls 200000 --handlers 40
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from utils.metrics import MetricsRegistry, REGISTRY, instrument_callback
+
+
+async def handler(update, context):
+    return None
+
+
+async def call_many(callback, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        await callback(None, None)
+    return (time.perf_counter() - start) / calls
+
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200_000)
+    parser.add_argument('--handlers', type=int, default=40, help="наборов меток в реестре при выгрузке")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    raw = asyncio.run(call_many(handler, args.calls))
+    wrapped = asyncio.run(call_many(instrument_callback(handler, 'bench'), args.calls))
+    print(f"{'обработчик без обёртки':<32} {raw * 1e6:>8.2f} мкс")
+    print(f"{'обработчик с метриками':<32} {wrapped * 1e6:>8.2f} мкс (+{(wrapped - raw) * 1e6:.2f} мкс)")
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram('bench_seconds', "Время", ('handler',))
+    counter = registry.counter('bench_total', "Вызовы", ('handler',))
+    print(f"{'Histogram.observe':<32} {per_call(lambda: histogram.observe(0.003, handler='h'), args.calls) * 1e6:>8.2f} мкс")
+    print(f"{'Counter.inc':<32} {per_call(lambda: counter.inc(handler='h'), args.calls) * 1e6:>8.2f} мкс")
+
+    for n in range(args.handlers):
+        for value in (0.0005, 0.004, 0.03, 0.2):
+            histogram.observe(value, handler=f'handler_{n}')
+        counter.inc(handler=f'handler_{n}')
+    render = per_call(registry.render, 200)
+    size = len(registry.render().encode('utf-8'))
+    print(f"{'render() ' + str(args.handlers) + ' обработчиков':<32} {render * 1e3:>8.3f} мс ({size / 1024:.1f} КБ)")
+    print(f"{'format_summary()':<32} {per_call(registry.format_summary, 200) * 1e3:>8.3f} мс")
+    assert REGISTRY.get('bot_handler_seconds').stats()[('bench',)][0] == args.calls
+
+
+if __name__ == '__main__':
+    main()
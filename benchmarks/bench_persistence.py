@@ -0,0 +1,84 @@
+"""
+Запись изменений: синхронный atomic_write_json в обработчике против
+PersistenceActor (пометка «грязных» сущностей, одна запись на пачку, поток).
+
+Имитируется серия из N вводов количества за window секунд; на каждый ввод
+меняются предпочтения (как в choose_category). Измеряется время, которое
+обработчики провели в цикле событий, и число записей на диск.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_persistence --entries 30 --window 2 --branches 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from utils.file_utils import atomic_write_json, copy_json_tree
+from utils.persistence import PersistenceActor
+
+
+def build_preferences(branches, items=300):
+    return {
+        str(-1_000_000 - b): {
+            "categories": {f"Категория {c}": c for c in range(10)},
+            "items": {f"Категория {c}": {f"Товар {c}-{i}": i for i in range(items // 10)} for c in range(10)},
+        }
+        for b in range(branches)
+    }
+
+
+async def run(entries, window, preferences, save):
+    handler_time = 0.0
+    for n in range(entries):
+        start = time.perf_counter()
+        preferences[str(-1_000_000 - n % len(preferences))]["categories"]["Категория 0"] += 1
+        save()
+        handler_time += time.perf_counter() - start
+        await asyncio.sleep(window / entries)
+    return handler_time
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'user_preferences.json')
+
+        preferences = build_preferences(args.branches)
+        writes = 0
+
+        def sync_save():
+            nonlocal writes
+            atomic_write_json(path, preferences, ensure_ascii=False, indent=4)
+            writes += 1
+
+        sync_time = await run(args.entries, args.window, preferences, sync_save)
+        print(f"{'синхронная запись':<22} в цикле событий: {sync_time * 1e3:>8.1f} мс, записей: {writes}")
+
+        preferences = build_preferences(args.branches)
+        actor = PersistenceActor(coalesce_delay=args.window)
+        actor.register('preferences',
+                       lambda data: atomic_write_json(path, data, ensure_ascii=False, indent=4),
+                       lambda: copy_json_tree(preferences))
+        actor.start()
+        actor_time = await run(args.entries, args.window, preferences, lambda: actor.mark_dirty('preferences'))
+        start = time.perf_counter()
+        await actor.stop()
+        stop_time = time.perf_counter() - start
+        print(f"{'PersistenceActor':<22} в цикле событий: {actor_time * 1e3:>8.1f} мс, записей: {actor.writes_count} "
+              f"(сброс при остановке {stop_time * 1e3:.0f} мс)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=30)
+    parser.add_argument('--window', type=float, default=2.0)
+    parser.add_argument('--branches', type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
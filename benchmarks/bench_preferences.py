@@ -0,0 +1,118 @@
+"""
+Учёт предпочтений на каждое нажатие: прежняя схема (увеличить счётчик,
+переписать user_preferences.json, отсортировать категории и товары филиала
+заново) против PreferenceStore (счётчики в памяти с затуханием, порядок
+поддерживается при увеличении, сохранение пачкой).
+
+Нажатия распределены по Ципфу, как реальные вкусы филиала. Измеряются
+время нажатия вместе с упорядочиванием меню и число записей на диск;
+порядок PreferenceStore сверяется с полной сортировкой по тем же счетам.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_preferences --branches 100 --categories 30 --items 50 --taps 5000
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from utils.file_utils import atomic_write_json
+from utils.preferences import PreferenceStore
+
+
+def zipf_choice(keys, weights):
+    return random.choices(keys, weights)[0]
+
+
+def legacy_tap(preferences, chat_id, category, item):
+    branch = preferences.setdefault(chat_id, {"categories": {}, "items": {}})
+    branch["categories"][category] = branch["categories"].get(category, 0) + 1
+    items = branch["items"].setdefault(category, {})
+    items[item] = items.get(item, 0) + 1
+
+
+def legacy_order(preferences, chat_id, categories, items):
+    branch = preferences.get(chat_id, {"categories": {}, "items": {}})
+    ordered = sorted(categories, key=lambda c: branch["categories"].get(c, 0), reverse=True)
+    return ordered, {
+        category: sorted(items[category], key=lambda i: branch["items"].get(category, {}).get(i, 0), reverse=True)
+        for category in ordered
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=30)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--taps', type=int, default=5000)
+    parser.add_argument('--flush-every', type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    random.seed(1)
+
+    categories = [f"Категория {c}" for c in range(args.categories)]
+    items = {category: [f"Товар {c}-{i}" for i in range(args.items)] for c, category in enumerate(categories)}
+    category_weights = [1 / (rank + 1) for rank in range(args.categories)]
+    item_weights = [1 / (rank + 1) for rank in range(args.items)]
+    chat_ids = [str(-1_000_000 - b) for b in range(args.branches)]
+    taps = []
+    for _ in range(args.taps):
+        category = zipf_choice(categories, category_weights)
+        taps.append((random.choice(chat_ids), category, zipf_choice(items[category], item_weights)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'user_preferences.json')
+        preferences = {}
+        start = time.perf_counter()
+        for chat_id, category, item in taps:
+            legacy_tap(preferences, chat_id, category, item)
+            atomic_write_json(path, preferences, ensure_ascii=False, indent=4)
+            legacy_order(preferences, chat_id, categories, items)
+        legacy_time = time.perf_counter() - start
+        print(f"{'прежняя схема':<28} {legacy_time / args.taps * 1e6:>9.1f} мкс на нажатие, "
+              f"записей: {args.taps}")
+
+        # Время стоит на месте: порядок должен совпасть с полной сортировкой по целым счётчикам
+        store = PreferenceStore(clock=lambda: 0.0)
+        writes = 0
+        start = time.perf_counter()
+        for chat_id, category, item in taps:
+            store.record(chat_id, category)
+            store.record(chat_id, category, item)
+            if store.pending >= args.flush_every:
+                atomic_write_json(path, store.to_json(), ensure_ascii=False, indent=4)
+                writes += 1
+            store.category_order(chat_id, categories)
+            store.item_order(chat_id, category, items[category])
+        store_time = time.perf_counter() - start
+        print(f"{'PreferenceStore':<28} {store_time / args.taps * 1e6:>9.1f} мкс на нажатие, "
+              f"записей: {writes} ({legacy_time / store_time:.0f}x быстрее)")
+
+        for chat_id in chat_ids:
+            expected_categories, expected_items = legacy_order(preferences, chat_id, categories, items)
+            counts = preferences.get(chat_id, {"categories": {}, "items": {}})
+            actual = store.category_order(chat_id, categories)
+            assert [counts["categories"].get(c, 0) for c in actual] == \
+                [counts["categories"].get(c, 0) for c in expected_categories]
+            for category in categories:
+                actual = store.item_order(chat_id, category, items[category])
+                scores = counts["items"].get(category, {})
+                assert [scores.get(i, 0) for i in actual] == [scores.get(i, 0) for i in expected_items[category]]
+        print("Порядок совпадает с полной сортировкой.")
+
+        # Затухание: то, что выбирали месяц назад, уступает выбранному на этой неделе
+        now = [0.0]
+        store = PreferenceStore(clock=lambda: now[0])
+        for _ in range(20):
+            store.record(chat_ids[0], "Старая категория")
+        now[0] += 30 * 86400
+        for _ in range(6):
+            store.record(chat_ids[0], "Новая категория")
+        print(f"Через 30 дней: {store.category_order(chat_ids[0], ['Старая категория', 'Новая категория'])}")
+
+
+if __name__ == '__main__':
+    main()
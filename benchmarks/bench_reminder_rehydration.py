@@ -0,0 +1,133 @@
+"""
+Восстановление ожидающих напоминаний при запуске.
+
+Сравниваются:
+  * ReminderJobStore -> ChatManager: загрузка всех задач из SQLite одной
+    выборкой и сборка кучи ReminderQueue за O(n); в JobQueue ставится одна
+    задача пробуждения;
+  * по задаче JobQueue.run_once на каждую отправку (как было до очереди
+    напоминаний).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_reminder_rehydration --jobs 100000 --run-once 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from telegram.ext import ApplicationBuilder
+
+from chat_manager import ChatManager
+from utils.reminder_store import ReminderJobStore
+
+TOKEN = "123456:TEST"
+
+
+class MemoryStorage:
+    """Пустое хранилище в памяти: события берутся только из хранилища задач."""
+
+    def load_chat_ids(self):
+        return {}
+
+    def save_chat_ids(self, chat_ids):
+        pass
+
+    def load_events(self):
+        return {}
+
+    def save_events(self, events):
+        pass
+
+    def load_admins(self):
+        return set()
+
+    def save_admins(self, allowed_users):
+        pass
+
+    def load_chat_members(self):
+        return {}
+
+    def save_chat_members(self, chat_members):
+        pass
+
+
+class CountingMediator:
+    def __init__(self):
+        self.notifications = 0
+
+    def notify_reminders_changed(self):
+        self.notifications += 1
+
+
+def build_jobs(count, chats=100):
+    now = datetime.now()
+    return [
+        (f"event{n // chats}:{-1_000_000 - n % chats}", f"event{n // chats}", -1_000_000 - n % chats,
+         now + timedelta(minutes=1 + n % 100_000), f"Напоминание: событие {n // chats}")
+        for n in range(count)
+    ]
+
+
+async def run_once_baseline(count):
+    application = ApplicationBuilder().token(TOKEN).build()
+    job_queue = application.job_queue
+
+    async def callback(context):
+        pass
+
+    start = time.perf_counter()
+    for n in range(count):
+        job_queue.run_once(callback, when=60 + n, data={'chat_id': -1_000_000 - n % 100})
+    schedule_time = time.perf_counter() - start
+    start = time.perf_counter()
+    await job_queue.start()
+    start_time = time.perf_counter() - start
+    await job_queue.stop(wait=False)
+    return schedule_time, start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=100_000)
+    parser.add_argument('--run-once', type=int, default=20_000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'reminders.db')
+        store = ReminderJobStore(path)
+        start = time.perf_counter()
+        store.add_jobs(build_jobs(args.jobs))
+        store.mark_seeded()
+        print(f"Задач в хранилище: {store.count()}, запись: {(time.perf_counter() - start) * 1e3:.0f} мс")
+        store.close()
+
+        start = time.perf_counter()
+        store = ReminderJobStore(path)
+        mediator = CountingMediator()
+        chat_manager = ChatManager(mediator, MemoryStorage(), reminder_store=store)
+        elapsed = time.perf_counter() - start
+        assert len(chat_manager.reminders) == args.jobs
+        print(f"{'хранилище -> ReminderQueue':<28} {args.jobs:>7} задач: {elapsed * 1e3:>8.0f} мс "
+              f"(пересчётов пробуждения: {mediator.notifications})")
+
+        start = time.perf_counter()
+        for job_id, _, _ in chat_manager.reminders.pop_due(datetime.now() + timedelta(minutes=1)):
+            chat_manager.complete_reminder(job_id)
+        print(f"{'снятие первых отправок':<28} {(time.perf_counter() - start) * 1e3:>17.1f} мс, "
+              f"осталось в хранилище: {store.count()}")
+        store.close()
+
+    schedule_time, start_time = asyncio.run(run_once_baseline(args.run_once))
+    per_job = (schedule_time + start_time) / args.run_once
+    print(f"{'JobQueue.run_once':<28} {args.run_once:>7} задач: {(schedule_time + start_time) * 1e3:>8.0f} мс "
+          f"(постановка {schedule_time * 1e3:.0f} мс, запуск {start_time * 1e3:.0f} мс; "
+          f"~{per_job * args.jobs:.1f} с на {args.jobs} при линейном росте)")
+
+
+if __name__ == '__main__':
+    main()
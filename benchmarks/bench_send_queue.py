@@ -0,0 +1,112 @@
+"""
+Рассылка напоминаний через RateAwareSendQueue против отправки «всё сразу».
+
+Заглушка Telegram применяет его лимиты (30 сообщений/с на бота,
+20 сообщений/мин на групповой чат) и отвечает RetryAfter при превышении.
+Рассылка — несколько напоминаний в каждый из N групповых чатов; параллельно
+пользователи получают интерактивные ответы. Измеряются: время рассылки,
+число ответов RetryAfter и задержка интерактивных ответов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_send_queue --chats 100 --reminders 2 --replies 50
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+from utils.send_queue import BROADCAST, RateAwareSendQueue
+
+
+class FakeTelegram:
+    """Считает отправки в скользящих окнах и отвечает RetryAfter при превышении лимитов."""
+
+    def __init__(self, overall_rate, group_rate_per_minute, latency):
+        self.overall_rate = overall_rate
+        self.group_rate = group_rate_per_minute
+        self.latency = latency
+        self.sent = collections.deque()
+        self.sent_by_chat = collections.defaultdict(collections.deque)
+        self.delivered = 0
+        self.rejected = 0
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] >= 1:
+            self.sent.popleft()
+        chat_sent = self.sent_by_chat[chat_id]
+        while chat_sent and now - chat_sent[0] >= 60:
+            chat_sent.popleft()
+        if len(self.sent) >= self.overall_rate or (chat_id < 0 and len(chat_sent) >= self.group_rate):
+            self.rejected += 1
+            raise RetryAfter(1)
+        self.sent.append(now)
+        chat_sent.append(now)
+        self.delivered += 1
+        return True
+
+
+async def run(args, use_queue):
+    api = FakeTelegram(30, 20, args.latency)
+    queue = RateAwareSendQueue(workers=args.workers, max_retries=100)
+    await queue.initialize()
+
+    async def send(chat_id, rate_limit_args=None):
+        if use_queue:
+            return await queue.process_request(api.send_message, (chat_id, 'text'), {}, 'sendMessage',
+                                               {'chat_id': chat_id}, rate_limit_args)
+        # Без очереди: наивный повтор после RetryAfter
+        while True:
+            try:
+                return await api.send_message(chat_id, 'text')
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                await asyncio.sleep(getattr(retry_after, 'total_seconds', lambda: retry_after)())
+
+    reply_latencies = []
+
+    async def reply(user_id, delay):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await send(user_id)
+        reply_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    broadcast = [send(-1_000_000 - chat, BROADCAST) for _ in range(args.reminders) for chat in range(args.chats)]
+    replies = [reply(1000 + n, n * args.reply_interval) for n in range(args.replies)]
+    await asyncio.gather(*broadcast, *replies)
+    elapsed = time.perf_counter() - start
+    await queue.shutdown()
+
+    reply_latencies.sort()
+    pct = lambda p: reply_latencies[min(len(reply_latencies) - 1, int(len(reply_latencies) * p))] * 1e3
+    name = 'RateAwareSendQueue' if use_queue else 'всё сразу'
+    print(f"{name:<20} доставлено: {api.delivered:>5}  RetryAfter: {api.rejected:>5}  время: {elapsed:>6.1f} с  "
+          f"ответы p50: {pct(0.5):>7.1f} мс  p95: {pct(0.95):>7.1f} мс")
+
+
+async def main_async(args):
+    print(f"Групповых чатов: {args.chats}, напоминаний в чат: {args.reminders}, интерактивных ответов: {args.replies}")
+    for use_queue in (False, True):
+        await run(args, use_queue)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--reminders', type=int, default=2)
+    parser.add_argument('--replies', type=int, default=50)
+    parser.add_argument('--reply-interval', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
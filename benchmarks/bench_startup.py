@@ -0,0 +1,132 @@
+"""
+Время запуска бота.
+
+  * импорт: `python -X importtime -c "import main"` — общее время импорта
+    и самые тяжёлые модули верхнего уровня; заодно проверяется, что импорт
+    не создаёт файлов в рабочем каталоге;
+  * время до первого обновления: main.py запускается как процесс против
+    заглушки Bot API (TELEGRAM_API_URL), в которой уже лежит /start;
+    измеряется время от запуска процесса до ответа бота (sendMessage).
+
+Бот работает во временном каталоге с копией JSON-файлов репозитория.
+Для сравнения с другой версией кода можно указать --repo (например,
+git worktree со старым коммитом).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from tornado.httpserver import HTTPServer
+
+from benchmarks.bench_webhook_latency import FakeBotApi, make_update
+
+
+def prepare_workdir(repo, workdir):
+    for path in glob.glob(os.path.join(repo, '*.json')):
+        shutil.copy(path, workdir)
+
+
+def measure_import(repo, workdir):
+    before = set(os.listdir(workdir))
+    env = dict(os.environ, PYTHONPATH=repo)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+
+    top_level = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == 'main':
+            total = int(cumulative)
+        elif name.startswith('   ') and not name.startswith('    '):
+            top_level.append((int(cumulative), name.strip()))
+    created = sorted(set(os.listdir(workdir)) - before - {'__pycache__'})
+    return wall, total / 1e6, sorted(top_level, reverse=True), created
+
+
+async def measure_first_update(repo, workdir, api_port):
+    api = FakeBotApi()
+    server = HTTPServer(api.make_app())
+    server.listen(api_port, address='127.0.0.1')
+    update = make_update(1, 10_000)
+    update["message"].update(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+    api.pending.put_nowait(update)
+
+    env = dict(os.environ, PYTHONPATH=repo, TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}/bot")
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(repo, 'main.py'), cwd=workdir, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        while not any(method == 'sendMessage' for method, _ in api.calls):
+            if process.returncode is not None:
+                raise RuntimeError(f"Бот завершился с кодом {process.returncode}")
+            await asyncio.sleep(0.005)
+        first = {}
+        for method, at in api.calls:
+            first.setdefault(method, at - start)
+        return first
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            process.kill()
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--repo', default=os.getcwd())
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--api-port', type=int, default=18083)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    repo = os.path.abspath(args.repo)
+
+    imports, walls, first_updates, first_getme = [], [], [], []
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            prepare_workdir(repo, workdir)
+            wall, total, top_level, created = measure_import(repo, workdir)
+            imports.append(total)
+            walls.append(wall)
+            if run == 0:
+                print("Самые тяжёлые импорты верхнего уровня (кумулятивно):")
+                for cumulative, name in top_level[:args.top]:
+                    print(f"  {name:<36} {cumulative / 1e3:>8.1f} мс")
+                print(f"Файлы, созданные импортом: {', '.join(created) or 'нет'}")
+
+        with tempfile.TemporaryDirectory() as workdir:
+            prepare_workdir(repo, workdir)
+            first = asyncio.run(measure_first_update(repo, workdir, args.api_port))
+            first_getme.append(first['getMe'])
+            first_updates.append(first['sendMessage'])
+
+    print(f"{'импорт main (importtime)':<32} медиана {statistics.median(imports) * 1e3:>7.0f} мс")
+    print(f"{'процесс с импортом main':<32} медиана {statistics.median(walls) * 1e3:>7.0f} мс")
+    print(f"{'запуск -> getMe':<32} медиана {statistics.median(first_getme) * 1e3:>7.0f} мс")
+    print(f"{'запуск -> ответ на /start':<32} медиана {statistics.median(first_updates) * 1e3:>7.0f} мс")
+
+
+if __name__ == '__main__':
+    main()
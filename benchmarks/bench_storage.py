@@ -0,0 +1,119 @@
+"""
+Сравнение хранилищ инвентаризации: JSON (полная перезапись), JSON с журналом и SQLite.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_storage --branches 500 --items 2000
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import tempfile
+import time
+
+from utils.storage import JsonStorage, SqliteStorage
+
+
+def build_template(items, categories=20):
+    per_category = max(1, items // categories)
+    return {
+        f"Категория {c}": {
+            f"Товар {c}-{i}": {
+                'raw': {'quantity': 0, 'filled': False},
+                'semi': {'quantity': 0, 'filled': False},
+            }
+            for i in range(per_category)
+        }
+        for c in range(categories)
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def random_change(template, chat_ids):
+    category = random.choice(list(template))
+    item = random.choice(list(template[category]))
+    return random.choice(chat_ids), category, item, random.choice(['raw', 'semi']), random.randint(1, 100)
+
+
+def bench_updates(label, storage, inventories, template, chat_ids, updates, flush_each):
+    """
+    flush_each=True — запись на каждое изменение (прежнее поведение, всё в цикле событий);
+    False — в цикле только постановка в буфер, запись одной пачкой (в боте — поток PersistenceActor).
+    """
+    changes = [random_change(template, chat_ids) for _ in range(updates)]
+    start = time.perf_counter()
+    for chat_id, category, item, item_type, quantity in changes:
+        option = inventories[chat_id][category][item][item_type]
+        option['quantity'] = quantity
+        option['filled'] = True
+        storage.record_inventory_change(inventories, chat_id, category, item, item_type, quantity)
+        if flush_each:
+            storage.flush_inventory_changes()
+    elapsed = time.perf_counter() - start
+    flush_time, _ = timed(storage.flush_inventory_changes)
+    if flush_each:
+        print(f"{label:<40} {elapsed / updates * 1e3:>10.3f} мс/изменение")
+    else:
+        print(f"{label:<40} {elapsed / updates * 1e3:>10.3f} мс/изменение в цикле, "
+              f"запись пачки {flush_time * 1e3:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=500)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=200)
+    args = parser.parse_args()
+
+    template = build_template(args.items)
+    chat_ids = [str(-1_000_000_000 - b) for b in range(args.branches)]
+    inventories = {chat_id: copy.deepcopy(template) for chat_id in chat_ids}
+    rows = args.branches * sum(len(items) for items in template.values()) * 2
+    print(f"Филиалов: {args.branches}, товаров: {args.items}, строк (товар x тип): {rows}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_storage = JsonStorage(inventory_path=os.path.join(tmp, 'inventory.json'))
+        json_storage.journal.compact_threshold = args.updates * 10
+        sqlite_storage = SqliteStorage(os.path.join(tmp, 'bot.db'))
+
+        elapsed, _ = timed(lambda: json_storage.save_inventories(inventories))
+        print(f"{'JSON: полное сохранение':<40} {elapsed:>10.2f} с")
+        elapsed, _ = timed(lambda: json_storage.load_inventories(template))
+        print(f"{'JSON: загрузка':<40} {elapsed:>10.2f} с")
+
+        elapsed, _ = timed(lambda: sqlite_storage.save_inventories(inventories))
+        print(f"{'SQLite: полное сохранение (1 транзакция)':<40} {elapsed:>10.2f} с")
+        elapsed, _ = timed(lambda: sqlite_storage.load_inventories(template))
+        print(f"{'SQLite: загрузка':<40} {elapsed:>10.2f} с")
+
+        # Старое поведение: каждое изменение перезаписывает весь файл
+        legacy_path = os.path.join(tmp, 'legacy.json')
+        legacy_updates = max(1, min(args.updates, 5))
+        start = time.perf_counter()
+        for _ in range(legacy_updates):
+            with open(legacy_path, 'w', encoding='utf-8') as f:
+                json.dump(inventories, f, ensure_ascii=False, indent=4)
+        elapsed = time.perf_counter() - start
+        print(f"{'JSON: полная перезапись на изменение':<40} {elapsed / legacy_updates * 1e3:>10.3f} мс/изменение")
+
+        bench_updates("JSON: журнал, запись на изменение", json_storage, inventories, template, chat_ids,
+                      args.updates, flush_each=True)
+        bench_updates("JSON: журнал, пачкой", json_storage, inventories, template, chat_ids,
+                      args.updates, flush_each=False)
+        bench_updates("SQLite: upsert на изменение", sqlite_storage, inventories, template, chat_ids,
+                      args.updates, flush_each=True)
+        bench_updates("SQLite: upsert пачкой", sqlite_storage, inventories, template, chat_ids,
+                      args.updates, flush_each=False)
+
+        json_storage.close()
+        sqlite_storage.close()
+
+
+if __name__ == '__main__':
+    main()
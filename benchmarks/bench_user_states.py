@@ -0,0 +1,82 @@
+"""
+Сравнение задержки set_user_state/get_user_state: старая реализация
+(чтение и перезапись user_data.json на каждый вызов) против хранилища в памяти.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_user_states --users 10000 --calls 500
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from user_states import UserStateStore
+from utils.storage import JsonStorage
+
+
+def legacy_set_user_state(path, user_id, state):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    data[str(user_id)] = state
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def legacy_get_user_state(path, user_id):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data.get(str(user_id), {})
+
+
+def seed_file(path, users):
+    with open(path, 'w') as f:
+        json.dump({str(1_000_000 + i): 'main_menu' for i in range(users)}, f)
+
+
+def measure(label, calls, fn):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / calls * 1e6:>12.1f} мкс/вызов")
+    return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--calls', type=int, default=500)
+    args = parser.parse_args()
+
+    states = ['main_menu', 'adding_event', 'editing_event', 'show_events', 'choosing_category']
+    user_ids = [1_000_000 + i for i in range(args.users)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.json')
+        store_path = os.path.join(tmp, 'store.json')
+        seed_file(legacy_path, args.users)
+        seed_file(store_path, args.users)
+        store = UserStateStore(JsonStorage(user_states_path=store_path))
+
+        print(f"Пользователей: {args.users}, вызовов: {args.calls}")
+        legacy_set = measure("legacy set_user_state", args.calls,
+                             lambda: legacy_set_user_state(legacy_path, random.choice(user_ids), random.choice(states)))
+        legacy_get = measure("legacy get_user_state", args.calls,
+                             lambda: legacy_get_user_state(legacy_path, random.choice(user_ids)))
+        store_set = measure("store set", args.calls * 100,
+                            lambda: store.set(random.choice(user_ids), random.choice(states)))
+        store_get = measure("store get", args.calls * 100,
+                            lambda: store.get(random.choice(user_ids)))
+
+        start = time.perf_counter()
+        flushed = store.flush()
+        flush_time = time.perf_counter() - start
+        print(f"{'store flush':<32} {flush_time * 1e3:>12.1f} мс ({flushed} изменённых пользователей)")
+
+        print(f"Ускорение set: x{legacy_set / store_set:.0f}, get: x{legacy_get / store_get:.0f}")
+
+
+if __name__ == '__main__':
+    main()
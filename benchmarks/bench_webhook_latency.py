@@ -0,0 +1,120 @@
+"""
+Сквозная задержка обработки обновлений в режимах polling и webhook.
+
+Поднимается заглушка Bot API (getMe, getUpdates, sendMessage и т.д.) и
+клиент, который отправляет синтетические Update в JSON:
+  * polling — клиент кладёт обновления в заглушку, бот забирает их getUpdates;
+  * webhook — клиент шлёт обновления POST-запросами на вебхук бота
+    (по одному или пачками, как обратный прокси).
+Задержка — от отправки клиентом до входа в обработчик.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_webhook_latency --updates 2000 --users 200 --batch 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+from tornado.httpserver import HTTPServer
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from benchmarks.fake_bot_api import FakeBotApi, make_update
+from utils.update_processor import PerUserUpdateProcessor
+from utils.webhook import start_webhook_server
+
+TOKEN = "123456:TEST"
+
+
+async def run_mode(mode, args, api_port, webhook_port):
+    sent_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def on_message(update, context):
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        await asyncio.sleep(args.handler_delay)  # Имитация работы обработчика
+        if len(latencies) >= args.updates:
+            done.set()
+
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{api_port}/bot")
+        .concurrent_updates(PerUserUpdateProcessor(args.concurrency))
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, on_message))
+    await application.initialize()
+
+    server = None
+    if mode == 'polling':
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        target = f"http://127.0.0.1:{api_port}/push"
+    else:
+        server = await start_webhook_server(application, '127.0.0.1', webhook_port, '/telegram')
+        target = f"http://127.0.0.1:{webhook_port}/telegram"
+    await application.start()
+
+    updates = [make_update(n, 10_000 + n % args.users) for n in range(args.updates)]
+    batches = [updates[i:i + args.batch] for i in range(0, len(updates), args.batch)]
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.connections)) as client:
+        semaphore = asyncio.Semaphore(args.connections)
+
+        async def post(batch):
+            async with semaphore:
+                for update in batch:
+                    sent_at[update["update_id"]] = time.perf_counter()
+                payload = batch if args.batch > 1 else batch[0]
+                response = await client.post(target, json=payload)
+                response.raise_for_status()
+
+        await asyncio.gather(*(post(batch) for batch in batches))
+        await asyncio.wait_for(done.wait(), timeout=120)
+    elapsed = time.perf_counter() - start
+
+    if application.updater.running:
+        await application.updater.stop()
+    if server is not None:
+        await server.shutdown()
+    await application.stop()
+    await application.shutdown()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3
+    print(f"{mode:<8} обновлений: {len(latencies):>6}  {len(latencies) / elapsed:>8.0f} upd/s  "
+          f"p50: {pct(0.5):>7.1f} мс  p95: {pct(0.95):>7.1f} мс  p99: {pct(0.99):>7.1f} мс")
+
+
+async def main_async(args):
+    api = FakeBotApi()
+    api_server = HTTPServer(api.make_app())
+    api_server.listen(args.api_port, address='127.0.0.1')
+    try:
+        print(f"Пользователей: {args.users}, пачка вебхука: {args.batch}, соединений клиента: {args.connections}")
+        for mode in ('polling', 'webhook'):
+            await run_mode(mode, args, args.api_port, args.webhook_port)
+    finally:
+        api_server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--connections', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--handler-delay', type=float, default=0.005)
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--webhook-port', type=int, default=18082)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочных прогонов без сети.
+
+Отвечает на getMe, getUpdates (длинный опрос из очереди), sendMessage,
+editMessageText, editMessageReplyMarkup, answerCallbackQuery, deleteMessage
+и getChatAdministrators; остальные методы отвечают True. Для каждого метода
+задаётся задержка ответа (базовая + случайный разброс), как у настоящего API.
+Заглушка хранит отправленные ботом сообщения с клавиатурами, поэтому
+симулятор пользователя видит последнее сообщение в чате и может нажимать
+его кнопки. Все вызовы записываются с временем и чатом, к которому относятся.
+
+Используется bench_webhook_latency и load_bot; запускается в том же цикле
+событий, что и бот (tornado поверх asyncio).
+"""
+import asyncio
+import collections
+import itertools
+import json
+import random
+import time
+
+import tornado.web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+def make_user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def make_chat(chat_id):
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+    return {"id": chat_id, "type": "group", "title": f"Chat {chat_id}"}
+
+
+def make_update(update_id, user_id, text=None):
+    """Текстовое сообщение пользователя в личном чате с ботом; /команда размечается как bot_command."""
+    text = str(update_id) if text is None else text
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": make_chat(user_id),
+        "from": make_user(user_id),
+        "text": text,
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+class FakeBotApi:
+    """
+    Заглушка Bot API для PTB.
+
+    latency — задержка ответа по умолчанию, сек.; method_latency — задержки
+    отдельных методов ({'sendMessage': 0.1}); jitter — добавочная случайная
+    задержка 0..jitter. admins — user_id, которых getChatAdministrators
+    возвращает администраторами каждого чата.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, method_latency=None, admins=(), seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.method_latency = dict(method_latency or {})
+        self.admins = list(admins)
+        self.random = random.Random(seed)
+        self.pending = asyncio.Queue()
+        self.calls = []  # (метод, время поступления по perf_counter)
+        self.calls_by_chat = collections.defaultdict(collections.Counter)  # chat_id -> {метод: число}
+        self.messages = {}  # chat_id -> {message_id: сообщение бота}
+        self.last_message = {}  # chat_id -> последнее отправленное или изменённое сообщение бота
+        self.callback_owners = {}  # callback_query_id -> chat_id
+        self._message_ids = itertools.count(1_000_000)
+        self._update_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    # Обновления от «пользователей»
+    def push(self, update):
+        self.pending.put_nowait(update)
+
+    def message_update(self, user_id, text):
+        return make_update(next(self._update_ids), user_id, text)
+
+    def callback_update(self, user_id, message, data):
+        """Нажатие кнопки data под сообщением бота message в личном чате пользователя."""
+        query_id = str(next(self._callback_ids))
+        self.callback_owners[query_id] = user_id
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": query_id,
+                "from": make_user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": message,
+            },
+        }
+
+    # Сервер
+    def make_app(self):
+        api = self
+
+        class MethodHandler(tornado.web.RequestHandler):
+            async def post(self, method):
+                params = {name: self.get_argument(name) for name in self.request.arguments}
+                if not params and self.request.body and \
+                        self.request.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(self.request.body)
+                self.write(await api.handle(method, params))
+
+        class PushHandler(tornado.web.RequestHandler):
+            async def post(self):
+                data = json.loads(self.request.body)
+                for update in data if isinstance(data, list) else [data]:
+                    api.push(update)
+                self.write({"ok": True})
+
+        return tornado.web.Application([
+            (r"/bot[^/]+/(\w+)", MethodHandler),
+            (r"/push", PushHandler),
+        ])
+
+    async def handle(self, method, params):
+        self.calls.append((method, time.perf_counter()))
+        chat_id = self._chat_of(method, params)
+        if chat_id is not None:
+            self.calls_by_chat[chat_id][method] += 1
+        if method != 'getUpdates':
+            delay = self.method_latency.get(method, self.latency)
+            if self.jitter:
+                delay += self.random.uniform(0, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        handler = getattr(self, f'_api_{method}', None)
+        result = await handler(params) if handler else True
+        if isinstance(result, tuple):  # (код, описание) — ошибка Bot API
+            return {"ok": False, "error_code": result[0], "description": result[1]}
+        return {"ok": True, "result": result}
+
+    def _chat_of(self, method, params):
+        if method == 'answerCallbackQuery':
+            return self.callback_owners.pop(params.get('callback_query_id'), None)
+        chat_id = params.get('chat_id')
+        try:
+            return int(chat_id) if chat_id is not None else None
+        except ValueError:
+            return None
+
+    def _store(self, chat_id, message):
+        self.messages.setdefault(chat_id, {})[message["message_id"]] = message
+        self.last_message[chat_id] = message
+        return message
+
+    @staticmethod
+    def _markup(params):
+        markup = params.get('reply_markup')
+        return json.loads(markup) if isinstance(markup, str) else markup
+
+    async def _api_getMe(self, params):
+        return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=False, supports_inline_queries=False)
+
+    async def _api_getUpdates(self, params):
+        timeout = float(params.get('timeout') or 0)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.pending.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return updates
+        while not self.pending.empty() and len(updates) < 100:
+            updates.append(self.pending.get_nowait())
+        return updates
+
+    async def _api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": make_chat(chat_id),
+            "from": BOT_USER,
+            "text": params.get('text', ''),
+        }
+        markup = self._markup(params)
+        if markup:
+            message["reply_markup"] = markup
+        return self._store(chat_id, message)
+
+    async def _edit(self, params, **changes):
+        chat_id = int(params['chat_id'])
+        message = self.messages.get(chat_id, {}).get(int(params['message_id']))
+        if message is None:
+            return 400, "Bad Request: message to edit not found"
+        message = dict(message, edit_date=int(time.time()), **changes)
+        markup = self._markup(params)
+        if markup:
+            message["reply_markup"] = markup
+        else:
+            message.pop("reply_markup", None)
+        return self._store(chat_id, message)
+
+    async def _api_editMessageText(self, params):
+        return await self._edit(params, text=params.get('text', ''))
+
+    async def _api_editMessageReplyMarkup(self, params):
+        return await self._edit(params)
+
+    async def _api_deleteMessage(self, params):
+        chat_id = int(params['chat_id'])
+        message = self.messages.get(chat_id, {}).pop(int(params['message_id']), None)
+        if message is not None and self.last_message.get(chat_id) is message:
+            del self.last_message[chat_id]
+        return True
+
+    async def _api_getChatAdministrators(self, params):
+        return [{"status": "creator", "user": make_user(user_id), "is_anonymous": False} for user_id in self.admins]
+
+    def calls_per_method(self, since=0.0):
+        return collections.Counter(method for method, at in self.calls if at >= since)
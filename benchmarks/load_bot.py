@@ -0,0 +1,304 @@
+"""
+Нагрузочный прогон бота целиком без сети: настоящее приложение из
+main.build_application() против заглушки Bot API (benchmarks.fake_bot_api)
+с задержкой ответов.
+
+N пользователей одновременно проходят сценарии, нажимая кнопки из последнего
+сообщения бота в своём чате, как в Telegram:
+  * инвентаризация — /start → «Приступить» → «Инвентаризация» → выбор филиала
+    (SELECT_CHAT) → категория → товар → тип → ввод количества
+    (ENTERING_QUANTITY), несколько вводов за проход;
+  * события — добавление (выбор чатов, подтверждение, ввод), редактирование
+    и удаление из списка событий.
+Задержка действия — от постановки обновления в getUpdates до конца его
+обработки ботом (все группы обработчиков, включая ответы в API). Данные
+бота создаются во временном каталоге. Отправка и правка сообщений идут через
+RateAwareSendQueue с общим лимитом Telegram (28 сообщений/с), поэтому при
+многих пользователях задержку определяет очередь отправки, а не обработчики.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_bot --users 50 --rounds 2 --latency 0.03 --jitter 0.02
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from tornado.httpserver import HTTPServer
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.stress_inventory_sessions import build_template
+
+FLOWS = ('inventory', 'event_add', 'event_edit', 'event_delete')
+
+
+def prepare_workdir(directory, args, user_ids, rng):
+    """Файлы данных бота: филиалы, участники (по нескольку филиалов на пользователя), администраторы, шаблон."""
+    chat_ids = {f"Филиал {b}": -1_000_000 - b for b in range(args.branches)}
+    members = {str(user_id): rng.sample(sorted(chat_ids.values()), min(args.branches_per_user, args.branches))
+               for user_id in user_ids}
+    files = {
+        'chat_ids.json': chat_ids,
+        'chat_members.json': members,
+        'admins_ids.json': {"allowed_users": user_ids},
+        'events.json': {},
+        'inventory_template.json': build_template(args.categories, args.items),
+    }
+    for name, data in files.items():
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+class LoadDriver:
+    """Отправляет обновления в заглушку и ждёт, пока бот закончит их обработку."""
+
+    def __init__(self, api, timeout):
+        self.api = api
+        self.timeout = timeout
+        self._waiting = {}  # update_id -> future с временем окончания обработки
+        self.results = []  # (шаг, задержка, вызовов API)
+        self.timeouts = collections.Counter()
+
+    async def on_processed(self, update, context):
+        # Последняя группа обработчиков: все остальные обработчики обновления уже завершились
+        future = self._waiting.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def send(self, user_id, step, update):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[update['update_id']] = future
+        calls = self.api.calls_by_chat[user_id]
+        calls_before = sum(calls.values())
+        start = time.perf_counter()
+        self.api.push(update)
+        try:
+            finished = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._waiting.pop(update['update_id'], None)
+            self.timeouts[step] += 1
+            return False
+        self.results.append((step, finished - start, sum(calls.values()) - calls_before))
+        return True
+
+
+class SimulatedUser:
+    """Пользователь в личном чате с ботом: читает последнее сообщение бота и нажимает его кнопки."""
+
+    def __init__(self, driver, user_id, rng, quantities):
+        self.driver = driver
+        self.api = driver.api
+        self.user_id = user_id
+        self.rng = rng
+        self.quantities = quantities
+        self.events_added = 0
+
+    @property
+    def message(self):
+        return self.api.last_message.get(self.user_id)
+
+    def buttons(self, prefix=''):
+        message = self.message or {}
+        rows = (message.get('reply_markup') or {}).get('inline_keyboard', [])
+        return [(button['text'], button['callback_data']) for row in rows for button in row
+                if button.get('callback_data', '').startswith(prefix)]
+
+    async def text(self, step, text):
+        return await self.driver.send(self.user_id, step, self.api.message_update(self.user_id, text))
+
+    async def press(self, step, data):
+        message = self.message
+        if message is None:
+            return False
+        return await self.driver.send(self.user_id, step, self.api.callback_update(self.user_id, message, data))
+
+    async def press_any(self, step, prefix, prefer=None):
+        buttons = self.buttons(prefix)
+        if prefer:
+            buttons = [button for button in buttons if prefer in button[0]] or buttons
+        if not buttons:
+            return False
+        return await self.press(step, self.rng.choice(buttons)[1])
+
+    async def open_menu(self, flow):
+        await self.text(f"{flow}:start", '/start')
+        if not self.buttons('start_process'):  # /start внутри диалога инвентаризации только завершает его
+            await self.text(f"{flow}:start", '/start')
+        return await self.press(f"{flow}:menu", 'start_process')
+
+    async def inventory(self):
+        await self.open_menu('inventory')
+        await self.press('inventory:open', 'inventory')
+        if self.buttons('select_chat_'):
+            await self.press_any('inventory:select_chat', 'select_chat_')
+        entered = 0
+        for _ in range(self.quantities * 6):
+            if entered >= self.quantities:
+                break
+            text = (self.message or {}).get('text', '')
+            if not self.buttons() and text.startswith('Введите количество'):
+                await self.text('inventory:quantity', str(self.rng.randint(1, 500)))
+                entered += 1
+            elif self.buttons('type_'):
+                if not await self.press_any('inventory:type', 'type_', prefer='❌'):
+                    await self.press('inventory:back', 'back_to_items')
+            elif self.buttons('item_'):
+                await self.press_any('inventory:item', 'item_')
+            elif self.buttons('category_'):
+                await self.press_any('inventory:category', 'category_', prefer='❌')
+            else:
+                break  # Инвентаризация филиала завершена или диалог прерван
+
+    async def add_event(self):
+        await self.open_menu('event_add')
+        await self.press('event_add:picker', 'add_event')
+        await self.press_any('event_add:select_chat', 'select_')
+        await self.press('event_add:confirm', 'confirm_event')
+        when = datetime.now() + timedelta(days=1)
+        if when.year != datetime.now().year:
+            when = datetime.now().replace(hour=23, minute=59)
+        self.events_added += 1
+        await self.text('event_add:input', f"{when:%d.%m} {when:%H:%M} Событие {self.user_id}-{self.events_added}")
+
+    async def open_event(self, flow):
+        await self.open_menu(flow)
+        await self.press(f"{flow}:list", 'show_events')
+        return await self.press_any(f"{flow}:details", 'show_event_details_')
+
+    async def edit_event(self):
+        if not await self.open_event('event_edit'):
+            return
+        await self.press_any('event_edit:open', 'edit_event_')
+        when = datetime.now() + timedelta(days=2)
+        await self.text('event_edit:input', f"{when:%d.%m} 12:00 Изменённое событие {self.user_id}")
+
+    async def delete_event(self):
+        if not await self.open_event('event_delete'):
+            return
+        await self.press_any('event_delete:ask', 'delete_event_')
+        await self.press_any('event_delete:confirm', 'confirm_delete_')
+
+    async def run(self, flows, rounds, ramp):
+        await asyncio.sleep(self.rng.uniform(0, ramp))
+        scenarios = {'inventory': self.inventory, 'event_add': self.add_event,
+                     'event_edit': self.edit_event, 'event_delete': self.delete_event}
+        for _ in range(rounds):
+            for flow in flows:
+                await scenarios[flow]()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def report(driver, api, elapsed, users, since):
+    latencies = [latency for _, latency, _ in driver.results]
+    actions = len(latencies)
+    print(f"Пользователей: {users}, действий: {actions}, за {elapsed:.1f} с — {actions / elapsed:.1f} действий/с; "
+          f"p50 {percentile(latencies, 0.5) * 1e3:.1f} мс, p99 {percentile(latencies, 0.99) * 1e3:.1f} мс")
+    timeouts = sum(driver.timeouts.values())
+    if timeouts:
+        print(f"Не дождались обработки: {timeouts} ({', '.join(f'{k}: {v}' for k, v in driver.timeouts.items())})")
+
+    by_step = collections.defaultdict(list)
+    for step, latency, calls in driver.results:
+        by_step[step].append((latency, calls))
+    print(f"{'шаг':<24} {'число':>6} {'p50, мс':>9} {'p99, мс':>9} {'API/действие':>13}")
+    for step in sorted(by_step):
+        values = by_step[step]
+        step_latencies = [latency for latency, _ in values]
+        print(f"{step:<24} {len(values):>6} {percentile(step_latencies, 0.5) * 1e3:>9.1f} "
+              f"{percentile(step_latencies, 0.99) * 1e3:>9.1f} {statistics.mean(c for _, c in values):>13.2f}")
+
+    methods = api.calls_per_method(since)
+    methods.pop('getUpdates', None)
+    total = sum(methods.values())
+    print(f"Вызовов API (без getUpdates): {total}, на действие пользователя: {total / max(actions, 1):.2f}")
+    print('  ' + ', '.join(f"{method}: {count}" for method, count in methods.most_common()))
+
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    rng = random.Random(args.seed)
+    user_ids = [10_000 + n for n in range(args.users)]
+    api = FakeBotApi(latency=args.latency, jitter=args.jitter, admins=user_ids, seed=args.seed)
+    api_server = HTTPServer(api.make_app())
+    api_server.listen(args.api_port, address='127.0.0.1')
+
+    os.environ.update({
+        'TELEGRAM_API_URL': f"http://127.0.0.1:{args.api_port}/bot",
+        'METRICS_PORT': 'off',
+        'CONSOLIDATED_REPORT': 'off',
+    })
+    import main as bot  # Импорт после подготовки окружения: main читает его при сборке приложения
+
+    application = bot.build_application()
+    driver = LoadDriver(api, args.timeout)
+    application.add_handler(TypeHandler(Update, driver.on_processed), group=100)
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    await application.start()
+    try:
+        # Доступ выдаётся по getChatAdministrators в первом обновлении кэша администраторов
+        await asyncio.sleep(0.5)
+        users = [SimulatedUser(driver, user_id, random.Random(rng.random()), args.quantities) for user_id in user_ids]
+        since = time.perf_counter()
+        await asyncio.gather(*(user.run(args.flows, args.rounds, args.ramp) for user in users))
+        elapsed = time.perf_counter() - since
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+        api_server.stop()
+    report(driver, api, elapsed, args.users, since)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=2, help="проходов всех сценариев на пользователя")
+    parser.add_argument('--flows', default=','.join(FLOWS), help=f"сценарии через запятую: {', '.join(FLOWS)}")
+    parser.add_argument('--quantities', type=int, default=5, help="вводов количества за проход инвентаризации")
+    parser.add_argument('--branches', type=int, default=10)
+    parser.add_argument('--branches-per-user', type=int, default=2)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.03, help="задержка ответа Bot API, сек.")
+    parser.add_argument('--jitter', type=float, default=0.02, help="случайная добавка к задержке, сек.")
+    parser.add_argument('--ramp', type=float, default=2.0, help="пользователи начинают в течение ramp секунд")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--api-port', type=int, default=18090)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    args.flows = [flow for flow in args.flows.split(',') if flow]
+    unknown = set(args.flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    logging.disable(logging.CRITICAL)
+
+    repo_root = os.getcwd()
+    sys.path.insert(0, repo_root)
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_workdir(tmp, args, [10_000 + n for n in range(args.users)], random.Random(args.seed))
+        os.chdir(tmp)  # Бот читает и пишет файлы данных в текущем каталоге
+        try:
+            asyncio.run(run(args))
+        finally:
+            os.chdir(repo_root)
+
+
+if __name__ == '__main__':
+    main()
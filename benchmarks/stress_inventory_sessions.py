@@ -0,0 +1,213 @@
+"""
+Нагрузочная проверка сессий инвентаризации: N параллельных диалогов
+(по два пользователя на филиал) проходят выбор категории, товара, типа
+и ввод количества. В конце проверяется, что данные филиалов не перепутаны.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stress_inventory_sessions --conversations 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from components.inventory_manager import InventoryManager, ENTERING_QUANTITY, CHOOSING_ITEM_TYPE
+from utils.fill_status import InventoryFillStatus
+from utils.storage import JsonStorage
+
+
+class FakeMessage:
+    def __init__(self, text=None):
+        self.text = text
+        self.message_id = random.randint(1, 10**9)
+
+    async def reply_text(self, text, reply_markup=None):
+        await asyncio.sleep(random.uniform(0, 0.002))
+        return FakeMessage(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        await asyncio.sleep(random.uniform(0, 0.002))
+
+    async def edit_message_text(self, text, reply_markup=None):
+        await asyncio.sleep(random.uniform(0, 0.002))
+        return self.message
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeChat:
+    type = 'private'
+
+
+class FakeUpdate:
+    def __init__(self, user_id, data=None, text=None):
+        self.effective_user = FakeUser(user_id)
+        self.effective_chat = FakeChat()
+        self.callback_query = FakeCallbackQuery(data) if data is not None else None
+        self.message = FakeMessage(text) if text is not None else None
+        self.effective_message = self.message or (self.callback_query and self.callback_query.message)
+
+
+class FakeContext:
+    def __init__(self):
+        self.user_data = {}
+
+
+class FakeChatManager:
+    def __init__(self, chats_by_user):
+        self.chats_by_user = chats_by_user
+
+    def get_chats_for_user(self, user_id):
+        return self.chats_by_user.get(user_id, [])
+
+    def get_chat_name_by_id(self, chat_id):
+        return f"Филиал {chat_id}"
+
+
+class FakeAccessControl:
+    async def has_access(self, update):
+        return True
+
+
+class FakeMediator:
+    def __init__(self, template, inventory_path):
+        self.template = template
+        self.inventory_path = inventory_path
+
+    def load_template(self, template_file_path):
+        return self.template
+
+    def get_inventory_file_path(self):
+        return self.inventory_path
+
+
+def build_template(categories, items_per_category):
+    return {
+        f"Категория {c}": {
+            f"Товар {c}-{i}": {
+                'raw': {'quantity': 0, 'filled': False},
+                'semi': {'quantity': 0, 'filled': False},
+            }
+            for i in range(items_per_category)
+        }
+        for c in range(categories)
+    }
+
+
+async def run_conversation(manager, user_id, item_type, plan, latencies):
+    context = FakeContext()
+
+    async def step(handler, update):
+        start = time.perf_counter()
+        state = await handler(update, context)
+        latencies.append(time.perf_counter() - start)
+        return state
+
+    await step(manager.handle_inventory, FakeUpdate(user_id, data='inventory'))
+    for category, item, quantity in plan:
+        await step(manager.choose_category, FakeUpdate(user_id, data=f'category_{category}'))
+        await step(manager.choose_item, FakeUpdate(user_id, data=f'item_{item}'))
+        state = await step(manager.choose_item_type, FakeUpdate(user_id, data=f'type_{item_type}_{item}'))
+        assert state == ENTERING_QUANTITY, state
+        state = await step(manager.enter_quantity, FakeUpdate(user_id, text=str(quantity)))
+        assert state in (CHOOSING_ITEM_TYPE,) or state is not None, state
+
+
+async def main_async(args):
+    template = build_template(args.categories, args.items)
+    branches = max(1, args.conversations // 2)
+    branch_ids = [-1_000_000 - b for b in range(branches)]
+
+    # Два пользователя на филиал: один вводит сырьё, другой полуфабрикаты
+    users = []
+    for n in range(args.conversations):
+        users.append((10_000 + n, branch_ids[n % branches], 'raw' if n < branches else 'semi'))
+    chats_by_user = {user_id: [branch_id] for user_id, branch_id, _ in users}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inventory_path = os.path.join(tmp, 'inventory.json')
+        storage = JsonStorage(
+            inventory_path=inventory_path,
+            preferences_path=os.path.join(tmp, 'user_preferences.json'),
+        )
+        manager = InventoryManager(
+            chat_manager=FakeChatManager(chats_by_user),
+            chat_ids={f"Филиал {b}": b for b in branch_ids},
+            access_control=FakeAccessControl(),
+            mediator=FakeMediator(template, inventory_path),
+            scheduler=None,
+            storage=storage,
+        )
+
+        categories = list(template)
+        plans = {}
+        for user_id, branch_id, item_type in users:
+            plan = []
+            for _ in range(args.steps):
+                category = random.choice(categories)
+                item = random.choice(list(template[category]))
+                plan.append((category, item, random.randint(1, 1000)))
+            plans[user_id] = plan
+
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_conversation(manager, user_id, item_type, plans[user_id], latencies)
+            for user_id, branch_id, item_type in users
+        ))
+        elapsed = time.perf_counter() - start
+
+        # Последнее введённое значение каждого пользователя должно оказаться в его филиале
+        errors = 0
+        for user_id, branch_id, item_type in users:
+            expected = {}
+            for category, item, quantity in plans[user_id]:
+                expected[(category, item)] = quantity
+            inventory = manager.inventories[str(branch_id)]
+            for (category, item), quantity in expected.items():
+                if inventory[category][item][item_type]['quantity'] != quantity:
+                    errors += 1
+
+        # Инкрементальные счётчики заполненности должны совпадать с полным пересчётом
+        for chat_id, status in manager.fill_status.items():
+            fresh = InventoryFillStatus(manager.inventories[chat_id])
+            if (status.filled_options, status.is_complete()) != (fresh.filled_options, fresh.is_complete()):
+                errors += 1
+
+        storage.close()
+
+    latencies.sort()
+    print(f"Диалогов: {args.conversations}, филиалов: {branches}, шагов на диалог: {args.steps}")
+    print(f"Время: {elapsed:.2f} с, обработчиков: {len(latencies)}, "
+          f"p50: {latencies[len(latencies) // 2] * 1e3:.2f} мс, p99: {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} мс")
+    print(f"Открытых сессий: {len(manager.sessions)}, расхождений данных: {errors}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--items', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    errors = asyncio.run(main_async(args))
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
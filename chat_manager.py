@@ -1,30 +1,62 @@
 import logging
-import json
+import uuid
+from datetime import datetime, timedelta
+from utils.file_utils import copy_json_tree
+from utils.persistence import PersistenceActor
+from utils.reminder_queue import ReminderQueue
+from utils.storage import JsonStorage
+
+logger = logging.getLogger(__name__)
 
 
 class ChatManager:
-    def __init__(self, mediator):
+    # Напоминания, пропущенные во время простоя дольше этого срока, не досылаются
+    MISFIRE_GRACE = timedelta(hours=1)
+
+    def __init__(self, mediator, storage=None, persistence=None, reminder_store=None):
+        self.mediator = mediator
+        self.storage = storage or JsonStorage()
+        self.persistence = persistence or PersistenceActor()
+        self.reminder_store = reminder_store  # ReminderJobStore или None — очередь только в памяти
+        self._admins_to_save = set()
+        self._register_persistence()
+        self.reminders = ReminderQueue()  # Отправки напоминаний (событие, чат), упорядоченные по времени
+        self._event_jobs = {}  # event_id -> job_id задач отправки в очереди
         self.chat_ids = {}
+        self._chat_names_by_id = {}  # Обратный индекс chat_id -> имена чатов (в порядке добавления)
+        self.chat_ids_version = 0  # Растёт при каждом изменении chat_ids (ключ кэша клавиатуры выбора чатов)
         self.selected_chats = []
         self.allowed_users = set()
-        self.chat_ids_filepath = 'chat_ids.json'
-        self.events_filepath = 'events.json'
-        self.admins_ids_filepath = 'admins_ids.json'
         self.events = {}  # Динамическое хранилище событий
+        self.chat_members = {}
         self.load_chat_ids_from_file()
+        # Участники чатов нужны до событий: по ним выбираются чаты для старых событий без chat_ids
+        self.load_chat_members_from_file()
         self.load_events_from_file()
         self.load_admins_ids_from_file()
-        self.chat_members = {} 
-        self.chat_members_filepath = 'chat_members.json'
-        self.load_chat_members_from_file()
-        self.mediator = mediator
     
 
 
     
+    def _register_persistence(self):
+        # Запись идёт через фоновый актор: здесь снимки данных и функции записи хранилища
+        self.persistence.register('chat_ids', self.storage.save_chat_ids, lambda: dict(self.chat_ids))
+        self.persistence.register('events', self.storage.save_events, lambda: copy_json_tree(self.events))
+        self.persistence.register('admins', self.storage.save_admins, lambda: set(self._admins_to_save))
+        self.persistence.register('chat_members', self.storage.save_chat_members,
+                                  lambda: copy_json_tree(self.chat_members))
+        if self.reminder_store is not None:
+            # Изменения задач напоминаний копятся в хранилище и фиксируются пачкой в потоке актора
+            self.persistence.register('reminder_jobs', self.reminder_store.flush)
+
+    def save_reminder_jobs(self):
+        self.persistence.mark_dirty('reminder_jobs')
+
     def add_user_to_chat(self, user_id, chat_id):
         if user_id not in self.chat_members:
             self.chat_members[user_id] = set()
+        if chat_id in self.chat_members[user_id]:
+            return
         self.chat_members[user_id].add(chat_id)
         self.save_chat_members_to_file()
 
@@ -32,118 +64,191 @@ class ChatManager:
         return list(self.chat_members.get(user_id, []))
 
     def save_chat_members_to_file(self):
-        try:
-            # Преобразовываем set в list для возможности сериализации в JSON
-            serializable_chat_members = {str(user_id): list(chats) for user_id, chats in self.chat_members.items()}
-            with open(self.chat_members_filepath, 'w', encoding='utf-8') as file:
-                json.dump(serializable_chat_members, file, ensure_ascii=False, indent=4)
-            logging.info("Связи членов чата сохранены в файл.")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении связей членов чата: {e}")
+        self.persistence.mark_dirty('chat_members')
+        logger.debug("Связи членов чата помечены для сохранения.")
 
     def load_chat_members_from_file(self):
         try:
-            with open(self.chat_members_filepath, 'r', encoding='utf-8') as file:
-                serializable_chat_members = json.load(file)
-                # Преобразуем list обратно в set
-                self.chat_members = {int(user_id): set(chats) for user_id, chats in serializable_chat_members.items()}
-                logging.info("Связи членов чата загружены из файла.")
+            self.chat_members = self.storage.load_chat_members()
+            logger.info("Связи членов чата загружены из файла.")
         except FileNotFoundError:
             self.chat_members = {}
-            logging.info("Файл chat_members.json не найден. Создаём пустой файл.")
+            logger.info("Файл chat_members.json не найден. Создаём пустой файл.")
             # Создаем пустой файл
             self.save_chat_members_to_file()
         except Exception as e:
             self.chat_members = {}
-            logging.error(f"Ошибка при загрузке связей членов чата: {e}")
+            logger.error("Ошибка при загрузке связей членов чата: %s", e)
             
     def get_chat_name_by_id(self, chat_id):
-        for name, id in self.chat_ids.items():
-            if id == chat_id:
-                return name
-        return None
-    
-    def remove_chat_id(self, chat_name):
+        names = self._chat_names_by_id.get(chat_id)
+        # При одинаковых ID возвращаем первое имя, как при линейном поиске
+        return names[0] if names else None
+
+    def _index_chat(self, chat_name, chat_id):
+        self._chat_names_by_id.setdefault(chat_id, []).append(chat_name)
+
+    def _unindex_chat(self, chat_name, chat_id):
+        names = self._chat_names_by_id.get(chat_id)
+        if names and chat_name in names:
+            names.remove(chat_name)
+            if not names:
+                del self._chat_names_by_id[chat_id]
+
+    def _rebuild_chat_index(self):
+        self._chat_names_by_id = {}
+        self.chat_ids_version += 1
+        for name, chat_id in self.chat_ids.items():
+            self._index_chat(name, chat_id)
+
+    def remove_chat_id(self, chat_name, save=True):
         if chat_name in self.chat_ids:
-            del self.chat_ids[chat_name]  # Удаляем из словаря chat_ids
+            chat_id = self.chat_ids.pop(chat_name)  # Удаляем из словаря chat_ids
+            self._unindex_chat(chat_name, chat_id)
+            self.chat_ids_version += 1
             self.selected_chats = [chat for chat in self.selected_chats if chat != chat_name]  # Удаляем из выбранных
-            self.save_chat_ids_to_file()  # Сохраняем изменения
-            logging.info(f"Chat ID для '{chat_name}' был удален.")
-            logging.debug(f"Текущие chat_ids после удаления: {self.chat_ids}")
-            logging.debug(f"Текущие selected_chats после удаления: {self.selected_chats}")
+            if save:
+                self.save_chat_ids_to_file()  # Сохраняем изменения
+            logger.info("Chat ID для '%s' был удален.", chat_name)
+            logger.debug("Текущие chat_ids после удаления: %s", self.chat_ids)
+            logger.debug("Текущие selected_chats после удаления: %s", self.selected_chats)
     
     def set_chat_id(self, chat_name, chat_id):
+        if chat_name in self.chat_ids:
+            self._unindex_chat(chat_name, self.chat_ids[chat_name])
         self.chat_ids[chat_name] = chat_id  # Это сохранит ID по имени
-        logging.info(f"Установлен ID {chat_id} для чата '{chat_name}'")
+        self._index_chat(chat_name, chat_id)
+        self.chat_ids_version += 1
+        logger.info("Установлен ID %s для чата '%s'", chat_id, chat_name)
 
     def save_chat_ids_to_file(self):
-        try:
-            with open(self.chat_ids_filepath, 'w', encoding='utf-8') as file:  # Добавлено 'encoding='utf-8''
-                json.dump(self.chat_ids, file, ensure_ascii=False)
-                logging.info("Chat IDs сохранены в файл.")
-                logging.debug(f"Данные, сохраненные в файл chat_ids.json: {self.chat_ids}")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении chat IDs: {e}")
+        self.persistence.mark_dirty('chat_ids')
+        logger.debug("Chat IDs помечены для сохранения: %s", self.chat_ids)
 
     def save_admins_ids_to_file(self, allowed_users):
-        data = {"allowed_users": list(allowed_users)}
-        try:
-            with open(self.admins_ids_filepath, "w", encoding="utf-8") as file:
-                json.dump(data, file, ensure_ascii=False, indent=4)
-            logging.info("Admins IDs сохранены в файл.")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении admins IDs: {e}")
+        self._admins_to_save = set(allowed_users)
+        self.persistence.mark_dirty('admins')
+        logger.debug("Admins IDs помечены для сохранения.")
 
     def load_admins_ids_from_file(self):
         try:
-            with open(self.admins_ids_filepath, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                self.allowed_users = set(data.get("allowed_users", []))
-                logging.info("Admins IDs загружены из файла.")
+            self.allowed_users = self.storage.load_admins()
+            logger.info("Admins IDs загружены из файла.")
         except FileNotFoundError:
-            logging.info(f"Файл {self.admins_ids_filepath} не найден. Создан пустой список администраторов.")
+            logger.info("Файл admins_ids.json не найден. Создан пустой список администраторов.")
             self.allowed_users = set()
         except Exception as e:
-            logging.error(f"Ошибка при загрузке admins IDs: {e}")
+            logger.error("Ошибка при загрузке admins IDs: %s", e)
             self.allowed_users = set()
 
     def add_user_to_admins(self, user_id):
         self.allowed_users.add(user_id)
         self.save_admins_ids_to_file(self.allowed_users)
-        self.load_admins_ids_from_file()
 
     def load_chat_ids_from_file(self):
+        # Обновляем словарь на месте: на него ссылаются AccessControl и обработчики
         try:
-            with open(self.chat_ids_filepath, 'r', encoding='utf-8') as file:
-                self.chat_ids = json.load(file)
-                logging.info("Chat IDs загружены из файла.")
+            chat_ids = self.storage.load_chat_ids()
+            self.chat_ids.clear()
+            self.chat_ids.update(chat_ids)
+            logger.info("Chat IDs загружены из файла.")
         except FileNotFoundError:
-            self.chat_ids = {}
-            logging.info("Файл chat_ids.json не найден. Создан пустой словарь.")
+            self.chat_ids.clear()
+            logger.info("Файл chat_ids.json не найден. Создан пустой словарь.")
             self.save_chat_ids_to_file()
         except Exception as e:
-            logging.error(f"Ошибка при загрузке chat IDs: {e}")
-            self.chat_ids = {}
+            logger.error("Ошибка при загрузке chat IDs: %s", e)
+            self.chat_ids.clear()
+        self._rebuild_chat_index()
 
     def load_events_from_file(self):
         try:
-            with open(self.events_filepath, 'r', encoding='utf-8') as file:
-                self.events = json.load(file)
-                logging.info("События загружены из файла.")
+            self.events = self.storage.load_events()
+            logger.info("События загружены из файла.")
         except FileNotFoundError:
             self.events = {}
-            logging.info("Файл events.json не найден. Создан пустой словарь.")
+            logger.info("Файл events.json не найден. Создан пустой словарь.")
         except Exception as e:
-            logging.error(f"Ошибка при загрузке событий: {e}")
+            logger.error("Ошибка при загрузке событий: %s", e)
             self.events = {}
+        self.rebuild_reminders()
+
+    @staticmethod
+    def get_event_datetime(event):
+        return datetime.strptime(f"{event['date']} {event['time']}", '%Y-%m-%d %H:%M')
+
+    def build_reminder_jobs(self, user_id, event):
+        """Задачи отправки напоминания о событии: (job_id, event_id, chat_id, due, text), по одной на чат."""
+        due = self.get_event_datetime(event)
+        event_id = event.setdefault('id', uuid.uuid4().hex)
+        text = f"Напоминание: {event['description']} запланировано на {event['date']} в {event['time']}"
+        chat_ids = event.get('chat_ids') or self.get_chats_for_user(int(user_id))
+        return [(f"{event_id}:{chat_id}", event_id, chat_id, due, text) for chat_id in chat_ids]
+
+    def _jobs_from_events(self):
+        now = datetime.now()
+        jobs = []
+        for user_id, events in self.events.items():
+            for event in events:
+                try:
+                    event_jobs = self.build_reminder_jobs(user_id, event)
+                except (KeyError, ValueError) as e:
+                    logger.error("Некорректная дата события %s: %s", event, e)
+                    continue
+                jobs.extend(job for job in event_jobs if job[3] > now)
+        return jobs
+
+    def rebuild_reminders(self):
+        """
+        Пересобирает очередь напоминаний. С хранилищем задач очередь целиком
+        загружается из него (включая пропущенные за время простоя отправки),
+        иначе строится из будущих событий.
+        """
+        if self.reminder_store is None:
+            jobs = self._jobs_from_events()
+        elif self.reminder_store.is_seeded():
+            jobs = self.reminder_store.load_pending()
+            expired_before = datetime.now() - self.MISFIRE_GRACE
+            expired = [job[0] for job in jobs if job[3] < expired_before]
+            if expired:
+                self.reminder_store.remove_jobs(expired)
+                self.save_reminder_jobs()
+                logger.warning("Пропущено напоминаний, просроченных более чем на %s: %s.", self.MISFIRE_GRACE, len(expired))
+                jobs = [job for job in jobs if job[3] >= expired_before]
+        else:
+            # Первый запуск с хранилищем: переносим в него будущие напоминания из событий
+            jobs = self._jobs_from_events()
+            self.reminder_store.add_jobs(jobs)
+            self.reminder_store.mark_seeded()
+            self.save_reminder_jobs()
+            self.save_events_to_file()  # Сохраняем присвоенные событиям id — по ним снимаются задачи
+
+        self._event_jobs = {}
+        for job_id, event_id, *_ in jobs:
+            self._event_jobs.setdefault(event_id, []).append(job_id)
+        self.reminders.rebuild((job_id, due, (event_id, chat_id, text)) for job_id, event_id, chat_id, due, text in jobs)
+        logger.info("Очередь напоминаний пересобрана: %s отправок.", len(self.reminders))
+        self._notify_reminders_changed()
+
+    def complete_reminder(self, job_id):
+        """Отмечает отправку напоминания выполненной (после попытки отправки)."""
+        event_id = job_id.rsplit(':', 1)[0]
+        job_ids = self._event_jobs.get(event_id, [])
+        if job_id in job_ids:
+            job_ids.remove(job_id)
+            if not job_ids:
+                del self._event_jobs[event_id]
+        if self.reminder_store is not None:
+            self.reminder_store.remove_jobs([job_id])
+            self.save_reminder_jobs()
+
+    def _notify_reminders_changed(self):
+        if self.mediator:
+            self.mediator.notify_reminders_changed()
 
     def save_events_to_file(self):
-        try:
-            with open(self.events_filepath, 'w', encoding='utf-8') as file:
-                json.dump(self.events, file, ensure_ascii=False)
-                logging.info("События сохранены в файл.")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении событий: {e}")
+        self.persistence.mark_dirty('events')
+        logger.debug("События помечены для сохранения.")
 
     def load_events(self, user_id):
         return self.events.get(str(user_id), [])
@@ -152,9 +257,43 @@ class ChatManager:
         user_id = str(user_id)
         if user_id not in self.events:
             self.events[user_id] = []
+        event.setdefault('id', uuid.uuid4().hex)
         self.events[user_id].append(event)
         self.save_events_to_file()
-        logging.info(f"Событие '{event}' добавлено для пользователя {user_id}.")
+        logger.info("Событие '%s' добавлено для пользователя %s.", event, user_id)
+
+        jobs = [job for job in self.build_reminder_jobs(user_id, event) if job[3] > datetime.now()]
+        if jobs:
+            if self.reminder_store is not None:
+                self.reminder_store.add_jobs(jobs)
+                self.save_reminder_jobs()
+            for job_id, event_id, chat_id, due, text in jobs:
+                self.reminders.push(job_id, due, (event_id, chat_id, text))
+                self._event_jobs.setdefault(event_id, []).append(job_id)
+            self._notify_reminders_changed()
+
+    def delete_event(self, user_id, event_index):
+        """Удаляет событие пользователя по индексу. Возвращает удалённое событие или None."""
+        user_id = str(user_id)
+        user_events = self.events.get(user_id, [])
+        if event_index < 0 or event_index >= len(user_events):
+            return None
+
+        deleted_event = user_events.pop(event_index)
+        if not user_events:
+            # Если нет событий, удаляем пользователя из словаря событий
+            del self.events[user_id]
+        self.save_events_to_file()
+
+        event_id = deleted_event.get('id')
+        if event_id is not None:
+            if self.reminder_store is not None:
+                self.reminder_store.remove_event(event_id)
+                self.save_reminder_jobs()
+            removed = [self.reminders.remove(job_id) for job_id in self._event_jobs.pop(event_id, [])]
+            if any(removed):
+                self._notify_reminders_changed()
+        return deleted_event
 
     def get_selected_chat_ids(self):
         return [self.chat_ids[chat_name] for chat_name in self.selected_chats if chat_name in self.chat_ids]
@@ -162,11 +301,11 @@ class ChatManager:
     def select_chat(self, chat_name):
         if chat_name in self.chat_ids and chat_name not in self.selected_chats:
             self.selected_chats.append(chat_name)
-            logging.info(f"Чат '{chat_name}' добавлен в выбранные")
+            logger.info("Чат '%s' добавлен в выбранные", chat_name)
 
     def deselect_chat(self, chat_name):
         if chat_name in self.selected_chats:
             self.selected_chats.remove(chat_name)
-            logging.info(f"Чат '{chat_name}' удален из выбранных")
+            logger.info("Чат '%s' удален из выбранных", chat_name)
 
 
@@ -1,93 +1,149 @@
+import asyncio
 import logging
+import time
+from collections import OrderedDict
 
 
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from telegram.ext import CallbackContext, ConversationHandler
-from date_manager import json_to_excel
+from date_manager import export_inventory_async
 import json
 import os
 from datetime import datetime, timedelta
-import copy
-from fuzzywuzzy import fuzz
+from utils.storage import JsonStorage
+from utils.file_utils import copy_json_tree
+from utils.fill_status import InventoryFillStatus
+from utils.inventory_analytics import InventoryAnalytics
+from utils.inventory_catalog import InventoryCatalog
+from utils.item_search import SEARCH_RESULTS_LIMIT, ItemSearchIndex
+from utils.keyboards import KeyboardCache, MAIN_MENU
+from utils.inventory_report import build_consolidated_report
+from utils.persistence import PersistenceActor
+from utils.preferences import PreferenceStore
+
+logger = logging.getLogger(__name__)
 
 SELECT_CHAT,CHOOSING_CATEGORY, CHOOSING_ITEM, CHOOSING_ITEM_TYPE , ENTERING_QUANTITY, RETURN_MENU, EDITING_ITEM, EDITING_SELECTION, ENTERING_QUANTITY_FOR_EDIT  = range(9)
 
+
+class InventorySession:
+    """
+    Сессия инвентаризации одного пользователя в одном филиале.
+
+    Хранит ссылку (не копию) на инвентарь филиала, поэтому несколько
+    пользователей и филиалов работают одновременно, не мешая друг другу.
+    Своих данных у сессии нет: вытесненная сессия открывается заново
+    при следующем обращении без потерь.
+    """
+
+    __slots__ = ('user_id', 'chat_id', 'inventory', 'status', 'last_used')
+
+    def __init__(self, user_id, chat_id, inventory, status):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.inventory = inventory
+        self.status = status  # InventoryFillStatus филиала
+        self.last_used = time.monotonic()
+
+
 class InventoryManager:
-    def __init__(self, chat_manager, chat_ids, access_control, mediator, scheduler):
+    def __init__(self, chat_manager, chat_ids, access_control, mediator, scheduler, storage=None, persistence=None,
+                 archive=None):
         self.chat_manager = chat_manager
         self.chat_ids = chat_ids
         self.access_control = access_control
         self.mediator = mediator
         self.scheduler = scheduler
         self.inventory_editable = True
-        self.inventory_template = self.mediator.load_template("inventory_template.json")
+        self.template_file_path = "inventory_template.json"
+        self.inventory_template = self.mediator.load_template(self.template_file_path)
+        self._template_signature = self.get_template_signature()
+        self._search_index = None  # Строится при первом поиске
+        self._catalog = None  # InventoryCatalog, строится при первом обращении
+        self.storage = storage or JsonStorage(inventory_path=self.mediator.get_inventory_file_path())
+        self.persistence = persistence or PersistenceActor()
+        self.archive = archive  # InventoryArchive или None — очистка без сохранения снимка
+        self.persistence.register('preferences', self.storage.save_preferences,
+                                  lambda: self.preferences.to_json())
+        # Снимок инвентаря берётся в цикле событий (с ротацией журнала), запись — в потоке актора
+        self.persistence.register('inventory', self.storage.write_inventory_snapshot,
+                                  lambda: self.storage.prepare_inventory_snapshot(self.inventories))
+        # Точечные изменения копятся в хранилище и дописываются пачкой в том же потоке
+        self.persistence.register('inventory_changes', self.storage.flush_inventory_changes)
         self.inventories = self.load_existing_inventory()
-        self.preferences_file = 'user_preferences.json'
-        self.user_preferences = self.load_preferences()
+        self.preferences = self.load_preferences()  # PreferenceStore, сохраняется пачками
+        self.sessions = OrderedDict()  # (user_id, chat_id) -> InventorySession, от давно не используемых к свежим
+        self.fill_status = {}  # chat_id -> InventoryFillStatus, строится при первом обращении
+        self.keyboards = KeyboardCache()  # Клавиатуры категорий и товаров по версии счётчиков филиала
+
+    # Область маршрутов кнопок диалога инвентаризации (ConversationHandler)
+    CALLBACK_SCOPE = 'inventory'
+    NAVIGATION_CALLBACKS = ('back_to_menu', 'back_to_categories', 'back_to_items',
+                            'back_to_select_edit_items', 'edit_inventory')
+    # Нажатий до сохранения предпочтений; остальные сохраняет периодическое уплотнение
+    PREFERENCES_FLUSH_EVERY = 50
+    # Брошенные диалоги не закрывают сессию: вытесняем простаивающие и самые старые сверх лимита
+    SESSION_IDLE_SECONDS = 6 * 3600
+    MAX_SESSIONS = 10_000
+
+    def register_callbacks(self, router):
+        """Маршруты кнопок диалога инвентаризации; состояния получают их через router.handler()."""
+        scope = self.CALLBACK_SCOPE
+        router.add('inventory', self.handle_inventory, scope=scope)
+        router.add('select_chat_', self.select_chat_for_invent, prefix=True, scope=scope)
+        router.add('category_', self.choose_category, prefix=True, scope=scope)
+        router.add('item_', self.choose_item, prefix=True, scope=scope)
+        router.add('type_raw_', self.choose_item_type, prefix=True, scope=scope)
+        router.add('type_semi_', self.choose_item_type, prefix=True, scope=scope)
+        router.add('edit_item_', self.edit_item, prefix=True, scope=scope)
+        for key in self.NAVIGATION_CALLBACKS:
+            router.add(key, self.item_navigation, scope=scope)
 
     def load_preferences(self):
         try:
-            with open(self.preferences_file, 'r', encoding='utf-8') as file:
-                return json.load(file)
+            data = self.storage.load_preferences()
         except FileNotFoundError:
-            return {}
+            data = {}
+        return PreferenceStore(data)
 
     def save_preferences(self):
-        with open(self.preferences_file, 'w', encoding='utf-8') as file:
-            json.dump(self.user_preferences, file, ensure_ascii=False, indent=4)
+        self.persistence.mark_dirty('preferences')
 
-    def update_preferences(self, chat_id, category=None, item=None):
-        chat_id_str = str(chat_id)
-        if chat_id_str not in self.user_preferences:
-            self.user_preferences[chat_id_str] = {"categories": {}, "items": {}}
-
-        preferences = self.user_preferences[chat_id_str]
-
-        if category:
-            if category not in preferences["categories"]:
-                preferences["categories"][category] = 0
-            preferences["categories"][category] += 1
-
-        if item:
-            if category not in preferences["items"]:
-                preferences["items"][category] = {}
-            if item not in preferences["items"][category]:
-                preferences["items"][category][item] = 0
-            preferences["items"][category][item] += 1
+    def flush_preferences(self):
+        """Сохраняет предпочтения, если после последнего сохранения были нажатия."""
+        if self.preferences.pending:
+            self.save_preferences()
 
-        self.save_preferences()
+    def update_preferences(self, chat_id, category=None, item=None):
+        """Учитывает выбор в памяти; на диск счётчики уходят пачкой раз в PREFERENCES_FLUSH_EVERY нажатий."""
+        if not category:
+            return
+        self.preferences.record(chat_id, category, item)
+        if self.preferences.pending >= self.PREFERENCES_FLUSH_EVERY:
+            self.save_preferences()
 
     def sort_inventory_preferences(self, chat_id):
-        # Получаем инвентарь для текущего чата
+        """Инвентарь филиала с категориями и товарами в порядке предпочтений (по готовому порядку, без сортировки)."""
         chat_id_str = str(chat_id)
         inventory = self.inventories.get(chat_id_str, {})
-        
+
         if not inventory:
-            logging.warning(f"Инвентарь для chat_id {chat_id_str} не найден.")
+            logger.warning("Инвентарь для chat_id %s не найден.", chat_id_str)
             return {}
 
-        # Загружаем предпочтения для chat_id
-        preferences = self.user_preferences.get(chat_id_str, {"categories": {}, "items": {}})
-
-        # Сортируем категории
-        sorted_categories = sorted(inventory.keys(),
-                                   key=lambda c: preferences['categories'].get(c, 0),
-                                   reverse=True)
-
-        # Сортируем товары внутри каждой категории
+        sorted_categories = self.preferences.category_order(chat_id_str, inventory.keys())
         sorted_inventory = {}
         for category in sorted_categories:
             items = inventory[category]
-            sorted_items = sorted(items.keys(),
-                                  key=lambda i: preferences['items'].get(category, {}).get(i, 0),
-                                  reverse=True)
+            sorted_items = self.preferences.item_order(chat_id_str, category, items.keys())
             sorted_inventory[category] = {item: items[item] for item in sorted_items}
 
         return sorted_inventory
 
-    def save_inventory_to_excel(self, chat_id):
+    async def save_inventory_to_excel(self, chat_id, file_format='xlsx'):
+        """Экспортирует инвентарь филиала в xlsx/csv в пуле потоков; возвращает путь к файлу."""
         # Преобразуем chat_id в строку, если необходимо, для совместимости с сохраненными данными
         chat_id_str = str(chat_id)
 
@@ -95,242 +151,424 @@ class InventoryManager:
         inventory = self.inventories.get(chat_id_str)
 
         if not inventory:
-            logging.warning(f"Инвентарь для chat_id {chat_id_str} не найден.")
+            logger.warning("Инвентарь для chat_id %s не найден.", chat_id_str)
             return
 
         # Получаем имя филиала
         chat_name = self.chat_manager.get_chat_name_by_id(int(chat_id))
         if not chat_name:
-            logging.warning(f"Имя филиала для chat_id {chat_id_str} не найдено, устанавливается значение по умолчанию.")
+            logger.warning("Имя филиала для chat_id %s не найдено, устанавливается значение по умолчанию.", chat_id_str)
             chat_name = f"Chat_{chat_id_str}"
         
         current_date_str = datetime.now().strftime('%Y%m%d')
         directory_path = f"output/{chat_name}_{current_date_str}"
         os.makedirs(directory_path, exist_ok=True)
-        excel_file_path = f"{directory_path}/inventory.xlsx"
+        excel_file_path = f"{directory_path}/inventory.{file_format}"
 
-        # Передаем данные вместе с именем филиала
-        json_to_excel(inventory, excel_file_path, chat_name)
+        # Передаем данные вместе с именем филиала; запись идёт вне цикла событий
+        try:
+            await export_inventory_async(inventory, excel_file_path, chat_name, file_format)
+        except Exception as e:
+            logger.error("Ошибка при экспорте инвентаризации для chat_id %s: %s", chat_id_str, e)
+            return None
+
+        logger.info("Инвентаризация сохранена в %s.", excel_file_path)
+        return excel_file_path
+
+    async def save_consolidated_report(self, mode='zip', max_workers=None):
+        """Сводный отчёт по всем филиалам, собранный параллельно в пуле процессов."""
+        branches = []
+        for chat_id_str, inventory in self.inventories.items():
+            # В inventory.json встречаются записи не по филиалам (ключ — категория)
+            if not inventory or not chat_id_str.lstrip('-').isdigit():
+                continue
+            chat_name = self.chat_manager.get_chat_name_by_id(int(chat_id_str)) or f"Chat_{chat_id_str}"
+            # Пул сериализует аргументы позже в своём потоке, пока обработчики меняют инвентарь:
+            # копия в цикле событий даёт согласованный снимок на момент запроса
+            branches.append((chat_name, copy_json_tree(inventory)))
+
+        if not branches:
+            logger.warning("Нет инвентаризаций филиалов для сводного отчёта.")
+            return None
 
-        logging.info(f"Инвентаризация сохранена в {excel_file_path}.")
+        current_date_str = datetime.now().strftime('%Y%m%d')
+        try:
+            return await build_consolidated_report(branches, f"output/consolidated_{current_date_str}", mode, max_workers)
+        except Exception as e:
+            logger.error("Ошибка при формировании сводного отчёта: %s", e)
+            return None
 
-    def load_existing_inventory(self):
-        logging.debug("Начало загрузки существующего инвентаря.")
-        inventory_file = self.mediator.get_inventory_file_path()
-        if os.path.exists(inventory_file):
-            try:
-                with open(inventory_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        inventories = json.loads(content)
-                        # Проверяйте уникальность chat_id
-                        if len(inventories) != len(set(inventories.keys())):
-                            logging.warning("Обнаружены дублирующиеся chat_id в данных.")
-                        logging.info("Инвентарь успешно загружен из файла.")
-                        return inventories
-            except json.JSONDecodeError as e:
-                logging.error(f"Ошибка декодирования JSON: {e}. Используем шаблон для инициализации инвентаря.")
-        else:
-            logging.info("Файл инвентаризации не найден. Используем шаблон.")
+    def branch_name(self, chat_id):
+        return self.chat_manager.get_chat_name_by_id(int(chat_id)) or f"Chat_{chat_id}"
+
+    def build_analytics(self):
+        """Сводная аналитика по всем филиалам (матрица филиал × позиция на текущий момент)."""
+        return InventoryAnalytics(self.get_catalog(), self.compact_branches())
 
-        return copy.deepcopy(self.inventory_template)
+    def get_template_signature(self):
+        try:
+            stat = os.stat(self.template_file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh_template(self):
+        """Перечитывает шаблон после изменения файла; индекс поиска и каталог строятся заново."""
+        signature = self.get_template_signature()
+        if signature is not None and signature != self._template_signature:
+            template = self.mediator.load_template(self.template_file_path)
+            if template:
+                logger.info("Шаблон инвентаризации изменился, индекс поиска и каталог будут перестроены.")
+                self.inventory_template = template
+                self._search_index = None
+                self._catalog = None
+            self._template_signature = signature
+
+    def get_search_index(self):
+        """Индекс поиска товаров; перестраивается только после изменения файла шаблона."""
+        self.refresh_template()
+        if self._search_index is None:
+            self._search_index = ItemSearchIndex(self.inventory_template)
+        return self._search_index
+
+    def get_catalog(self):
+        """Скомпилированный шаблон: позиция (категория, товар, тип) -> номер слота."""
+        self.refresh_template()
+        if self._catalog is None:
+            self._catalog = InventoryCatalog(self.inventory_template)
+        return self._catalog
+
+    def compact_branches(self):
+        """
+        Снимок инвентарей всех филиалов в массивах: chat_id -> CompactInventory.
+        Строится из словарей при каждом вызове (аналитика, архив) и дальше
+        с инвентарём не связан: рабочее состояние филиалов — только словари.
+        """
+        catalog = self.get_catalog()
+        return {
+            chat_id_str: catalog.compact(inventory)
+            for chat_id_str, inventory in self.inventories.items()
+            # В inventory.json встречаются записи не по филиалам (ключ — категория)
+            if inventory and chat_id_str.lstrip('-').isdigit()
+        }
+
+    def load_existing_inventory(self):
+        logger.debug("Начало загрузки существующего инвентаря.")
+        return self.storage.load_inventories(self.inventory_template)
 
     def get_inventory(self, chat_id):
         chat_id_str = str(chat_id)
         
         # Проверка на существование инвентаря, возвращаем шаблон для чтения, если нет данных
         if chat_id_str not in self.inventories:
-            return copy.deepcopy(self.inventory_template)
+            return self.get_catalog().new_inventory_dict()
 
-        return copy.deepcopy(self.inventories[chat_id_str])
+        return copy_json_tree(self.inventories[chat_id_str])
 
     def update_inventory(self, chat_id, category, item, item_type, quantity):
         chat_id_str = str(chat_id)
         
         # Убедимся, что инвентарь для chat_id загружен
-        self.set_current_inventory(chat_id)
+        inventory = self.get_branch_inventory(chat_id)
 
         # Проверка и обновление информации, если она действительно обновлена
-        if category in self.current_inventory and item in self.current_inventory[category]:
-            if item_type in self.current_inventory[category][item]:
-                self.current_inventory[category][item][item_type]['quantity'] = quantity
-                self.current_inventory[category][item][item_type]['filled'] = quantity > 0
-                logging.info(f"Обновлено: {category} -> {item} -> {item_type}: {quantity}")
-                # Если только одна группа, тогда надо записать изменения
-                if len(self.chat_ids) == 1:
-                    self.inventories[chat_id_str] = self.current_inventory
-                    self.save_inventory()
+        if category in inventory and item in inventory[category]:
+            if item_type in inventory[category][item]:
+                self.apply_quantity(chat_id_str, inventory, category, item, item_type, quantity)
+                logger.info("Обновлено: %s -> %s -> %s: %s", category, item, item_type, quantity)
             else:
-                logging.warning(f"Тип '{item_type}' не найден для '{item}' в категории '{category}'.")
+                logger.warning("Тип '%s' не найден для '%s' в категории '%s'.", item_type, item, category)
         else:
-            logging.warning(f"Категория '{category}' или товар '{item}' не найдены в инвентаре.")
+            logger.warning("Категория '%s' или товар '%s' не найдены в инвентаре.", category, item)
+
+    def apply_quantity(self, chat_id, inventory, category, item, item_type, quantity):
+        """Устанавливает количество опции, обновляет счётчики заполненности и журнал."""
+        option = inventory[category][item][item_type]
+        was_filled = option.get('filled', False)
+        option['quantity'] = quantity
+        option['filled'] = quantity is not None and quantity > 0
+        status = self.fill_status.get(str(chat_id))
+        if status is not None:
+            status.update(category, item, was_filled, option['filled'])
+        self.record_change(str(chat_id), category, item, item_type, quantity)
+        return option
+
+    def get_fill_status(self, chat_id):
+        """Счётчики заполненности филиала; None, если инвентаря филиала нет."""
+        chat_id_str = str(chat_id)
+        status = self.fill_status.get(chat_id_str)
+        if status is None:
+            inventory = self.inventories.get(chat_id_str)
+            if inventory is None:
+                return None
+            status = InventoryFillStatus(inventory)
+            self.fill_status[chat_id_str] = status
+        return status
+
+    def record_change(self, chat_id, category, item, item_type, quantity):
+        """Сохраняет одно изменение количества; полный снимок пишется только при уплотнении."""
+        self.storage.record_inventory_change(self.inventories, chat_id, category, item, item_type, quantity)
+        self.persistence.mark_dirty('inventory_changes')
+        if self.storage.needs_inventory_compaction():
+            self.save_inventory()
 
-        # Если несколько групп, сохраняем изменения только после апдейта
-        if len(self.chat_ids) > 1:
-            self.inventories[chat_id_str] = self.current_inventory
+    def compact_inventory(self):
+        """Уплотняет журнал в inventory.json и сохраняет накопленные предпочтения."""
+        if self.storage.has_pending_inventory_changes():
             self.save_inventory()
+        self.flush_preferences()
 
     def save_inventory(self):
-        logging.debug("Начало сохранения инвентаризации")
-        inventory_file = self.mediator.get_inventory_file_path()
-        with open(inventory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.inventories, f, ensure_ascii=False, indent=4)
-            logging.info("Инвентарь успешно сохранен в файл.")
+        self.persistence.mark_dirty('inventory')
+        logger.debug("Инвентарь помечен для сохранения.")
     
     def is_inventory_complete(self, chat_id):
         """Проверяет, завершена ли инвентаризация для указанного chat_id."""
-        self.set_current_inventory(chat_id)  # Убедитесь, что это делается перед проверкой
-        if not self.current_inventory:
-            logging.debug(f"Инвентарь для chat_id {chat_id} не найден.")
+        inventory = self.inventories.get(str(chat_id))
+        if not inventory:
+            logger.debug("Инвентарь для chat_id %s не найден.", chat_id)
             return False
 
-        complete = self.all_categories_filled()
-        logging.info(f"Инвентаризация для chat_id {chat_id} завершена: {complete}")
+        complete = self.all_categories_filled(self.get_fill_status(chat_id))
+        logger.debug("Инвентаризация для chat_id %s завершена: %s", chat_id, complete)
         return complete
     
+    async def archive_inventories(self, day=None):
+        """
+        Дописывает снимок всех филиалов за день в архив. Снимок в массивах
+        строится в цикле событий, запись идёт в отдельном потоке. Возвращает число филиалов.
+        """
+        if self.archive is None:
+            return 0
+        catalog = self.get_catalog()
+        branches = self.compact_branches()
+        day = day or datetime.now().date()
+        await asyncio.to_thread(self.archive.write_snapshot, day, catalog, branches)
+        logger.info("Снимок инвентаризации за %s сохранён в архив: %s филиалов.", day, len(branches))
+        return len(branches)
+
+    def inventory_history(self, chat_id, category, item, item_type, days=90):
+        """Количества позиции филиала из архива за последние days дней: [(дата, количество)]."""
+        if self.archive is None:
+            return []
+        return self.archive.history(str(chat_id), category, item, item_type, days)
+
     def clear_all_inventories(self):
         """Очистка инвентаризации для всех групп."""
         for group_id, group_inventory in self.inventories.items():
-            logging.info(f"Очистка инвентаризации для группы ID: {group_id}")
+            # В inventory.json встречаются записи не по филиалам (ключ — категория)
+            if not group_id.lstrip('-').isdigit():
+                continue
+            logger.info("Очистка инвентаризации для группы ID: %s", group_id)
             for category in group_inventory.values():
                 for item in category.values():
                     for item_type in item.values():
                         item_type['quantity'] = 0
                         item_type['filled'] = False
-        self.save_inventory_to_json(self.inventory_file)
-        logging.info("Инвентаризация сброшена для всех групп.")   
+        # Счётчики пересчитаются при следующем обращении
+        self.fill_status.clear()
+        self.keyboards.invalidate()
+        self.save_inventory()
+        logger.info("Инвентаризация сброшена для всех групп.")   
 
     def set_quantity(self, chat_id, category, item, quantity, item_type):
         # Проверьте, существует ли chat_id в self.inventories
-        if str(chat_id) not in self.inventories:
-            logging.error(f"Инвентарь для chat_id {chat_id} не найден.")
+        inventory = self.inventories.get(str(chat_id))
+        if inventory is None:
+            logger.error("Инвентарь для chat_id %s не найден.", chat_id)
             return
 
-        # Убедитесь, что self.current_inventory действительно существует и имеет нужные данные
-        if category in self.current_inventory and item in self.current_inventory[category]:
-            if item_type in self.current_inventory[category][item]:
-                self.current_inventory[category][item][item_type]['quantity'] = quantity
-                self.current_inventory[category][item][item_type]['filled'] = (quantity is not None and quantity > 0)
-                logging.info(f"Количество для '{item_type}' '{item}' в категории '{category}' установлено в {quantity}. Заполнено: {self.current_inventory[category][item][item_type]['filled']}")
+        if category in inventory and item in inventory[category]:
+            if item_type in inventory[category][item]:
+                option = self.apply_quantity(chat_id, inventory, category, item, item_type, quantity)
+                logger.info("Количество для '%s' '%s' в категории '%s' установлено в %s. Заполнено: %s", item_type, item, category, quantity, option['filled'])
             else:
-                logging.warning(f"Тип '{item_type}' не найден для '{item}' в категории '{category}'.")
+                logger.warning("Тип '%s' не найден для '%s' в категории '%s'.", item_type, item, category)
         else:
-            logging.warning(f"Категория '{category}' или товар '{item}' не найдены в инвентаре.")
-        self.inventories[str(chat_id)] = self.current_inventory
-        self.save_inventory()
+            logger.warning("Категория '%s' или товар '%s' не найдены в инвентаре.", category, item)
 
     def get_indicator(self, details):
         quantity = details.get('quantity')
         # Возвращать "✅" только если количество больше 0
         return " ✅" if quantity is not None and quantity > 0 else " ❌"
 
-    def get_category_indicator(self, category):
-        # Предполагаем, что current_inventory будет правильным объектом
-        category_filled = all(
-            all(opt.get('filled', False) for opt in item.values())
-            for item in self.current_inventory.get(category, {}).values()
-        )
-        return " ✅" if category_filled else " ❌"
+    def get_category_indicator(self, category, status):
+        return " ✅" if status.is_category_filled(category) else " ❌"
     
-    def any_item_unfilled(self, category):
-        logging.info(f"Проверка незаполненных товаров в категории '{category}'")
-        for item, options in self.current_inventory[category].items():
-            unfilled_options = [opt for opt, val in options.items() if val is None]
-            
-            if unfilled_options:
-                logging.info(f"Товар '{item}' имеет незаполненные опции: {unfilled_options}")
-                return True
-
-        logging.info(f"Все товары в категории '{category}' имеют заполненные опции.")
-        return False
+    def any_item_unfilled(self, category, status):
+        unfilled = status.unfilled_in_category(category)
+        logger.debug("Незаполненных опций в категории '%s': %s", category, unfilled)
+        return unfilled > 0
 
-    def all_items_filled(self, category):
+    def all_items_filled(self, category, status):
         """Проверяет, заполнены ли все элементы (товары) в категории."""
-        logging.info(f"Проверка заполненности всех товаров в категории '{category}'")
-        for item, options in self.current_inventory[category].items():
-            for option_name, option in options.items():
-                logging.debug(f"Проверка опции '{option_name}': "
-                            f"quantity={option['quantity']}, filled={option['filled']}")
-                if option['quantity'] is None or option['filled'] is False:
-                    logging.info(f"Товар '{item}' имеет незаполненные опции: {option_name}")
-                    return False
-        logging.info(f"Все товары в категории '{category}' полностью заполнены.")
-        return True
+        filled = status.is_category_filled(category)
+        logger.debug("Все товары в категории '%s' заполнены: %s", category, filled)
+        return filled
     
-    def all_categories_filled(self):
-        # Проверяем все категории в текущей инвентаризации
-        return all(self.all_items_filled(category) for category in self.current_inventory)
+    def all_categories_filled(self, status):
+        # Счётчик незаполненных категорий филиала
+        return status.is_complete()
+
+    def get_incomplete_items(self, category, inventory, status):
+        """Товары категории, у которых есть незаполненные опции."""
+        return {
+            item_name: details
+            for item_name, details in inventory.get(category, {}).items()
+            if not status.is_item_filled(category, item_name)
+        }
+
+    def category_keyboard(self, session):
+        """
+        Клавиатура категорий филиала с индикаторами заполненности, в порядке предпочтений
+        (из кэша по версиям счётчиков и порядка).
+        """
+        status = session.status
+        preferences = self.preferences
+
+        def build():
+            categories = preferences.category_order(session.chat_id, session.inventory.keys())
+            keyboard = [
+                [InlineKeyboardButton(category + self.get_category_indicator(category, status), callback_data=f'category_{category}')]
+                for category in categories
+            ]
+            keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
+            return InlineKeyboardMarkup(keyboard)
+
+        order_version = preferences.category_order_version(session.chat_id)
+        return self.keyboards.get(('categories', session.chat_id, status.version, order_version), build)
+
+    def items_keyboard(self, session, category):
+        """Клавиатура незаполненных товаров категории в порядке предпочтений (из кэша по версиям)."""
+        status = session.status
+        preferences = self.preferences
+
+        def build():
+            incomplete_items = self.get_incomplete_items(category, session.inventory, status)
+            ordered_items = preferences.item_order(session.chat_id, category, incomplete_items.keys())
+            keyboard = [
+                [InlineKeyboardButton(f"{item_name}{self.get_indicator(incomplete_items[item_name])}", callback_data=f"item_{item_name}")]
+                for item_name in ordered_items
+            ]
+            keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_categories")])
+            return InlineKeyboardMarkup(keyboard)
+
+        order_version = preferences.item_order_version(session.chat_id, category)
+        return self.keyboards.get(('items', session.chat_id, category, status.version, order_version), build)
 
     def set_inventory_status_complete(self):
         self.inventory_editable = False   
 
     def update_group_inventory(self, group_id, new_data):
         group_id_str = str(group_id)
-        logging.debug(f"Начало обновления инвентаризации для группы ID: {group_id_str}")
+        logger.debug("Начало обновления инвентаризации для группы ID: %s", group_id_str)
         if group_id_str in self.inventories:
-            logging.debug(f"Текущие данные для обновления: {json.dumps(new_data, indent=2)}")
+            # Полный дамп инвентаря филиала дорог: строим его, только если DEBUG включён для модуля
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Текущие данные для обновления: %s", json.dumps(new_data, indent=2))
             for key, value in new_data.items():
                 if key in self.inventories[group_id_str]:
                     self.inventories[group_id_str][key].update(value)
                 else:
                     self.inventories[group_id_str][key] = value
+            # Структура инвентаря могла измениться: счётчики пересчитаются при следующем обращении
+            self.fill_status.pop(group_id_str, None)
+            self.keyboards.invalidate('categories', group_id_str)
+            self.keyboards.invalidate('items', group_id_str)
                     
-            logging.info(f"Инвентаризация для группы ID: {group_id_str} обновлена.")
-            logging.debug(f"Инвентаризация для группы ID {group_id_str} после обновления: {json.dumps(self.inventories[group_id_str], indent=2)}")
+            logger.info("Инвентаризация для группы ID: %s обновлена.", group_id_str)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Инвентаризация для группы ID %s после обновления: %s",
+                             group_id_str, json.dumps(self.inventories[group_id_str], indent=2))
         else:
-            logging.warning(f"Группа ID: {group_id_str} не найдена.")
+            logger.warning("Группа ID: %s не найдена.", group_id_str)
 
-    def set_current_inventory(self, chat_id):
+    def get_branch_inventory(self, chat_id):
+        """Возвращает инвентарь филиала по ссылке, создавая его из шаблона при необходимости."""
         chat_id_str = str(chat_id)
-        
-        # Если текущий инвентарь уже установлен, и он для того же chat_id, ничего не делаем
-        if hasattr(self, 'current_chat_id') and self.current_chat_id == chat_id_str:
-            logging.debug(f"Инвентарь для chat_id: {chat_id_str} уже установлен. Используем существующий.")
-            return
-        
-        logging.debug(f"Установка текущего инвентаря для chat_id: {chat_id_str}")
-        
-        # Проверка существования инвентаря
-        existing_inventory = self.inventories.get(chat_id_str)
-        if existing_inventory:
-            self.current_inventory = existing_inventory  # Используется существующий инвентарь
-            logging.info(f"Инвентаризация для группы ID: {chat_id_str} загружена из существующего.")
+        inventory = self.inventories.get(chat_id_str)
+        if inventory is None:
+            logger.info("Для группы ID: %s не найдена старая инвентаризация. Используется шаблон.", chat_id_str)
+            inventory = self.get_catalog().new_inventory_dict()  # Создаем новый инвентарь из шаблона
+            self.inventories[chat_id_str] = inventory
+        return inventory
+
+    def open_session(self, user_id, chat_id):
+        """Открывает (или возвращает существующую) сессию пользователя для филиала."""
+        key = (user_id, str(chat_id))
+        inventory = self.get_branch_inventory(chat_id)
+        status = self.get_fill_status(chat_id)
+        session = self.sessions.get(key)
+        if session is None:
+            session = InventorySession(user_id, str(chat_id), inventory, status)
+            self.sessions[key] = session
+            logger.debug("Открыта сессия инвентаризации: пользователь %s, группа ID %s.", user_id, chat_id)
         else:
-            logging.info(f"Для группы ID: {chat_id_str} не найдена старая инвентаризация. Используется шаблон.")
-            self.current_inventory = copy.deepcopy(self.inventory_template)  # Создаем новый инвентарь
-            if len(self.chat_ids) > 1:  # Если больше одной группы, сохраняем настройки
-                self.inventories[chat_id_str] = self.current_inventory
-                logging.debug(f"Создан новый инвентарь для группы ID: {chat_id_str}")
+            session.inventory = inventory
+            session.status = status
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(key)
+        self.evict_sessions(session.last_used)
+        return session
+
+    def evict_sessions(self, now=None):
+        """Закрывает сессии, простаивающие дольше SESSION_IDLE_SECONDS, и самые старые сверх MAX_SESSIONS."""
+        now = time.monotonic() if now is None else now
+        sessions = self.sessions
+        while sessions:
+            key, oldest = next(iter(sessions.items()))
+            if len(sessions) <= self.MAX_SESSIONS and now - oldest.last_used <= self.SESSION_IDLE_SECONDS:
+                break
+            del sessions[key]
+
+    def close_session(self, user_id, chat_id):
+        self.sessions.pop((user_id, str(chat_id)), None)
 
-        self.current_chat_id = chat_id_str
+    def get_session(self, update: Update, context: CallbackContext):
+        """Сессия текущего пользователя для выбранного в диалоге филиала."""
+        chat_id = context.user_data.get('chat_id')
+        if chat_id is None:
+            return None
+        return self.open_session(update.effective_user.id, chat_id)
+
+    async def require_session(self, update: Update, context: CallbackContext):
+        session = self.get_session(update, context)
+        if session is None:
+            logger.error("Сессия инвентаризации пользователя %s не найдена.", update.effective_user.id)
+            message = "Сессия инвентаризации не найдена. Начните заново командой /start."
+            if update.callback_query:
+                await update.callback_query.message.reply_text(message)
+            elif update.message:
+                await update.message.reply_text(message)
+        return session
 
     def add_or_update_inventory(self, chat_id, category, item, item_type, quantity):
         chat_id_str = str(chat_id)
         
         # Проверка или текущий инвентарь уже существует, если да, то использовать его
         if chat_id_str not in self.inventories:
-            logging.info(f"Создание нового инвентаря для chat_id: {chat_id_str}.")
-            self.inventories[chat_id_str] = copy.deepcopy(self.inventory_template)
+            logger.info("Создание нового инвентаря для chat_id: %s.", chat_id_str)
+            self.inventories[chat_id_str] = self.get_catalog().new_inventory_dict()
         
         # Теперь обновляем уже существующий или только что созданный инвентарь
         current_inventory = self.inventories[chat_id_str]
         
         if category in current_inventory and item in current_inventory[category]:
             if item_type in current_inventory[category][item]:
-                current_inventory[category][item][item_type]['quantity'] = quantity
-                current_inventory[category][item][item_type]['filled'] = quantity > 0
-                logging.info(f"Количество для '{item}' в категории '{category}' обновлено. "
-                            f"Тип: {item_type}, Количество: {quantity}.")
+                # Обновляем количество, счётчики заполненности и журнал
+                self.apply_quantity(chat_id_str, current_inventory, category, item, item_type, quantity)
+                logger.info("Количество для '%s' в категории '%s' обновлено. Тип: %s, Количество: %s.",
+                            item, category, item_type, quantity)
             else:
-                logging.warning(f"Тип '{item_type}' не найден для '{item}' в категории '{category}'.")
+                logger.warning("Тип '%s' не найден для '%s' в категории '%s'.", item_type, item, category)
         else:
-            logging.warning(f"Категория '{category}' или товар '{item}' не найдены в инвентаре.")
-        
-        # Сохраняем обновленный инвентарь
-        self.save_inventory()
+            logger.warning("Категория '%s' или товар '%s' не найдены в инвентаре.", category, item)
 
     async def reset_conversation(self, update: Update, context: CallbackContext) -> int:
-        # Завершаем текущий разговор
+        # Завершаем текущий разговор и сессию инвентаризации
+        chat_id = context.user_data.get('chat_id')
+        if chat_id is not None:
+            self.close_session(update.effective_user.id, chat_id)
         await update.message.reply_text("Перезапуск... Возвращение в главное меню.")
     # Возвращаем состояние END для завершения текущего сеанса
         return ConversationHandler.END
@@ -339,11 +577,11 @@ class InventoryManager:
         query = update.callback_query
         selected_chat_id = int(query.data.split('_')[-1])
         context.user_data['chat_id'] = selected_chat_id
-        logging.info("Доступ отработал")
+        logger.info("Доступ отработал")
 
         if not await self.access_control.has_access(update):
             message = "У вас нет прав на выполнение инвентаризации в этой группе."
-            logging.warning(f"User {update.effective_user.id} не имеет доступа в чате {selected_chat_id}.")
+            logger.warning("User %s не имеет доступа в чате %s.", update.effective_user.id, selected_chat_id)
             # Отправка сообщения с кнопкой
             inline_keyboard = [[InlineKeyboardButton("Главное меню", callback_data='back_to_menu')]]
             markup = InlineKeyboardMarkup(inline_keyboard)
@@ -351,10 +589,10 @@ class InventoryManager:
             return RETURN_MENU
 
         chat_name = self.chat_manager.get_chat_name_by_id(selected_chat_id)
-        logging.info(f"Пользователь выбрал чат: {chat_name} ({selected_chat_id})")
+        logger.info("Пользователь выбрал чат: %s (%s)", chat_name, selected_chat_id)
 
-        # Обязательно загружаем текущую инвентаризацию
-        self.set_current_inventory(selected_chat_id)
+        # Открываем сессию пользователя для выбранного филиала
+        session = self.open_session(update.effective_user.id, selected_chat_id)
 
         # Проверка завершенности инвентаризации еще раз после установки
         if self.is_inventory_complete(selected_chat_id):
@@ -380,29 +618,24 @@ class InventoryManager:
         start_message = f"Инвентаризация началась для {chat_name}."
         await query.edit_message_text(start_message)
 
-        current_inventory = self.current_inventory
+        current_inventory = session.inventory
 
         if not current_inventory:
             await self.send_message(update, "Нет доступных категорий для выбранного чата.")
-            logging.warning("Текущая инвентаризация пуста. Возможно, проблема с загрузкой данных.")
+            logger.warning("Текущая инвентаризация пуста. Возможно, проблема с загрузкой данных.")
             return RETURN_MENU
 
-        keyboard = [
-            [InlineKeyboardButton(category + self.get_category_indicator(category), callback_data=f'category_{category}')]
-            for category in current_inventory.keys()
-        ]
-        keyboard.append([InlineKeyboardButton("Назад", callback_data='back_to_menu')])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.category_keyboard(session)
 
         await self.send_message(update, "Выберите категорию:", reply_markup=reply_markup)
         return CHOOSING_CATEGORY
     
     async def handle_inventory(self, update: Update, context: CallbackContext) -> int:
         user_id = update.effective_user.id
-        logging.info(f"Начата операция handle_inventory с user_id: {user_id}")
+        logger.info("Начата операция handle_inventory с user_id: %s", user_id)
 
         potential_chat_ids = self.chat_manager.get_chats_for_user(user_id)
-        logging.info(f"Чаты для user_id {user_id}: {potential_chat_ids}")
+        logger.info("Чаты для user_id %s: %s", user_id, potential_chat_ids)
 
         if not potential_chat_ids:
             message = "Мы не смогли определить, в каком чате вы находитесь или у вас нет прав на инвентаризацию."
@@ -421,30 +654,23 @@ class InventoryManager:
         chat_id = str(potential_chat_ids[0])
         context.user_data['chat_id'] = chat_id
 
-        # Проверка и инициализация инвентаря
-        if chat_id not in self.inventories:
-            logging.info(f"Чат ID {chat_id} не найден в инвентаре. Инициализация нового инвентаря.")
-            self.inventories[chat_id] = copy.deepcopy(self.inventory_template)
-
-        sorted_inventory = self.sort_inventory_preferences(chat_id)
-        self.set_current_inventory(chat_id, sorted_inventory)
-
         if not await self.access_control.has_access(update):
-            logging.info(f"User {user_id} не имеет доступа в чате {chat_id}.")
+            logger.info("User %s не имеет доступа в чате %s.", user_id, chat_id)
             message = "У вас нет прав на выполнение инвентаризации в этом чате."
             try:
                 await update.effective_message.reply_text(message)
-                logging.info("Сообщение об отсутствии доступа успешно отправлено.")
+                logger.info("Сообщение об отсутствии доступа успешно отправлено.")
             except Exception as e:
-                logging.error(f"Ошибка при отправке сообщения: {e}")
+                logger.error("Ошибка при отправке сообщения: %s", e)
             return ConversationHandler.END
 
-        self.set_current_inventory(chat_id)
+        # Сессия ссылается на инвентарь филиала (создаётся из шаблона при необходимости)
+        session = self.open_session(user_id, chat_id)
         chat_name = self.chat_manager.get_chat_name_by_id(int(chat_id)) or f"Chat_{chat_id}"
 
         # Проверка статуса инвентаризации
         if self.is_inventory_complete(chat_id):
-            logging.info(f"Инвентаризация завершена для чата {chat_name}.")
+            logger.info("Инвентаризация завершена для чата %s.", chat_name)
             current_date = datetime.now()
             next_inventory_date = current_date + timedelta(weeks=1)
             next_inventory_date_str = next_inventory_date.strftime('%A %d.%m.%Y')
@@ -468,14 +694,8 @@ class InventoryManager:
 
             return RETURN_MENU
 
-        logging.info(f"Инвентаризация не завершена для {chat_name}. Переход к выбору категории.")
-        current_inventory = self.current_inventory
-        keyboard = [
-            [InlineKeyboardButton(category + self.get_category_indicator(category), callback_data=f'category_{category}')]
-            for category in current_inventory.keys()
-        ]
-        keyboard.append([InlineKeyboardButton("Назад", callback_data='back_to_menu')])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        logger.info("Инвентаризация не завершена для %s. Переход к выбору категории.", chat_name)
+        reply_markup = self.category_keyboard(session)
 
         await self.send_message(update, "Выберите категорию:", reply_markup=reply_markup)
         return CHOOSING_CATEGORY
@@ -490,90 +710,79 @@ class InventoryManager:
             await query.edit_message_text(message, reply_markup=reply_markup)  
     
     async def return_to_categories(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Возврат к категориям вызван.")
+        logger.info("Возврат к категориям вызван.")
         query = update.callback_query
         await query.answer()
 
-        keyboard = [
-            [InlineKeyboardButton(category + self.get_category_indicator(category), callback_data=f'category_{category}')]
-            for category in self.current_inventory.keys()
-        ]
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
 
-        keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.category_keyboard(session)
 
         try:
             await query.edit_message_text("Выберите категорию:", reply_markup=reply_markup)
         except BadRequest as e:
-            logging.error(f"Ошибка при редактировании сообщения на выбор категории: {e}")
+            logger.error("Ошибка при редактировании сообщения на выбор категории: %s", e)
             await query.message.reply_text("Возникла ошибка. Попробуйте снова выбрать категорию.", reply_markup=reply_markup)
 
         return CHOOSING_CATEGORY
 
     async def choose_category(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция choose_category вызвана.")
+        logger.debug("Функция choose_category вызвана.")
         query = update.callback_query
         await query.answer()
         category = query.data.replace("category_", "")
         context.user_data['chosen_category'] = category
 
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
+
         # Обновление предпочтений для выбранной категории
         chat_id = context.user_data.get('chat_id')
         self.update_preferences(chat_id, category=category)
 
-        if self.all_items_filled(category):
-            logging.info(f"Все товары в категории '{category}' заполнены. Сообщаем пользователю.")
+        if self.all_items_filled(category, session.status):
+            logger.info("Все товары в категории '%s' заполнены. Сообщаем пользователю.", category)
             await query.edit_message_text(f"В категории '{category}' все товары заполнены.")
 
-            if self.all_categories_filled():
-                logging.info("Все категории заполнены. Возвращаемся в главное меню.")
+            if self.all_categories_filled(session.status):
+                logger.info("Все категории заполнены. Возвращаемся в главное меню.")
                 await query.message.reply_text("Все категории заполнены. Возвращаемся в главное меню.")
-                logging.info("RETURN_MENU запустился")
+                logger.info("RETURN_MENU запустился")
                 return RETURN_MENU
             
-            keyboard = [
-                [InlineKeyboardButton(category + self.get_category_indicator(category), callback_data=f'category_{category}')]
-                for category in self.current_inventory.keys()
-            ]
-            keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.category_keyboard(session)
             await query.message.reply_text("Выберите категорию:", reply_markup=reply_markup)
 
             return CHOOSING_CATEGORY
 
-        items = self.current_inventory[category]
-        incomplete_items = {
-            item_name: details
-            for item_name, details in items.items()
-            if not all(detail['filled'] for detail in details.values())
-        }
+        reply_markup = self.items_keyboard(session, category)
 
-        keyboard = [
-            [InlineKeyboardButton(f"{item_name}{self.get_indicator(details)}", callback_data=f"item_{item_name}")]
-            for item_name, details in incomplete_items.items()
-        ]
-
-        keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_categories")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        logging.debug("Переход к выбору товара.")
+        logger.debug("Переход к выбору товара.")
         await query.edit_message_text(f"Вы выбрали категорию: {category}. Теперь выберите товар.", reply_markup=reply_markup)
         return CHOOSING_ITEM
     
     async def choose_item(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция choose_item вызвана.")
+        logger.debug("Функция choose_item вызвана.")
         query = update.callback_query
         if not query:
-            logging.error("Отсутствует callback_query в update, невозможно продолжить.")
+            logger.error("Отсутствует callback_query в update, невозможно продолжить.")
             return CHOOSING_CATEGORY
 
         item = query.data.split('item_')[1]
         context.user_data['chosen_item'] = item
         category = context.user_data['chosen_category']
 
-        logging.debug(f"Выбранный товар: {item}")
+        logger.debug("Выбранный товар: %s", item)
+
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
 
-        current_item = self.current_inventory.get(category, {}).get(item, {})
+        self.update_preferences(session.chat_id, category=category, item=item)
+        current_item = session.inventory.get(category, {}).get(item, {})
 
         if category in ["Напитки", "Контейнеры и приборы"]:
             # Только кнопка для "Сырьё"
@@ -599,27 +808,18 @@ class InventoryManager:
         return CHOOSING_ITEM_TYPE
     
     async def return_to_items(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Возврат к списку товаров вызван.")
+        logger.info("Возврат к списку товаров вызван.")
         query = update.callback_query
         await query.answer()
 
-        category = context.user_data.get('chosen_category')
-        items = self.inventories.get(category, {})
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
 
-        # Фильтруем только те товары, которые не заполнены
-        incomplete_items = {
-            item_name: details
-            for item_name, details in items.items()
-            if not all(detail['filled'] for detail in details.values())
-        }
+        category = context.user_data.get('chosen_category')
 
-        keyboard = [
-            [InlineKeyboardButton(f"{item_name}{self.get_indicator(details)}", callback_data=f"item_{item_name}")]
-            for item_name, details in incomplete_items.items()
-        ]
-
-        keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_categories")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Только товары, которые не заполнены
+        reply_markup = self.items_keyboard(session, category)
 
         await query.edit_message_text(
             f"Вы выбрали категорию: {category}. Теперь выберите товар.",
@@ -629,10 +829,10 @@ class InventoryManager:
         return CHOOSING_ITEM
 
     async def enter_quantity(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция enter_quantity вызвана.")
+        logger.debug("Функция enter_quantity вызвана.")
         chat_id = context.user_data.get('chat_id') 
         if self.is_inventory_complete(chat_id):
-            logging.info("Инвентаризация уже завершена. Перенаправляем в главное меню.")
+            logger.info("Инвентаризация уже завершена. Перенаправляем в главное меню.")
             query = update.callback_query
             if query:
                 await query.answer()
@@ -661,16 +861,14 @@ class InventoryManager:
                 await update.message.reply_text("Ошибка: Недостаточно данных для продолжения. Пожалуйста, начните заново.")
                 return RETURN_MENU
 
-            logging.info(
-                f"Устанавливается количество: категория='{category}', товар='{item}', тип='{item_type}', количество={quantity}."
+            logger.debug(
+                "Устанавливается количество: категория='%s', товар='%s', тип='%s', количество=%s.",
+                category, item, item_type, quantity
             )
 
             # Установка количества в инвентаре и обновление статуса заполненности для данного типа
             self.set_quantity(chat_id, category, item, quantity, item_type)
 
-            # Сохранение инвентаря сразу после обновления количества
-            self.save_inventory()
-
         elif update.callback_query:
             query = update.callback_query
             await query.answer()
@@ -685,44 +883,41 @@ class InventoryManager:
 
         # Проверка: заполнены ли все опции для товара
         if update.message:
-            current_item = self.current_inventory[category][item]
-            all_filled = all(opt['quantity'] is not None and opt['quantity'] > 0 for opt in current_item.values())
+            session = await self.require_session(update, context)
+            if session is None:
+                return ConversationHandler.END
+            inventory = session.inventory
+
+            current_item = inventory[category][item]
+            all_filled = session.status.is_item_filled(category, item)
 
             if all_filled:
-                logging.info(f"Все опции для '{item}' заполнены.")
+                logger.info("Все опции для '%s' заполнены.", item)
 
             # Проверка: заполнены ли все категории
-            if self.all_categories_filled():
-                logging.info("Все категории заполнены. Завершаем диалог и возвращаемся в главное меню.")
+            if self.all_categories_filled(session.status):
+                logger.info("Все категории заполнены. Завершаем диалог и возвращаемся в главное меню.")
                 inline_keyboard = [
                     [InlineKeyboardButton("Главное меню", callback_data='back_to_menu')],
                     [InlineKeyboardButton("Редактировать инвентаризацию", callback_data='edit_inventory')]
                 ]
                 markup = InlineKeyboardMarkup(inline_keyboard)
-                self.save_inventory_to_excel(chat_id)
+                await self.save_inventory_to_excel(chat_id)
                 await update.message.reply_text(
                     "Инвентаризация окончена. Вы можете редактировать данные инвентаризации до 7:00 утра, затем данные будут отправлены в бухгалтерию.",
                     reply_markup=markup
                 )
                 
-                logging.info("RETURN_MENU запустился")
+                logger.info("RETURN_MENU запустился")
                 return RETURN_MENU
 
             # Проверка: заполнены ли все товары в категории
-            all_items_filled = all(
-                all(opt['filled'] for opt in details.values())
-                for details in self.current_inventory[category].values()
-            )
+            all_items_filled = session.status.is_category_filled(category)
 
             if all_items_filled:
-                logging.info(f"Все товары в категории '{category}' заполнены. Возвращаемся к выбору категорий.")
+                logger.info("Все товары в категории '%s' заполнены. Возвращаемся к выбору категорий.", category)
 
-                keyboard = [
-                    [InlineKeyboardButton(category_name + self.get_category_indicator(category_name), callback_data=f'category_{category_name}')]
-                    for category_name in self.current_inventory.keys()
-                ]
-                keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self.category_keyboard(session)
 
                 await update.message.reply_text("Выберите категорию:", reply_markup=reply_markup)
                 return CHOOSING_CATEGORY
@@ -730,19 +925,7 @@ class InventoryManager:
             elif all_filled:
                 await update.message.reply_text("Все опции заполнены. Возвращаемся к выбору товаров.")
 
-                items = self.current_inventory[category]
-                incomplete_items = {
-                    item_name: details
-                    for item_name, details in items.items()
-                    if not all(detail['filled'] for detail in details.values())
-                }
-                
-                keyboard = [
-                    [InlineKeyboardButton(f"{item_name}{self.get_indicator(details)}", callback_data=f"item_{item_name}")]
-                    for item_name, details in incomplete_items.items()
-                ]
-                keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_categories")])
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self.items_keyboard(session, category)
 
                 await update.message.reply_text(f"Вы выбрали категорию: {category}. Теперь выберите товар.", reply_markup=reply_markup)
                 return CHOOSING_ITEM
@@ -762,11 +945,11 @@ class InventoryManager:
             return CHOOSING_ITEM_TYPE
    
     async def choose_item_type(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция choose_item_type вызвана.")
+        logger.debug("Функция choose_item_type вызвана.")
         query = update.callback_query
 
         if not query or not query.data:
-            logging.info("Отсутствуют данные в callback_query.")
+            logger.info("Отсутствуют данные в callback_query.")
             await query.answer("Ошибка во входной точке. Попробуйте снова.", show_alert=True)
             return CHOOSING_ITEM
 
@@ -786,8 +969,12 @@ class InventoryManager:
         context.user_data['chosen_item_type'] = item_type
         context.user_data['chosen_item'] = item
 
-        if not category or item not in self.current_inventory.get(category, {}):
-            logging.warning("Некорректная категория или товар.")
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
+
+        if not category or item not in session.inventory.get(category, {}):
+            logger.warning("Некорректная категория или товар.")
             await query.answer("Ошибка в выборе товара. Пожалуйста, выберите снова.", show_alert=True)
             return CHOOSING_CATEGORY
 
@@ -801,45 +988,42 @@ class InventoryManager:
     async def item_navigation(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         callback_data = query.data
-        logging.debug(f"item_navigation вызвана с данными: {callback_data}")
+        logger.debug("item_navigation вызвана с данными: %s", callback_data)
 
         if callback_data == 'back_to_categories':
-            logging.info("Возврат к категориям.")
+            logger.info("Возврат к категориям.")
             return await self.return_to_categories(update, context)
        
         elif callback_data == 'edit_inventory':
-            logging.info("Возврат к списку товаров.")
+            logger.info("Возврат к списку товаров.")
             return await self.edit_inventory(update, context)
 
         elif callback_data == 'back_to_items':
-            logging.info("Возврат к списку товаров.")
+            logger.info("Возврат к списку товаров.")
             return await self.return_to_items(update, context)
         
         elif callback_data == 'back_to_select_edit_items':
-            logging.info("Возврат к списку товаров.")
+            logger.info("Возврат к списку товаров.")
             return await self.search_item(update, context)
         
         elif callback_data == 'back_to_menu':
-            logging.info("Возврат в главное меню вызван.")
+            logger.info("Возврат в главное меню вызван.")
             query = update.callback_query
-            keyboard = [
-                [InlineKeyboardButton("Добавить событие", callback_data='add_event')],
-                [InlineKeyboardButton("Показать события", callback_data='show_events')],
-                [InlineKeyboardButton("Инвентаризация", callback_data='inventory')],
-                [InlineKeyboardButton("Помощь", callback_data='help')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = MAIN_MENU
             try:
                 await query.edit_message_text(text='Выберите действие:', reply_markup=reply_markup)
             except BadRequest as e:
-                logging.error(f"Ошибка при редактировании сообщения: {e}")
+                logger.error("Ошибка при редактировании сообщения: %s", e)
                 await query.message.reply_text('Выберите действие:', reply_markup=reply_markup)
-            logging.info("Диалог завершен")  
+            chat_id = context.user_data.get('chat_id')
+            if chat_id is not None:
+                self.close_session(update.effective_user.id, chat_id)
+            logger.info("Диалог завершен")  
             return ConversationHandler.END
 
 
     async def edit_inventory(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Запрос на редактирование товара.")
+        logger.info("Запрос на редактирование товара.")
         await update.callback_query.answer()
 
         keyboard = [
@@ -854,7 +1038,7 @@ class InventoryManager:
         return EDITING_ITEM
 
     async def search_item(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция search_item вызвана.")
+        logger.debug("Функция search_item вызвана.")
 
         # Проверка источника запроса
         if update.callback_query:
@@ -862,7 +1046,7 @@ class InventoryManager:
 
             # Если это запрос возврата, выполняем логику возврата
             if update.callback_query.data == 'back_to_select_edit_items':
-                logging.info("Возвращаемся к списку товаров.")
+                logger.info("Возвращаемся к списку товаров.")
 
                 # Отображаем предыдущую клавиатуру с найденными товарами
                 reply_markup = InlineKeyboardMarkup([
@@ -881,23 +1065,24 @@ class InventoryManager:
             item_name = update.message.text.strip().lower()
             response_method = update.message.reply_text
         else:
-            logging.error("Ошибка: ни update.message, ни update.callback_query не обнаружены.")
+            logger.error("Ошибка: ни update.message, ни update.callback_query не обнаружены.")
             return EDITING_ITEM
 
-        # Поиск товара
-        found_items = []
-        for category, items in self.current_inventory.items():
-            for item in items.keys():
-                item_key = item.lower()
-                similarity = fuzz.partial_ratio(item_name, item_key)
-                if similarity > 60:
-                    found_items.append(item)
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
+
+        # Поиск товара по индексу шаблона (только товары, которые есть в инвентаре филиала)
+        found_items = [
+            item for category, item in self.get_search_index().search(item_name)
+            if item in session.inventory.get(category, {})
+        ]
 
         if not found_items:
             await response_method("Товар не найден, попробуйте снова или введите корректное название.")
             return EDITING_ITEM
 
-        logging.info(f"Список найденных элементов: {found_items}")
+        logger.info("Список найденных элементов: %s", found_items)
 
         # Сохраняем найденные товары, чтобы использовать в случае возврата
         context.user_data['last_found_items'] = found_items
@@ -910,35 +1095,44 @@ class InventoryManager:
         keyboard.append([InlineKeyboardButton("Назад", callback_data='edit_inventory')])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await response_method("Выберите товар для редактирования:", reply_markup=reply_markup)
+        text = "Выберите товар для редактирования:"
+        if len(found_items) >= SEARCH_RESULTS_LIMIT:
+            text = "Показаны самые похожие товары, уточните название, если нужного нет.\n" + text
+        await response_method(text, reply_markup=reply_markup)
         return EDITING_SELECTION
    
     async def edit_item(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция edit_item вызвана.")
+        logger.debug("Функция edit_item вызвана.")
         query = update.callback_query
         await query.answer()
 
         if not query or not query.data:
-            logging.info("Отсутствуют данные в callback_query.")
+            logger.info("Отсутствуют данные в callback_query.")
             return EDITING_ITEM
 
 
         item = query.data[len('edit_item_'):]  # Вырезка только имени товара
         context.user_data['chosen_item'] = item
 
-        logging.debug(f"Редактирование товара: {item}")
+        logger.debug("Редактирование товара: %s", item)
 
-        category = None
-        for cat, items in self.current_inventory.items():
-            if item in items:
-                category = cat
-                break
+        session = await self.require_session(update, context)
+        if session is None:
+            return ConversationHandler.END
+
+        category = self.get_search_index().categories_by_item.get(item)
+        if item not in session.inventory.get(category, {}):
+            category = None
+            for cat, items in session.inventory.items():
+                if item in items:
+                    category = cat
+                    break
 
         if category is None:
-            logging.error(f"Товар '{item}' не найден в инвентаре.")
+            logger.error("Товар '%s' не найден в инвентаре.", item)
             return EDITING_ITEM
         context.user_data['chosen_category'] = category
-        current_item = self.current_inventory[category][item]
+        current_item = session.inventory[category][item]
 
         raw_filled = current_item['raw']['quantity'] is not None and current_item['raw']['quantity'] > 0
         semi_filled = current_item['semi']['quantity'] is not None and current_item['semi']['quantity'] > 0
@@ -955,7 +1149,7 @@ class InventoryManager:
         return CHOOSING_ITEM_TYPE
     
     async def enter_quantity_for_edit(self, update: Update, context: CallbackContext) -> int:
-        logging.info("Функция enter_quantity_for_edit вызвана.")
+        logger.debug("Функция enter_quantity_for_edit вызвана.")
         if update.message:
             quantity_text = update.message.text.strip()
             
@@ -973,14 +1167,14 @@ class InventoryManager:
                 await update.message.reply_text("Ошибка: Недостаточно данных для продолжения. Пожалуйста, начните заново.")
                 return RETURN_MENU
 
-            logging.info(
-                f"Обновление количества: категория='{category}', товар='{item}', тип='{item_type}', количество={quantity}."
+            logger.info(
+                "Обновление количества: категория='%s', товар='%s', тип='%s', количество=%s.",
+                category, item, item_type, quantity
             )
 
             # Обновляем количество
             self.set_quantity(chat_id, category, item, quantity, item_type)
-            self.save_inventory()\
-            
+
             if context.user_data.get('edit_mode'):
                 context.user_data['edit_mode'] = False    
 
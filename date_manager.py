@@ -1,24 +1,25 @@
 import json
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font
+import asyncio
+import csv
+import functools
 import os
 from datetime import datetime
-from utils.mediator import Mediator
 import logging
 
-import json
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font
-import os
-from datetime import datetime
-from utils.mediator import Mediator
-import logging
+logger = logging.getLogger(__name__)
+
+# openpyxl (вместе с numpy) импортируется в функциях записи xlsx: его загрузка
+# занимает около секунды и не нужна для запуска бота
+
+EXPORT_HEADERS = ["Категория", "Товар", "Кол-во сырья", "Кол-во пол-ф-ов"]
+EXPORT_COLUMN_WIDTHS = {"A": 34, "B": 27, "C": 14, "D": 15}
 
 def json_to_excel(inventory_data, excel_file_path, branch_name):
     # Логируем имя филиала
-    logging.info(f"Получено имя филиала: {branch_name}")
+    logger.info("Получено имя филиала: %s", branch_name)
+
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Font
 
     # Создаем новый Excel файл
     workbook = Workbook()
@@ -62,21 +63,111 @@ def json_to_excel(inventory_data, excel_file_path, branch_name):
         sheet[f"{col}8"].alignment = Alignment(horizontal="center")
 
     row = 9  # Начинаем с 9-ой строки для товаров
+    for category, item, raw_quantity, semi_quantity in iter_inventory_rows(inventory_data):
+        sheet[f"A{row}"] = category
+        sheet[f"B{row}"] = item
+        sheet[f"C{row}"] = raw_quantity
+        sheet[f"D{row}"] = semi_quantity
+        row += 1
+
+    # Сохраняем файл
+    workbook.save(excel_file_path)
+    logger.info("Данные успешно сохранены в %s", excel_file_path)
+
+
+def iter_inventory_rows(inventory_data):
+    """Строки отчёта (категория, товар, сырьё, полуфабрикаты) для заполненных товаров."""
     for category, items in inventory_data.items():
         for item, details in items.items():
             raw_quantity = details.get('raw', {}).get('quantity', 0)
             semi_quantity = details.get('semi', {}).get('quantity', 0)
 
             if (raw_quantity is not None and raw_quantity > 0) or (semi_quantity is not None and semi_quantity > 0):
-                sheet[f"A{row}"] = category
-                sheet[f"B{row}"] = item
-                sheet[f"C{row}"] = raw_quantity
-                sheet[f"D{row}"] = semi_quantity
-                row += 1
+                yield category, item, raw_quantity, semi_quantity
+
+
+def rows_to_excel_streaming(rows, excel_file_path, branch_name):
+    """
+    Потоковая запись отчёта через write-only лист openpyxl.
+
+    Строки сразу уходят во временный файл, поэтому память не растёт вместе
+    с числом товаров. Write-only лист не поддерживает объединение ячеек,
+    в остальном оформление совпадает с json_to_excel.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for column, width in EXPORT_COLUMN_WIDTHS.items():
+        sheet.column_dimensions[column].width = width
+
+    def styled(value, **style):
+        cell = WriteOnlyCell(sheet, value=value)
+        for name, attr in style.items():
+            setattr(cell, name, attr)
+        return cell
+
+    now = datetime.now()
+    sheet.append([styled("Инвентаризация продуктов", font=Font(bold=True), alignment=Alignment(horizontal="center"))])
+    sheet.append([f"Филиал: {branch_name}"])
+    sheet.append([styled(f"Дата: {now.strftime('%Y-%m-%d')}", font=Font(italic=True))])
+    sheet.append([styled(f"Время: {now.strftime('%H:%M:%S')}", font=Font(italic=True))])
+    for _ in range(3):
+        sheet.append([])
+    sheet.append([styled(header, alignment=Alignment(horizontal="center")) for header in EXPORT_HEADERS])
+
+    row_count = 0
+    for row in rows:
+        sheet.append(row)
+        row_count += 1
 
-    # Сохраняем файл
     workbook.save(excel_file_path)
-    logging.info(f"Данные успешно сохранены в {excel_file_path}")
+    logger.info("Данные успешно сохранены в %s (потоковая запись, строк: %s)", excel_file_path, row_count)
+
+
+def rows_to_csv(rows, csv_file_path, branch_name):
+    """Быстрый экспорт в CSV (разделитель «;», UTF-8 с BOM — открывается в Excel)."""
+    row_count = 0
+    with open(csv_file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(EXPORT_HEADERS)
+        for row in rows:
+            writer.writerow(row)
+            row_count += 1
+    logger.info("Данные филиала %s сохранены в %s (CSV, строк: %s)", branch_name, csv_file_path, row_count)
+
+
+EXPORT_WRITERS = {
+    'xlsx': rows_to_excel_streaming,
+    'csv': rows_to_csv,
+}
+
+
+def export_inventory(inventory_data, file_path, branch_name, file_format='xlsx'):
+    """Синхронный экспорт инвентаря филиала в xlsx (потоково) или csv."""
+    writer = EXPORT_WRITERS.get(file_format)
+    if writer is None:
+        raise ValueError(f"Неизвестный формат экспорта: {file_format}")
+    writer(iter_inventory_rows(inventory_data), file_path, branch_name)
+    return file_path
+
+
+async def export_inventory_async(inventory_data, file_path, branch_name, file_format='xlsx', executor=None):
+    """
+    Экспорт в пуле потоков, не блокирующий цикл событий.
+
+    Снимок строк берётся в цикле событий: обработчики продолжают менять
+    инвентарь, пока файл пишется в другом потоке.
+    """
+    writer = EXPORT_WRITERS.get(file_format)
+    if writer is None:
+        raise ValueError(f"Неизвестный формат экспорта: {file_format}")
+    rows = list(iter_inventory_rows(inventory_data))
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, functools.partial(writer, rows, file_path, branch_name))
+    return file_path
 
 
 
@@ -93,22 +184,22 @@ def load_inventory_data(inventory_file_path, template_file_path):
             with open(inventory_file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if data:  # Проверка, пустой или нет
-                    logging.info(f"Данные загружены из {inventory_file_path}.")
+                    logger.info("Данные загружены из %s.", inventory_file_path)
                     return data
                 else:
-                    logging.info(f"Файл {inventory_file_path} пуст.")
+                    logger.info("Файл %s пуст.", inventory_file_path)
         else:
-            logging.info(f"Файл {inventory_file_path} не найден.")
+            logger.info("Файл %s не найден.", inventory_file_path)
 
         # Если основной JSON пустой или отсутствует, загружаем шаблон
         with open(template_file_path, 'r', encoding='utf-8') as template_file:
             data = json.load(template_file)
-            logging.info(f"Данные загружены из {template_file_path}.")
+            logger.info("Данные загружены из %s.", template_file_path)
 
     except json.JSONDecodeError:
-        logging.error("Ошибка в формате JSON.")
+        logger.error("Ошибка в формате JSON.")
     except IOError as e:
-        logging.error(f"Ошибка при работе с файлами: {e}")
+        logger.error("Ошибка при работе с файлами: %s", e)
 
     return data
 
@@ -117,42 +208,45 @@ def load_template(template_file_path):
     try:
         with open(template_file_path, 'r', encoding='utf-8') as template_file:
             data = json.load(template_file)
-            logging.info(f"Шаблон инвентаризации загружен из {template_file_path}.")
+            logger.info("Шаблон инвентаризации загружен из %s.", template_file_path)
             return data
     except (json.JSONDecodeError, IOError) as e:
-        logging.error(f"Ошибка при загрузке шаблона инвентаризации: {e}")
+        logger.error("Ошибка при загрузке шаблона инвентаризации: %s", e)
         return {}
 
 def save_inventory_to_json(self, inventory_file):
     try:
         with open(inventory_file, 'w', encoding='utf-8') as f:
             json.dump(self.inventories, f, ensure_ascii=False, indent=4)
-        logging.info("Инвентаризация успешно сохранена в файл.")
+        logger.info("Инвентаризация успешно сохранена в файл.")
     except Exception as e:
-        logging.error(f"Ошибка при сохранении инвентаризации: {e}")
+        logger.error("Ошибка при сохранении инвентаризации: %s", e)
+
 
+# Пример использования (только при запуске модуля напрямую: импорт не должен трогать файлы)
+if __name__ == '__main__':
+    from utils.mediator import Mediator
 
-# Пример использования
-inventory_file = "inventory.json"
-json_file_path = "inventory_template.json"  # Путь к вашему JSON-файлу
-excel_file_path = "output/inventory.xlsx"  # Путь для сохранения Excel-файла
-chat_id = "12345"  # Здесь должен быть идентификатор чата, для которого требуется сохранить данные
+    inventory_file = "inventory.json"
+    json_file_path = "inventory_template.json"  # Путь к вашему JSON-файлу
+    excel_file_path = "output/inventory.xlsx"  # Путь для сохранения Excel-файла
+    chat_id = "12345"  # Здесь должен быть идентификатор чата, для которого требуется сохранить данные
 
-# Создайте директорию, если она не существует
-os.makedirs(os.path.dirname(excel_file_path), exist_ok=True)
+    # Создайте директорию, если она не существует
+    os.makedirs(os.path.dirname(excel_file_path), exist_ok=True)
 
-# Читаем данные из JSON файла
-with open(json_file_path, 'r', encoding='utf-8') as f:
-    inventory_data = json.load(f)
+    # Читаем данные из JSON файла
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        inventory_data = json.load(f)
 
-mediator = Mediator()  # Убедитесь, что вы используете уже инициализированный экземпляр
-chat_manager = mediator.chat_manager
+    mediator = Mediator()  # Убедитесь, что вы используете уже инициализированный экземпляр
+    chat_manager = mediator.chat_manager
 
-# Получаем имя филиала
-branch_name = mediator.get_chat_name_by_id(chat_id)
-if not branch_name:
-    logging.warning(f"Имя филиала для chat_id {chat_id} не найдено, устанавливается значение по умолчанию.")
-    branch_name = f"Chat_{chat_id}"
+    # Получаем имя филиала
+    branch_name = mediator.get_chat_name_by_id(chat_id)
+    if not branch_name:
+        logger.warning("Имя филиала для chat_id %s не найдено, устанавливается значение по умолчанию.", chat_id)
+        branch_name = f"Chat_{chat_id}"
 
-# Вызываем json_to_excel, передавая branch_name напрямую
-json_to_excel(inventory_data, excel_file_path, branch_name)
+    # Вызываем json_to_excel, передавая branch_name напрямую
+    json_to_excel(inventory_data, excel_file_path, branch_name)
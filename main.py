@@ -1,39 +1,28 @@
 import logging
-def setup_logging():
-    # Убираем все закрывающие обработчики, если они есть
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
+import os
+from utils.logging_setup import configure_logging, parse_levels, parse_sampling, stop_logging
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s'
+def setup_logging():
+    """
+    Логирование через очередь и фоновый поток. Переменные окружения:
+    LOG_LEVEL — общий уровень (INFO); LOG_LEVELS — уровни модулей
+    ('components.inventory_manager=DEBUG,httpx=WARNING'); LOG_SAMPLING —
+    прореживание частых сообщений ('components.inventory_manager=20' — одно из 20);
+    LOG_QUEUE=off — синхронный вывод без фонового потока.
+    """
+    configure_logging(
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        # HTTP-клиент пишет INFO на каждый запрос к Bot API
+        module_levels=parse_levels(os.environ.get('LOG_LEVELS', 'httpx=WARNING')),
+        sampling=parse_sampling(os.environ.get('LOG_SAMPLING', '')),
+        use_queue=os.environ.get('LOG_QUEUE', 'on') != 'off',
     )
-
-    custom_logger = logging.getLogger('custom_logger')
-    custom_logger.setLevel(logging.DEBUG)
-
-    handler = logging.StreamHandler()
-    handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-
-    custom_logger.addHandler(handler)
-
-    custom_logger.debug("Это тестовое сообщение DEBUG от custom_logger.")
-
-    # Установка более высокого уровня для известных логеров HTTP-библиотек
-    # logging.getLogger('httpx').setLevel(logging.WARNING)
-    # logging.getLogger('http.client').setLevel(logging.WARNING)
-    # logging.getLogger('asyncio').setLevel(logging.WARNING)
-    # logging.getLogger('urllib3').setLevel(logging.WARNING)
-    # logging.getLogger('aiohttp').setLevel(logging.WARNING)
-    # logging.getLogger('telegram').setLevel(logging.WARNING)
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatMemberStatus
 from telegram.ext import ApplicationBuilder,CommandHandler, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, CallbackContext
 from message_handler import CustomMessageHandler
-from user_states import set_user_state
+from user_states import set_user_state, configure_storage, configure_persistence
 import date_manager
 from chat_manager import ChatManager
 from utils.scheduler import Scheduler
@@ -41,6 +30,15 @@ from utils.access_control import AccessControl
 from functools import partial
 from components.inventory_manager import InventoryManager, SELECT_CHAT,CHOOSING_CATEGORY, CHOOSING_ITEM, CHOOSING_ITEM_TYPE, ENTERING_QUANTITY, RETURN_MENU , EDITING_ITEM, EDITING_SELECTION,ENTERING_QUANTITY_FOR_EDIT
 from utils.mediator import Mediator
+from utils.storage import create_storage
+from utils.persistence import PersistenceActor
+from utils.reminder_store import ReminderJobStore
+from utils.inventory_archive import InventoryArchive
+from utils.update_processor import PerUserUpdateProcessor
+from utils.send_queue import RateAwareSendQueue
+from utils.callback_router import CallbackRouter
+from utils.keyboards import MAIN_MENU
+from utils.metrics import REGISTRY, MetricsServer, instrument_application
 
 async def handle_text_message(update: Update, context: CallbackContext) -> None:
     global access_control
@@ -59,7 +57,7 @@ async def handle_text_message(update: Update, context: CallbackContext) -> None:
         return
 
     if not await access_control.has_access(update):
-        logging.info(f"Пользователь {user_id} не имеет доступа.")
+        logging.info("Пользователь %s не имеет доступа.", user_id)
         await context.bot.send_message(
             chat_id=user_id,
             text="У вас нет доступа"
@@ -69,9 +67,7 @@ async def handle_text_message(update: Update, context: CallbackContext) -> None:
     await event_manager.handle_event_input(update, context)
 
 async def start(update: Update, context: CallbackContext, access_control: AccessControl) -> None:
-    # Обновление списка разрешённых пользователей
-    await access_control.update_allowed_users(context)
-
+    # Список администраторов обновляется в фоне (AccessControl.schedule_refresh)
     # Игнорирование команды 'start' в групповом чате
     if update.effective_chat.type != 'private':
         logging.info("Команда 'start' вызвана из группового чата. Игнорирование.")
@@ -108,34 +104,34 @@ async def welcome_message(update: Update, context: CallbackContext) -> None:
                 # Проверка инвайтора относительно актуального списка разрешённых пользователей
                 if invitor_id in chat_manager.allowed_users:
                     chat_manager.set_chat_id(group_name, chat_id)
-                    logging.info(f"Добавлен новый чат: {group_name} с ID {chat_id}")
+                    logging.info("Добавлен новый чат: %s с ID %s", group_name, chat_id)
                     chat_manager.save_chat_ids_to_file()
 
                     # Регистрируем участие инвайтора в соответствующем чате
                     chat_manager.add_user_to_chat(invitor_id, chat_id)
-                    logging.info(f"Пользователь {invitor_id} добавлен в чат {chat_id} при добавлении бота.")
+                    logging.info("Пользователь %s добавлен в чат %s при добавлении бота.", invitor_id, chat_id)
 
                     # Получение всех участников чата и их регистрация
                     try:
                         members = await context.bot.getChat(chat_id)
                         for member in members:
                             chat_manager.add_user_to_chat(member.user.id, chat_id)
-                            logging.info(f"Пользователь {member.user.id} добавлен в чат {chat_id}.")
+                            logging.info("Пользователь %s добавлен в чат %s.", member.user.id, chat_id)
 
                         # Добавление всех новых членов при добавлении бота
                         member_ids = [m.id for m in update.message.new_chat_members]
                         for member_id in member_ids:
                             chat_manager.add_user_to_chat(member_id, chat_id)
-                            logging.info(f"Новый участник {member_id} добавлен в чат {chat_id}.")
+                            logging.info("Новый участник %s добавлен в чат %s.", member_id, chat_id)
                     except Exception as e:
-                        logging.error(f"Не удалось сканировать участников чата: {e}")
+                        logging.error("Не удалось сканировать участников чата: %s", e)
 
                     await context.bot.send_message(
                         chat_id=chat_id,
                         text=f"Привет {group_name}! Я бот, который поможет вам управлять важными событиями."
                     )
                 else:
-                    logging.warning(f"Несанкционированная попытка добавления ботом {invitor_id} в группу {group_name}.")
+                    logging.warning("Несанкционированная попытка добавления ботом %s в группу %s.", invitor_id, group_name)
                     await context.bot.send_message(
                         chat_id=chat_id,
                         text="У вас нет прав добавлять этого бота."
@@ -144,23 +140,20 @@ async def welcome_message(update: Update, context: CallbackContext) -> None:
             else:
                 # Если добавлен новый участник (но не бот), добавим его в chat_members.json
                 chat_manager.add_user_to_chat(member.id, update.message.chat.id)
-                logging.info(f"Новый участник {member.id} добавлен в чат {update.message.chat.id}.")
+                logging.info("Новый участник %s добавлен в чат %s.", member.id, update.message.chat.id)
 
 async def button_handler(update: Update, context: CallbackContext, access_control: AccessControl) -> None:
     query = update.callback_query
     user_id = query.from_user.id
     
-    logging.debug(f"User ID: {user_id}, query data: {query.data}")
+    logging.debug("User ID: %s, query data: %s", user_id, query.data)
 
     try:
         await query.answer()
     except Exception as e:
-        logging.error(f"Ошибка при подтверждении кнопки: {e}")
+        logging.error("Ошибка при подтверждении кнопки: %s", e)
 
-    # Обновляем разрешённые права доступа пользователям
-    await access_control.update_allowed_users(context)
-
-    # Проверка, имеет ли пользователь доступ
+    # Проверка, имеет ли пользователь доступ (по кэшу администраторов, без запросов к API)
     if not await access_control.has_access(update):
         await context.bot.send_message(
             chat_id=query.message.chat_id,
@@ -168,185 +161,294 @@ async def button_handler(update: Update, context: CallbackContext, access_contro
         )
         return
 
+    # Обработчик выбирается по таблице маршрутов (см. register_callbacks)
+    await callback_router.dispatch(update, context)
+
+async def open_main_menu(update: Update, context: CallbackContext) -> None:
+    await event_manager.process_start(update, context)
+    set_user_state(update.callback_query.from_user.id, 'main_menu')
+
+async def open_inventory(update: Update, context: CallbackContext) -> None:
+    await inventory_manager.handle_inventory(update, context)
+    set_user_state(update.callback_query.from_user.id, 'choosing_category')
+
+async def start_event_chat_selection(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    context.user_data['current_menu'] = 'event_selection'
+    reply_markup = await event_manager.get_chat_selection_keyboard(chat_manager.selected_chats, chat_manager.chat_ids)
+    await query.edit_message_text(text="Выберите, куда отправлять событие:", reply_markup=reply_markup)
+    await event_manager._reset_chat_selection(context)
+    logging.warning("Выбранные чаты сброшены. Текущие выбранные чаты: %s", context.user_data['selected_chat_ids'])
+
+async def open_events_list(update: Update, context: CallbackContext) -> None:
+    context.user_data['current_menu'] = 'events_list'
+    await event_manager.show_events(update.callback_query, context)
+    set_user_state(update.callback_query.from_user.id, 'show_events')
+
+async def open_event_details(update: Update, context: CallbackContext) -> None:
+    context.user_data['current_menu'] = 'event_details'
+    await event_manager.show_event_details(update, context)
+    set_user_state(update.callback_query.from_user.id, 'show_event_details')
+
+async def ask_delete_event(update: Update, context: CallbackContext, event_index: int) -> None:
+    query = update.callback_query
+    events = chat_manager.load_events(query.from_user.id)
+
+    if 0 <= event_index < len(events):
+        event = events[event_index]
+    else:
+        logging.error("Событие с индексом %s не найдено в events.", event_index)
+        await query.edit_message_text(text="⚠️ Событие не найдено для удаления.")
+        return
+
+    await query.edit_message_text(
+        text=f"Вы действительно хотите удалить это событие:\n\n"
+            f"Дата: {event['date']}\n"
+            f"Описание: {event['description']}\n"
+            f"Время: {event['time']}\n"
+            "🗑️ *Выберите действие:*",
+        reply_markup=InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("✅ Подтвердить", callback_data=f'confirm_delete_{event_index}'),
+                InlineKeyboardButton("❌ Отмена", callback_data='show_events')
+            ]
+        ])
+    )
+
+async def start_event_edit(update: Update, context: CallbackContext, event_index: int) -> None:
+    query = update.callback_query
+    user_id = query.from_user.id
+    context.user_data['current_menu'] = 'event_edit'
+    events = chat_manager.load_events(user_id)
     
-    # Начало обработки действий
-    if query.data == 'start_process':  
-        await event_manager.process_start(update, context)
-        set_user_state(user_id, 'main_menu')
-            
-    elif query.data == 'process_start':
-        await event_manager.process_start(update, context)
-        set_user_state(user_id, 'main_menu')
-    
-    elif query.data.startswith('select_'):
-        await event_manager.select_chat(update, context)
-
-    elif query.data == 'inventory':
-        await inventory_manager.handle_inventory(update, context)
-        set_user_state(user_id, 'choosing_category')
-
-    elif query.data == 'add_event':
-        context.user_data['current_menu'] = 'event_selection'
-        reply_markup = await event_manager.get_chat_selection_keyboard(chat_manager.selected_chats, chat_manager.chat_ids)
-        await query.edit_message_text(text="Выберите, куда отправлять событие:", reply_markup=reply_markup)
-        await event_manager._reset_chat_selection(context)
-        logging.warning("Выбранные чаты сброшены. Текущие выбранные чаты: %s", context.user_data['selected_chat_ids'])
-    
-    elif query.data == 'show_events':
-        context.user_data['current_menu'] = 'events_list'
-        await event_manager.show_events(query, context)
-        set_user_state(user_id, 'show_events')
-    
-    elif query.data.startswith('show_event_details_'):
-        context.user_data['current_menu'] = 'event_details'
-        await event_manager.show_event_details(update, context)
-        set_user_state(user_id, 'show_event_details')
-    
-    elif query.data.startswith('delete_event_'):
-        event_index = int(query.data.split('_')[-1])
-        user_id = query.from_user.id
-        events = chat_manager.load_events(user_id)
+    if event_index < 0 or event_index >= len(events):
+        logging.error("Ошибка: Неверный индекс события, оно не найдено.")
+        await query.edit_message_text(text="Ошибка: событие не найдено.")
+        return
 
-        if 0 <= event_index < len(events):
-            event = events[event_index]
-        else:
-            logging.error(f"Событие с индексом {event_index} не найдено в events.")
-            await query.edit_message_text(text="⚠️ Событие не найдено для удаления.")
-            return
-
-        await query.edit_message_text(
-            text=f"Вы действительно хотите удалить это событие:\n\n"
-                f"Дата: {event['date']}\n"
-                f"Описание: {event['description']}\n"
-                f"Время: {event['time']}\n"
-                "🗑️ *Выберите действие:*",
-            reply_markup=InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("✅ Подтвердить", callback_data=f'confirm_delete_{event_index}'),
-                    InlineKeyboardButton("❌ Отмена", callback_data='show_events')
-                ]
-            ])
-        )
+    event = events[event_index]
+    input_text = f"{event['date']} {event['description']} {event['time']}"
     
-    elif query.data.startswith('edit_event_'):
-        context.user_data['current_menu'] = 'event_edit'
-        events = chat_manager.load_events(user_id)
-        event_index = int(query.data.split('_')[-1])
-        
-        if event_index < 0 or event_index >= len(events):
-            logging.error("Ошибка: Неверный индекс события, оно не найдено.")
-            await query.edit_message_text(text="Ошибка: событие не найдено.")
-            return
+    logging.debug("Устанавливаем индекс события для редактирования: %s", event_index)
+    context.user_data['editing_event_index'] = event_index
+    context.user_data['editing_event'] = True
+
+    await query.edit_message_text(
+        text=(
+            f"Редактирование события начато. Текущее событие: {input_text}. "
+            f"Введите новые данные для события (формат: YYYY-MM-DD Описание HH:MM):"
+        ),
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Отмена редактирования", callback_data='show_events')]])
+    )
+    set_user_state(user_id, 'editing_event')
+    current_message = query.message
+    context.user_data['message_ids'] = [current_message.message_id]
 
-        event = events[event_index]
-        input_text = f"{event['date']} {event['description']} {event['time']}"
-        
-        logging.debug(f"Устанавливаем индекс события для редактирования: {event_index}")
-        context.user_data['editing_event_index'] = event_index
-        context.user_data['editing_event'] = True
-
-        await query.edit_message_text(
-            text=(
-                f"Редактирование события начато. Текущее событие: {input_text}. "
-                f"Введите новые данные для события (формат: YYYY-MM-DD Описание HH:MM):"
-            ),
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Отмена редактирования", callback_data='show_events')]])
-        )
-        set_user_state(user_id, 'editing_event')
-        current_message = query.message
-        context.user_data['message_ids'] = [current_message.message_id]
-
-    elif query.data.startswith('confirm_delete_'):
-        event_index = int(query.data.split('_')[-1])
-        await event_manager.delete_event(update, context, event_index)  
-
-    elif query.data == 'back_to_items':
-        # Устанавливаем состояние перед возвратом
-        context.user_data['current_state'] = 'choosing_items'
-        return await inventory_manager.navigate_back(update, context)
-   
-    elif query.data == 'back_to_categories':
-        # Устанавливаем состояние перед возвратом
-        context.user_data['current_state'] = 'choosing_categories'
-        return await inventory_manager.item_navigation(update, context)
-
-    elif query.data == 'confirm_event':
-        selected_chat_ids = context.user_data.get('selected_chat_ids', [])
-        selected_chat_names = [chat_manager.get_chat_name_by_id(chat_id) for chat_id in selected_chat_ids]
-        logging.info(f"Выбранные идентификаторы чатов: {selected_chat_ids}")
-
-        if not selected_chat_names:
-            await query.edit_message_text(text="Вы не выбрали ни одного чата.")
-            logging.info(f"Пользователь {user_id} пытался подтвердить выбор без выбранных чатов.")
-            return
-
-        message = await query.edit_message_text(text=f"Выбраны чаты: {', '.join(selected_chat_names)}")
-        
-        set_user_state(user_id, 'adding_event')
-        logging.debug(f"Состояние пользователя {user_id} изменено на 'adding_event'.")
-        context.user_data['message_ids'] = [message.message_id]
-        
-    elif query.data == 'select_all_groups':
-        if len(chat_manager.selected_chats) == len(chat_manager.chat_ids):
-            chat_manager.selected_chats.clear()
-        else:
-            chat_manager.selected_chats = list(chat_manager.chat_ids.keys())
+async def return_to_items(update: Update, context: CallbackContext):
+    # Устанавливаем состояние перед возвратом
+    context.user_data['current_state'] = 'choosing_items'
+    return await inventory_manager.navigate_back(update, context)
+
+async def return_to_categories(update: Update, context: CallbackContext):
+    # Устанавливаем состояние перед возвратом
+    context.user_data['current_state'] = 'choosing_categories'
+    return await inventory_manager.item_navigation(update, context)
+
+async def confirm_event_chats(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    user_id = query.from_user.id
+    selected_chat_ids = context.user_data.get('selected_chat_ids', [])
+    selected_chat_names = [chat_manager.get_chat_name_by_id(chat_id) for chat_id in selected_chat_ids]
+    logging.info("Выбранные идентификаторы чатов: %s", selected_chat_ids)
 
-        current_text = "Выберите, куда отправлять событие:"
-        current_markup = await event_manager.get_chat_selection_keyboard(chat_manager.selected_chats, chat_manager.chat_ids)
-        await query.edit_message_text(text=current_text, reply_markup=current_markup)
-        set_user_state(user_id, 'event_details')
+    if not selected_chat_names:
+        await query.edit_message_text(text="Вы не выбрали ни одного чата.")
+        logging.info("Пользователь %s пытался подтвердить выбор без выбранных чатов.", user_id)
+        return
+
+    message = await query.edit_message_text(text=f"Выбраны чаты: {', '.join(selected_chat_names)}")
     
-    elif query.data in chat_manager.chat_ids.keys():
-        selected_chat_ids = chat_manager.selected_chats
-        if query.data in selected_chat_ids:
-            selected_chat_ids.remove(query.data)
-        else:
-            selected_chat_ids.append(query.data)
+    set_user_state(user_id, 'adding_event')
+    logging.debug("Состояние пользователя %s изменено на 'adding_event'.", user_id)
+    context.user_data['message_ids'] = [message.message_id]
+
+async def toggle_all_event_chats(update: Update, context: CallbackContext) -> None:
+    if len(chat_manager.selected_chats) == len(chat_manager.chat_ids):
+        chat_manager.selected_chats.clear()
+    else:
+        chat_manager.selected_chats = list(chat_manager.chat_ids.keys())
 
-        current_text = "Выберите, куда отправлять событие:"
-        current_markup = await event_manager.get_chat_selection_keyboard(selected_chat_ids, chat_manager.chat_ids)
-        await query.edit_message_text(text=current_text, reply_markup=current_markup)
-        set_user_state(user_id, 'event_details')
+    current_text = "Выберите, куда отправлять событие:"
+    current_markup = await event_manager.get_chat_selection_keyboard(chat_manager.selected_chats, chat_manager.chat_ids)
+    await update.callback_query.edit_message_text(text=current_text, reply_markup=current_markup)
+    set_user_state(update.callback_query.from_user.id, 'event_details')
+
+async def toggle_event_chat(update: Update, context: CallbackContext) -> None:
+    # Кнопки с именем чата без префикса (старый формат клавиатуры выбора чатов)
+    query = update.callback_query
+    if query.data not in chat_manager.chat_ids:
+        logging.debug("Необработанные данные кнопки: %s", query.data)
+        return
+
+    selected_chat_ids = chat_manager.selected_chats
+    if query.data in selected_chat_ids:
+        selected_chat_ids.remove(query.data)
+    else:
+        selected_chat_ids.append(query.data)
+
+    current_text = "Выберите, куда отправлять событие:"
+    current_markup = await event_manager.get_chat_selection_keyboard(selected_chat_ids, chat_manager.chat_ids)
+    await query.edit_message_text(text=current_text, reply_markup=current_markup)
+    set_user_state(query.from_user.id, 'event_details')
+
+def register_callbacks(router):
+    """Маршруты кнопок главного меню и событий (глобальная область)."""
+    router.add('start_process', open_main_menu)
+    router.add('process_start', open_main_menu)
+    router.add('inventory', open_inventory)
+    router.add('add_event', start_event_chat_selection)
+    router.add('show_events', open_events_list)
+    router.add('show_event_details_', open_event_details, prefix=True)
+    router.add('delete_event_', ask_delete_event, prefix=True, parse=int)
+    router.add('edit_event_', start_event_edit, prefix=True, parse=int)
+    router.add('back_to_items', return_to_items)
+    router.add('back_to_categories', return_to_categories)
+    router.add('confirm_event', confirm_event_chats)
+    router.add('select_all_groups', toggle_all_event_chats)
+    router.set_fallback(toggle_event_chat)
             
 
 async def return_to_main_menu(query, context):
     logging.debug("Возвращение в главное меню.")
     await query.answer("Возвращение в главное меню.")
-    keyboard = [
-        [InlineKeyboardButton("Добавить событие", callback_data='add_event')],
-        [InlineKeyboardButton("Показать события", callback_data='show_events')],
-        [InlineKeyboardButton("Инвентаризация", callback_data='inventory')],
-        [InlineKeyboardButton("Помощь", callback_data='help')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text='Выберите действие:', reply_markup=reply_markup)
+    await query.edit_message_text(text='Выберите действие:', reply_markup=MAIN_MENU)
 
     # Сбрасываем все специфичные для инвентаризации состояния
     context.user_data['inventory_mode'] = None
     
+async def analytics_command(update: Update, context: CallbackContext, access_control: AccessControl) -> None:
+    """/analytics [товар] — сводка инвентаризации по всем филиалам (только для администраторов)."""
+    if not await access_control.has_access(update):
+        logging.info("Команда 'analytics' отклонена для user_id: %s", update.effective_user.id)
+        return
+
+    analytics = scheduler.inventory_analytics()
+    if analytics is None:
+        await update.message.reply_text("Аналитика инвентаризации недоступна.")
+        return
+    query = ' '.join(context.args or [])
+    if query:
+        text = analytics.item_report(query, inventory_manager.branch_name)
+    else:
+        text = analytics.summary(inventory_manager.branch_name)
+    await update.message.reply_text(text[:4096])
+
+async def stats_command(update: Update, context: CallbackContext, access_control: AccessControl) -> None:
+    """/stats — время обработчиков, вызовы Telegram API, запись файлов и кнопки (только для администраторов)."""
+    if not await access_control.has_access(update):
+        logging.info("Команда 'stats' отклонена для user_id: %s", update.effective_user.id)
+        return
+
+    text = REGISTRY.format_summary()
+    routes = callback_router.format_stats()
+    if routes:
+        text += "\n\nКнопки:\n" + routes
+    await update.message.reply_text(text[:4096])
+
+# Имена состояний диалога инвентаризации для меток метрик
+CONVERSATION_STATES = {
+    SELECT_CHAT: 'SELECT_CHAT', CHOOSING_CATEGORY: 'CHOOSING_CATEGORY', CHOOSING_ITEM: 'CHOOSING_ITEM',
+    CHOOSING_ITEM_TYPE: 'CHOOSING_ITEM_TYPE', ENTERING_QUANTITY: 'ENTERING_QUANTITY', RETURN_MENU: 'RETURN_MENU',
+    EDITING_ITEM: 'EDITING_ITEM', EDITING_SELECTION: 'EDITING_SELECTION',
+    ENTERING_QUANTITY_FOR_EDIT: 'ENTERING_QUANTITY_FOR_EDIT',
+}
+
 def setup_application(application, inventory_conv_handler):
     # Регистрация обработчиков
     application.add_handler(CommandHandler('start', partial(start, access_control=access_control)))
+    application.add_handler(CommandHandler('analytics', partial(analytics_command, access_control=access_control)))
+    application.add_handler(CommandHandler('stats', partial(stats_command, access_control=access_control)))
     application.add_handler(inventory_conv_handler)  # Добавляем именно после CommandHandler
     application.add_handler(CallbackQueryHandler(partial(button_handler, access_control=access_control)))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_message))
+    # Время и ошибки всех обработчиков, включая состояния диалога инвентаризации
+    instrument_application(application, CONVERSATION_STATES)
+
+def register_gauges(send_queue):
+    """Датчики состояния бота, которые читаются в момент выгрузки метрик."""
+    REGISTRY.gauge('persistence_dirty_entities', "Сущности, ждущие сохранения").set_function(persistence.pending_count)
+    REGISTRY.gauge('telegram_send_queue_size', "Запросы в очереди отправки").set_function(send_queue.queue_size)
+    REGISTRY.gauge('inventory_sessions', "Открытые сессии инвентаризации").set_function(
+        lambda: len(inventory_manager.sessions))
+    REGISTRY.gauge('keyboard_cache_size', "Клавиатуры в кэше").set_function(lambda: len(inventory_manager.keyboards))
+
+async def on_startup(application) -> None:
+    # Фоновое сохранение работает в цикле событий приложения
+    persistence.start()
+    if metrics_server is not None:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logging.error("Не удалось запустить сервер метрик на порту %s: %s", metrics_server.port, e)
+
+async def on_shutdown(application) -> None:
+    if metrics_server is not None:
+        await metrics_server.stop()
+    # Сбрасываем отложенные изменения перед остановкой бота
+    inventory_manager.compact_inventory()
+    await persistence.stop()
+    chat_manager.storage.close()
+    chat_manager.reminder_store.close()
+    logging.info("Отложенные изменения сохранены перед остановкой.")
+
+def build_application():
+    """
+    Собирает компоненты бота и приложение PTB с зарегистрированными обработчиками,
+    не запуская его (используется main() и нагрузочным стендом benchmarks.load_bot).
+    """
+    global chat_manager, event_manager, access_control, inventory_manager, persistence, callback_router, scheduler, \
+        metrics_server
 
-def main():
-    global chat_manager, event_manager, access_control, inventory_manager
-    
-    # Настройка логирования
-    setup_logging()
-    
     # Инициализация медиатора
     mediator = Mediator()
 
+    # Хранилище данных: JSON-файлы (по умолчанию) или SQLite
+    storage = create_storage(
+        backend=os.environ.get('STORAGE_BACKEND', 'json'),
+        db_path=os.environ.get('STORAGE_DB_PATH', 'bot.db'),
+        inventory_path=mediator.get_inventory_file_path()
+    )
+    configure_storage(storage)
+
+    # Единый фоновый писатель: изменения копятся и пишутся пачкой вне цикла событий
+    persistence = PersistenceActor(coalesce_delay=float(os.environ.get('PERSISTENCE_DELAY', '2')))
+    configure_persistence(persistence)
+
     # Инициализация компонентов
-    chat_manager = ChatManager(mediator)
+    reminder_store = ReminderJobStore(os.environ.get('REMINDER_DB_PATH', 'reminders.db'))
+    chat_manager = ChatManager(mediator, storage, persistence, reminder_store)
     access_control = AccessControl(chat_manager)
-    application = ApplicationBuilder().token('8044750997:AAGsanhJ6VvfEjoJe-zVBqGOgw7bi0TbqKQ').build()
+    send_queue = RateAwareSendQueue(workers=int(os.environ.get('SEND_WORKERS', '8')))
+    # Метрики в формате Prometheus на локальном порту (METRICS_PORT=off — без сервера)
+    metrics_port = os.environ.get('METRICS_PORT', '9108')
+    metrics_server = None if metrics_port == 'off' else \
+        MetricsServer(REGISTRY, host=os.environ.get('METRICS_HOST', '127.0.0.1'), port=int(metrics_port))
+    application = (
+        ApplicationBuilder()
+        .token('8044750997:AAGsanhJ6VvfEjoJe-zVBqGOgw7bi0TbqKQ')
+        # Локальный Bot API сервер или тестовая заглушка
+        .base_url(os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org/bot'))
+        .rate_limiter(send_queue)
+        .concurrent_updates(PerUserUpdateProcessor(int(os.environ.get('UPDATE_CONCURRENCY', '64'))))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     scheduler = Scheduler(mediator, application.job_queue, chat_manager)
+    # Сводный отчёт при закрытии редактирования: zip (по умолчанию), xlsx или off
+    report_mode = os.environ.get('CONSOLIDATED_REPORT', 'zip')
+    scheduler.consolidated_report_mode = None if report_mode == 'off' else report_mode
     
     # Регистрация компонентов в медиаторе
     mediator.register_scheduler(scheduler)
@@ -359,7 +461,10 @@ def main():
         chat_ids=chat_manager.chat_ids,
         access_control=access_control,
         mediator=mediator,
-        scheduler=scheduler
+        scheduler=scheduler,
+        storage=storage,
+        persistence=persistence,
+        archive=InventoryArchive(os.environ.get('INVENTORY_ARCHIVE_PATH', 'inventory_archive'))
     )
 
     mediator.register_inventory_manager(inventory_manager)
@@ -375,41 +480,49 @@ def main():
     scheduler.schedule_daily_check()
     scheduler.schedule_daily_update()
     scheduler.schedule_daily_clear_inventory()
+    scheduler.schedule_inventory_compaction()
+    scheduler.schedule_lag_probe()
+    access_control.schedule_refresh(application.job_queue)
+
+    # Единая таблица маршрутов кнопок: главное меню, события и диалог инвентаризации
+    callback_router = CallbackRouter()
+    register_callbacks(callback_router)
+    event_manager.register_callbacks(callback_router)
+    inventory_manager.register_callbacks(callback_router)
+    inventory_callbacks = partial(callback_router.handler, InventoryManager.CALLBACK_SCOPE)
 
     # Создание и настройка ConversationHandler
     inventory_conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(inventory_manager.handle_inventory, pattern='^inventory$')],
+        entry_points=[inventory_callbacks('inventory')],
         states={
             SELECT_CHAT: [
-                CallbackQueryHandler(inventory_manager.select_chat_for_invent, pattern='^select_chat_')
+                inventory_callbacks('select_chat_')
             ],
             CHOOSING_CATEGORY: [
-                CallbackQueryHandler(inventory_manager.choose_category, pattern=r'^category_'),
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern=r'^back_to_menu$|^back_to_categories$'),
+                inventory_callbacks('category_', 'back_to_menu', 'back_to_categories'),
             ],
             CHOOSING_ITEM: [
-                CallbackQueryHandler(inventory_manager.choose_item, pattern=r'^item_'),
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern=r'^back_to_categories$|^back_to_items$'),
+                inventory_callbacks('item_', 'back_to_categories', 'back_to_items'),
             ],
             CHOOSING_ITEM_TYPE: [
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern=r'^back_to_items$|^back_to_categories$|^back_to_select_edit_items$'),
-                CallbackQueryHandler(inventory_manager.choose_item_type, pattern=r'^type_(raw|semi)_.+$')
+                inventory_callbacks('back_to_items', 'back_to_categories', 'back_to_select_edit_items'),
+                inventory_callbacks('type_raw_', 'type_semi_')
             ],
             ENTERING_QUANTITY: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, inventory_manager.enter_quantity),
             ],
             RETURN_MENU: [
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern=r'^back_to_menu$|^edit_inventory$'),
+                inventory_callbacks('back_to_menu', 'edit_inventory'),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, event_manager.process_start)
             ],
             EDITING_ITEM: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, inventory_manager.search_item),
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern='^back_to_menu$')
+                inventory_callbacks('back_to_menu')
     
                 ],
             EDITING_SELECTION: [
-                CallbackQueryHandler(inventory_manager.edit_item, pattern='^edit_item_'),
-                CallbackQueryHandler(inventory_manager.item_navigation, pattern='^edit_inventory$')
+                inventory_callbacks('edit_item_'),
+                inventory_callbacks('edit_inventory')
                 ],
             ENTERING_QUANTITY_FOR_EDIT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, inventory_manager.enter_quantity_for_edit),
@@ -420,10 +533,39 @@ def main():
         per_message=False,
     )
 
-    # Настройка и запуск приложения
+    # Настройка приложения
     setup_application(application, inventory_conv_handler)
-    print("Бот запущен. Ожидание команд...")
-    application.run_polling()
+    register_gauges(send_queue)
+    return application
+
+def main():
+    # Настройка логирования
+    setup_logging()
+    # Режим получения обновлений: polling (по умолчанию) или webhook
+    webhook_mode = os.environ.get('BOT_MODE', 'polling') == 'webhook'
+    if webhook_mode:
+        # tornado нужен только в режиме вебхука; версия PTB проверяется до запуска бота
+        from utils.webhook import check_webhook_support, serve_webhook
+        check_webhook_support()
+    application = build_application()
+
+    try:
+        if webhook_mode:
+            print("Бот запущен в режиме webhook. Ожидание обновлений...")
+            serve_webhook(
+                application,
+                listen=os.environ.get('WEBHOOK_LISTEN', '0.0.0.0'),
+                port=int(os.environ.get('WEBHOOK_PORT', '8443')),
+                url_path=os.environ.get('WEBHOOK_PATH', '/telegram'),
+                webhook_url=os.environ.get('WEBHOOK_URL'),
+                secret_token=os.environ.get('WEBHOOK_SECRET'),
+            )
+        else:
+            print("Бот запущен. Ожидание команд...")
+            application.run_polling()
+    finally:
+        # Дописываем записи, оставшиеся в очереди логирования
+        stop_logging()
 
 if __name__ == '__main__':
    main()
\ No newline at end of file
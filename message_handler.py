@@ -1,18 +1,15 @@
 import logging
 import re
 import asyncio
-import json
-import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 from user_states import set_user_state, get_user_state
 from utils.date_parser import parse_event_input, calculate_delay
 from chat_manager import ChatManager
+from utils.keyboards import KeyboardCache, MAIN_MENU
+
+logger = logging.getLogger(__name__)
 
-EVENTS_FILE_PATH = 'events.json'
-if not os.path.exists(EVENTS_FILE_PATH):
-    with open(EVENTS_FILE_PATH, 'w') as f:
-        json.dump({}, f)
 
 class CustomMessageHandler:
     def __init__(self, mediator, chat_manager, chat_ids):
@@ -21,30 +18,41 @@ class CustomMessageHandler:
         self.mediator = mediator
         self.mediator.register_message_handler(self)
         self.scheduler = mediator.scheduler
+        self.keyboards = KeyboardCache(maxsize=256)  # Клавиатуры выбора чатов
+        self._chat_picker_version = chat_manager.chat_ids_version
         
+    def register_callbacks(self, router):
+        """Маршруты кнопок выбора чатов и удаления событий."""
+        router.add('select_', self.select_chat, prefix=True, parse=str)
+        router.add('confirm_delete_', self.delete_event, prefix=True, parse=int)
+
     def process_message(self, message):
         # Логика обработки сообщения
-        logging.info(f"Processing message: {message}")
+        logger.info("Processing message: %s", message)
         # Инициируйте обновление инвентаризации при необходимости
         self.mediator.notify_inventory_update()    
     
-    async def select_chat(self, update: Update, context: CallbackContext) -> None:
+    async def select_chat(self, update: Update, context: CallbackContext, selected_chat_name: str) -> None:
+        # selected_chat_name — всё после 'select_': имя чата может содержать '_'
         user_id = update.callback_query.from_user.id
-        selected_chat_name = update.callback_query.data.split('_')[1]  # Имя выбранного чата
+        if selected_chat_name not in self.chat_ids:
+            # Кнопка устаревшей клавиатуры (или не из выбора чатов): сообщение не трогаем
+            logger.debug("Чат '%s' не найден, выбор не изменён.", selected_chat_name)
+            await update.callback_query.answer()
+            return
 
         if 'selected_chat_ids' not in context.user_data:
             context.user_data['selected_chat_ids'] = []
 
-        if selected_chat_name in self.chat_ids:
-            selected_chat_id = self.chat_ids[selected_chat_name]
-            if selected_chat_id not in context.user_data['selected_chat_ids']:
-                context.user_data['selected_chat_ids'].append(selected_chat_id)
-                logging.info(f"Чат '{selected_chat_name}' добавлен в выбранные.")
-            else:
-                context.user_data['selected_chat_ids'].remove(selected_chat_id)
-                logging.info(f"Чат '{selected_chat_name}' удален из выбранных.")
+        selected_chat_id = self.chat_ids[selected_chat_name]
+        if selected_chat_id not in context.user_data['selected_chat_ids']:
+            context.user_data['selected_chat_ids'].append(selected_chat_id)
+            logger.info("Чат '%s' добавлен в выбранные.", selected_chat_name)
+        else:
+            context.user_data['selected_chat_ids'].remove(selected_chat_id)
+            logger.info("Чат '%s' удален из выбранных.", selected_chat_name)
 
-        logging.info(f"Текущие выбранные чаты: {context.user_data['selected_chat_ids']}")
+        logger.info("Текущие выбранные чаты: %s", context.user_data['selected_chat_ids'])
         await update.callback_query.answer()
 
         # Получаем новую клавиатуру
@@ -55,111 +63,106 @@ class CustomMessageHandler:
         if keyboard != current_markup:
             await update.callback_query.message.edit_reply_markup(reply_markup=keyboard)
         else:
-            logging.debug("Клавиатура не изменилась. Редактирование пропущено.")
+            logger.debug("Клавиатура не изменилась. Редактирование пропущено.")
         
     async def _reset_chat_selection(self, context: CallbackContext) -> None:
         """Сброс состояния выбора чатов."""
         context.user_data['selected_chat_ids'] = []
 
     async def get_chat_selection_keyboard(self, selected_chats, chat_ids) -> InlineKeyboardMarkup:
-        keyboard = []
-
         if not chat_ids:
-            logging.warning("Нет доступных чатов для отображения.")
+            logger.warning("Нет доступных чатов для отображения.")
             return InlineKeyboardMarkup([])
 
-        for chat_name, chat_id in chat_ids.items():
-            if chat_id in selected_chats:
-                button_label = f"✅ {chat_name}"  # Чат выбран
-            else:
-                button_label = f"🔲 {chat_name}"  # Чат не выбран
-            
-            keyboard.append([InlineKeyboardButton(button_label, callback_data=f"select_{chat_name}")])
+        version = self.chat_manager.chat_ids_version
+        if version != self._chat_picker_version:
+            # Список чатов изменился: клавиатуры со старым набором чатов больше не нужны
+            self.keyboards.invalidate('chat_picker')
+            self._chat_picker_version = version
+
+        def build():
+            keyboard = []
+            for chat_name, chat_id in chat_ids.items():
+                if chat_id in selected_chats:
+                    button_label = f"✅ {chat_name}"  # Чат выбран
+                else:
+                    button_label = f"🔲 {chat_name}"  # Чат не выбран
+
+                keyboard.append([InlineKeyboardButton(button_label, callback_data=f"select_{chat_name}")])
 
-        keyboard.append([InlineKeyboardButton("🌟 Выбрать все филиалы", callback_data='select_all_groups')])        
-        keyboard.append([InlineKeyboardButton("✅ Подтвердить выбор", callback_data='confirm_event')])
-        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_menu')])
+            keyboard.append([InlineKeyboardButton("🌟 Выбрать все филиалы", callback_data='select_all_groups')])
+            keyboard.append([InlineKeyboardButton("✅ Подтвердить выбор", callback_data='confirm_event')])
+            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='back_to_menu')])
+            return InlineKeyboardMarkup(keyboard)
 
-        return InlineKeyboardMarkup(keyboard)
+        return self.keyboards.get(('chat_picker', frozenset(selected_chats), version), build)
 
     async def process_start(self, update: Update, context: CallbackContext) -> None:
         query = update.callback_query  # Получаем query из update
         user_id = query.from_user.id
         await query.answer()
         
-        logging.debug(f"Вызван process_start для user_id: {user_id}")
+        logger.debug("Вызван process_start для user_id: %s", user_id)
 
-        keyboard = [
-            [InlineKeyboardButton("Добавить событие", callback_data='add_event')],
-            [InlineKeyboardButton("Показать события", callback_data='show_events')],
-            [InlineKeyboardButton("Инвентаризация", callback_data='inventory')],
-            [InlineKeyboardButton("Помощь", callback_data='help')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = MAIN_MENU
 
         try:
             await query.edit_message_text(
                 text='Выберите действие:',
                 reply_markup=reply_markup
             )
-            logging.debug("Сообщение успешно обновлено в process_start")
+            logger.debug("Сообщение успешно обновлено в process_start")
         except Exception as e:
-            logging.error(f"Ошибка при редактировании сообщения в process_start: {e}")
+            logger.error("Ошибка при редактировании сообщения в process_start: %s", e)
 
         context.user_data['current_menu'] = 'main_menu'
         set_user_state(user_id, 'main_menu')
 
     async def add_event(self, update: Update, context: CallbackContext) -> None:
         user_id = update.effective_user.id
-        logging.debug(f"Начало процесса добавления события для пользователя {user_id}")
+        logger.debug("Начало процесса добавления события для пользователя %s", user_id)
 
         current_state = get_user_state(user_id)
-        logging.warning(f"Текущее состояние для пользователя {user_id}: {current_state}")
+        logger.warning("Текущее состояние для пользователя %s: %s", user_id, current_state)
         if current_state != 'adding_event':
             await update.message.reply_text("Вы не находитесь в режиме ввода события.")
-            logging.warning(f"Неожиданное состояние пользователя {user_id}. Ожидалось 'adding_event'.")
+            logger.warning("Неожиданное состояние пользователя %s. Ожидалось 'adding_event'.", user_id)
             return
 
         event_input = update.message.text.strip()
-        logging.warning(f"Получен ввод события от пользователя {user_id}: {event_input}")
+        logger.warning("Получен ввод события от пользователя %s: %s", user_id, event_input)
 
         selected_chat_ids = context.user_data.get('selected_chat_ids', [])
         selected_chat_names = [self.chat_manager.get_chat_name_by_id(chat_id) for chat_id in selected_chat_ids]
-        logging.warning(f"Выбранные идентификаторы чатов: {selected_chat_ids}")
-        logging.warning(f"Выбранные чаты: {selected_chat_names}")
+        logger.warning("Выбранные идентификаторы чатов: %s", selected_chat_ids)
+        logger.warning("Выбранные чаты: %s", selected_chat_names)
 
         if not selected_chat_ids:
             await update.message.reply_text("Ошибка! Не выбраны чаты для добавления событий.")
             return
 
         try:
-            logging.debug("Вызов parse_event_input...")
+            logger.debug("Вызов parse_event_input...")
             parsed_data = parse_event_input(event_input)
-            logging.debug("Функция parse_event_input завершена.")
+            logger.debug("Функция parse_event_input завершена.")
             date_str = parsed_data['date_str']
             time_str = parsed_data['time_str']
             description = parsed_data['description']
 
+            # Проверяем, что событие в будущем, до его сохранения
+            event_datetime_str = f"{date_str} {time_str}"
+            delay = calculate_delay(event_datetime_str)
+
             new_event = {
                 'index': len(self.chat_manager.load_events(user_id)),
                 'date': date_str,
                 'description': description,
                 'time': time_str,
+                'chat_ids': list(selected_chat_ids),
             }
+            # Напоминание попадает в очередь планировщика при сохранении события
             self.chat_manager.save_event(user_id, new_event)
-            logging.info(f"Событие добавлено: {new_event}")
-
-            # Использование функции для вычисления задержки
-            event_datetime_str = f"{date_str} {time_str}"
-            delay = calculate_delay(event_datetime_str)
-
-            for chat_id in selected_chat_ids:
-                logging.debug(f"Планируем отправку сообщения в чат: {chat_id} через {delay} секунд.")
-                context.job_queue.run_once(
-                    self.scheduler.send_scheduled_message,  # используйте метод из объекта scheduler
-                    when=delay,
-                    data={'chat_id': chat_id, 'message': f"Напоминание о событии: {description} в {time_str}."}
-                )
+            logger.info("Событие добавлено: %s, напоминание через %s секунд.", new_event, delay)
 
             msg = await update.message.reply_text(
                 f"Событие добавлено и будет отправлено в чат(ы): {', '.join(selected_chat_names)} в {event_datetime_str}."
@@ -171,7 +174,7 @@ class CustomMessageHandler:
             await self.show_events_via_message(update, context, action="add")
 
         except ValueError as e:
-            logging.error(f"Ошибка при добавлении события: {e}")
+            logger.error("Ошибка при добавлении события: %s", e)
             await update.message.reply_text(f"Ошибка: {e}")
 
 
@@ -181,17 +184,12 @@ class CustomMessageHandler:
         user_id = query.from_user.id
 
         try:
-            user_events = self.chat_manager.load_events(user_id)  # загружаем события пользователя
-            logging.info(f"Загружено событий для пользователя {user_id}: {user_events}")
-
-            if event_index < 0 or event_index >= len(user_events):
+            deleted_event = self.chat_manager.delete_event(user_id, event_index)  # Удаляем событие и его напоминание
+            if deleted_event is None:
                 await query.answer("⚠️ Событие не найдено.")
                 return
 
-            deleted_event = user_events.pop(event_index)  # Удаляем событие
-            self.chat_manager.save_events_to_file()
-
-            logging.info(f'Событие удалено: {deleted_event["date"]} - {deleted_event["description"]}')
+            logger.info("Событие удалено: %s - %s", deleted_event['date'], deleted_event['description'])
 
             await query.edit_message_text(
                 text=f"✅ Событие успешно удалено:\n\n"
@@ -201,18 +199,15 @@ class CustomMessageHandler:
             )
             
                 # Проверяем, остались ли события
-            if user_events:  
+            if self.chat_manager.load_events(user_id):
                 await self.show_events(query, context)
             else:
-                # Если нет событий, удаляем пользователя из словаря событий
-                if user_id in self.chat_manager.events:  # Перед удалением убедитесь, что ключ существует
-                    del self.chat_manager.events[user_id]
                 await self.process_start(update, context)
         except KeyError as ke:
-            logging.error(f'Ключевая ошибка: {ke}')
+            logger.error("Ключевая ошибка: %s", ke)
             await query.answer("⚠️ Одно из событий недоступно.")
         except Exception as e:
-            logging.error(f'Ошибка при удалении события: {e}')
+            logger.error("Ошибка при удалении события: %s", e)
             await query.answer("⚠️ Произошла ошибка при удалении события.")
             
     async def show_events(self, query, context: CallbackContext) -> None:
@@ -321,7 +316,7 @@ class CustomMessageHandler:
             await query.answer("⚠️ Событие не найдено.")
     
     async def edit_event(self, update: Update, context: CallbackContext) -> None:
-        logging.debug("Вход в функцию редактирования события.")
+        logger.debug("Вход в функцию редактирования события.")
         user_id = update.effective_user.id
 
         current_state = get_user_state(user_id)
@@ -337,7 +332,7 @@ class CustomMessageHandler:
             return
 
         try:
-            logging.debug('Попытка редактирования события...')
+            logger.debug('Попытка редактирования события...')
             
             input_text = update.message.text.strip()
             # Используем новую функцию для извлечения всех необходимых данных
@@ -350,7 +345,7 @@ class CustomMessageHandler:
             context.user_data['events'] = user_events
 
             self.chat_manager.save_events_to_file()
-            logging.info(f"Событие успешно обновлено: {user_events[event_index]}")
+            logger.info("Событие успешно обновлено: %s", user_events[event_index])
 
             msg = await update.message.reply_text(
                 f'Событие обновлено: {date_str} {time_str} - {description}'
@@ -359,12 +354,12 @@ class CustomMessageHandler:
             await context.bot.delete_message(chat_id=msg.chat.id, message_id=msg.message_id)
             
             set_user_state(user_id, 'showing_events')
-            logging.debug("Состояние пользователя изменено на 'showing_events'.")
+            logger.debug("Состояние пользователя изменено на 'showing_events'.")
 
             await self.show_events_via_message(update, context, action="update")
 
         except ValueError as e:
-            logging.error(f"Ошибка при редактировании события: {e}")
+            logger.error("Ошибка при редактировании события: %s", e)
             await update.message.reply_text(f"Ошибка: {e}")
 
     async def handle_event_input(self, update: Update, context: CallbackContext) -> None:
@@ -372,14 +367,14 @@ class CustomMessageHandler:
         state = get_user_state(user_id)
         if update.effective_chat.type != 'private':
             return  # Игнорируем все сообщения из групп и супергрупп
-        logging.info(f"Текущее состояние для пользователя {user_id}: {state}")
+        logger.info("Текущее состояние для пользователя %s: %s", user_id, state)
 
         if state == 'editing_event':
             event_index = context.user_data.get('editing_event_index')
             if event_index is not None:
                 await self.edit_event(update, context)
             else:
-                logging.error("Индекс события не найден. Невозможно выполнить редактирование.")
+                logger.error("Индекс события не найден. Невозможно выполнить редактирование.")
                 await update.message.reply_text("Ошибка: Не выбран индекс события для редактирования.")
         elif state == 'adding_event':
             await self.add_event(update, context)
@@ -1,25 +1,112 @@
 import json
-import os
+import logging
+import threading
+
+from utils.storage import JsonStorage
+
+logger = logging.getLogger(__name__)
 
 data_file_path = 'user_data.json'
 
-# Создание файла данных, если он не существует
-if not os.path.exists(data_file_path):
-    with open(data_file_path, 'w') as f:
-        json.dump({}, f)
 
-def set_user_state(user_id, state):
-    """Устанавливает состояние пользователя в файле."""
-    with open(data_file_path, 'r') as f:
-        data = json.load(f)
+class UserStateStore:
+    """
+    Хранилище состояний пользователей в памяти с отложенной записью на диск.
+
+    Чтение и запись состояния не трогают файл: изменённые записи помечаются
+    как "грязные" и сбрасываются пачкой методом flush (фоновым актором
+    сохранения или при остановке бота).
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.persistence = None  # PersistenceActor, если подключён
+        self._states = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._states is not None:
+            return
+        try:
+            self._states = self.storage.load_user_states()
+            logger.info("Состояния пользователей загружены из хранилища.")
+        except FileNotFoundError:
+            self._states = {}
+            logger.info("Файл состояний пользователей не найден. Используется пустое хранилище состояний.")
+        except json.JSONDecodeError as e:
+            self._states = {}
+            logger.error("Ошибка декодирования состояний пользователей: %s. Используется пустое хранилище состояний.", e)
+
+    def get(self, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._states.get(str(user_id), {})
+
+    def set(self, user_id, state):
+        user_id = str(user_id)  # Убедимся, что user_id хранится как строка
+        with self._lock:
+            self._ensure_loaded()
+            if self._states.get(user_id) == state:
+                return
+            self._states[user_id] = state
+            self._dirty.add(user_id)
+        # Вне блокировки: без запущенного актора запись выполняется сразу через flush
+        if self.persistence is not None:
+            self.persistence.mark_dirty('user_states')
+
+    def set_storage(self, storage):
+        """Переключает хранилище; несохранённые изменения сначала сбрасываются в старое."""
+        self.flush()
+        with self._lock:
+            self.storage = storage
+            self._states = None
+
+    def has_pending_changes(self):
+        return bool(self._dirty)
 
-    data[str(user_id)] = state  # Убедимся, что user_id хранится как строка
+    def flush(self):
+        """Сбрасывает накопленные изменения на диск. Возвращает число записанных пользователей."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            snapshot = dict(self._states)
+            flushed = self._dirty
+            self._dirty = set()
 
-    with open(data_file_path, 'w') as f:
-        json.dump(data, f)
+        try:
+            self.storage.save_user_states(snapshot, flushed)
+        except Exception as e:
+            # Возвращаем пометки, чтобы повторить запись при следующем сбросе
+            with self._lock:
+                self._dirty.update(flushed)
+            logger.error("Ошибка при сохранении состояний пользователей: %s", e)
+            return 0
+
+        logger.debug("Состояния пользователей сохранены (%s изменений).", len(flushed))
+        return len(flushed)
+
+
+_store = UserStateStore(JsonStorage(user_states_path=data_file_path))
+
+
+def set_user_state(user_id, state):
+    """Устанавливает состояние пользователя (запись на диск отложена)."""
+    _store.set(user_id, state)
 
 def get_user_state(user_id):
-    """Получает состояние пользователя из файла."""
-    with open(data_file_path, 'r') as f:
-        data = json.load(f)
-    return data.get(str(user_id), {})  # Возвращаем словарь или пустой
\ No newline at end of file
+    """Получает состояние пользователя из памяти."""
+    return _store.get(user_id)  # Возвращаем словарь или пустой
+
+def configure_storage(storage):
+    """Подключает общее хранилище бота (JSON или SQLite) для состояний пользователей."""
+    _store.set_storage(storage)
+
+def configure_persistence(persistence):
+    """Передаёт запись изменённых состояний фоновому актору сохранения."""
+    persistence.register('user_states', _store.flush)
+    _store.persistence = persistence
+
+def flush_user_states():
+    """Записывает изменённые состояния пользователей на диск."""
+    return _store.flush()
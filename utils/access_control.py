@@ -1,16 +1,23 @@
 from telegram import Update
 from telegram.error import ChatMigrated, Forbidden
-from telegram.error import ChatMigrated
+import asyncio
 import logging
+import time
 
+logger = logging.getLogger(__name__)
 
 
 class AccessControl:
-    def __init__(self, chat_manager):
+    def __init__(self, chat_manager, ttl=300, max_concurrent_requests=10):
         self.chat_manager = chat_manager
         self.group_chat_id = chat_manager.chat_ids
-        self.allowed_users = set()  # Доступные по администраторским правам
+        # До первого обновления используем сохранённый список администраторов
+        self.allowed_users = set(chat_manager.allowed_users)  # Доступные по администраторским правам
         self.password_users = set()  # Доступные благодаря паролю
+        self.ttl = ttl  # Время жизни закэшированного списка администраторов чата, сек.
+        self.max_concurrent_requests = max_concurrent_requests
+        self._chat_admins = {}  # chat_id -> (множество user_id, время получения)
+        self._refresh_lock = asyncio.Lock()
 
     async def has_access(self, update: Update) -> bool:
         user_id = update.effective_user.id
@@ -19,39 +26,101 @@ class AccessControl:
             if user_id in self.allowed_users or user_id in self.password_users:
                 return True
         return False
-    async def update_allowed_users(self, context):
-        self.allowed_users.clear()  # Очищаем текущий список администраторов
-        groups_to_remove = []
 
-        logging.info("Начало обновления администраторов.")
+    def schedule_refresh(self, job_queue, interval=60):
+        """Фоновое обновление кэша администраторов через JobQueue."""
+        job_queue.run_repeating(self.refresh_allowed_users, interval=interval, first=0)
 
-        for group_name, group_id in self.group_chat_id.items():
+    async def refresh_allowed_users(self, context):
+        await self.update_allowed_users(context)
+
+    def invalidate(self, chat_id=None):
+        """Помечает кэш чата (или всех чатов) устаревшим."""
+        if chat_id is None:
+            self._chat_admins.clear()
+        else:
+            self._chat_admins.pop(chat_id, None)
+
+    def _is_stale(self, chat_id, now):
+        cached = self._chat_admins.get(chat_id)
+        return cached is None or now - cached[1] >= self.ttl
+
+    async def _fetch_admins(self, bot, semaphore, group_name, group_id):
+        async with semaphore:
             try:
                 # Получаем список администраторов группы
-                admins = await context.bot.get_chat_administrators(group_id)
+                admins = await bot.get_chat_administrators(group_id)
+                return group_name, group_id, {admin.user.id for admin in admins}, None
+            except (ChatMigrated, Forbidden) as e:
+                return group_name, group_id, None, e
+            except Exception as e:
+                logger.error("Не удалось получить администраторов чата '%s': %s", group_name, e)
+                return group_name, group_id, None, e
+
+    async def update_allowed_users(self, context, force=False):
+        """Обновляет устаревшие записи кэша администраторов; запросы к разным чатам идут параллельно."""
+        async with self._refresh_lock:
+            now = time.monotonic()
+            stale_groups = [
+                (group_name, group_id) for group_name, group_id in self.group_chat_id.items()
+                if force or self._is_stale(group_id, now)
+            ]
+            if not stale_groups:
+                return
+
+            logger.info("Начало обновления администраторов (%s чатов).", len(stale_groups))
+
+            semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+            results = await asyncio.gather(*(
+                self._fetch_admins(context.bot, semaphore, group_name, group_id)
+                for group_name, group_id in stale_groups
+            ))
+
+            groups_to_remove = []
+            chats_changed = False
+            for group_name, group_id, admin_ids, error in results:
+                if admin_ids is not None:
+                    self._chat_admins[group_id] = (admin_ids, now)
+                    logger.debug("Администраторы группы '%s': %s.", group_name, admin_ids)
+
+                elif isinstance(error, ChatMigrated):
+                    new_chat_id = error.new_chat_id
+                    logger.warning("Чат '%s' мигрировал на новый ID %s. Обновляем запись.", group_name, new_chat_id)
+                    self.chat_manager.set_chat_id(group_name, new_chat_id)  # Обновляем ID чата и обратный индекс
+                    self._chat_admins.pop(group_id, None)
+                    chats_changed = True
 
-                for admin in admins:
-                    user_id = admin.user.id
-                    self.allowed_users.add(user_id)
-                    logging.debug(f"Добавлен администратор с ID {user_id} в группе '{group_name}'.")
+                elif isinstance(error, Forbidden):
+                    logger.warning("Доступ боту к чату '%s' с ID %s запрещён. Чат будет удалён.", group_name, group_id)
+                    groups_to_remove.append(group_name)
 
-            except ChatMigrated as e:
-                new_chat_id = e.new_chat_id
-                logging.warning(f"Чат '{group_name}' мигрировал на новый ID {new_chat_id}. Обновляем запись.")
-                self.group_chat_id[group_name] = new_chat_id  # Обновляем ID чата
+            for group_name in groups_to_remove:
+                self._chat_admins.pop(self.group_chat_id.get(group_name), None)
+                self.chat_manager.remove_chat_id(group_name, save=False)
+                chats_changed = True
+                logger.info("Чат '%s' был удалён из group_chat_id из-за отсутствия доступа.", group_name)
 
-            except Forbidden:
-                logging.warning(f"Доступ боту к чату '{group_name}' с ID {group_id} запрещён. Чат будет удалён.")
-                groups_to_remove.append(group_name)
+            # Кэш чатов, которые больше не зарегистрированы, не должен давать доступ
+            registered_ids = set(self.group_chat_id.values())
+            for chat_id in list(self._chat_admins):
+                if chat_id not in registered_ids:
+                    del self._chat_admins[chat_id]
 
-        for group_name in groups_to_remove:
-            del self.group_chat_id[group_name]
-            logging.info(f"Чат '{group_name}' был удалён из group_chat_id из-за отсутствия доступа.")
+            allowed_users = set().union(*(admin_ids for admin_ids, _ in self._chat_admins.values()))
+            # Неудачный запрос оставляет в кэше последний известный список чата. Чаты, для которых
+            # список ещё ни разу не получен (например, нет сети при запуске), неизвестны: пока они
+            # есть, текущий (сохранённый) список только дополняется, иначе все потеряли бы доступ
+            if any(chat_id not in self._chat_admins for chat_id in registered_ids):
+                allowed_users |= self.allowed_users
+            admins_changed = allowed_users != self.allowed_users
+            self.allowed_users = allowed_users
 
-        # Сохранение изменений
-        self.chat_manager.save_chat_ids_to_file()
-        self.chat_manager.save_admins_ids_to_file(self.allowed_users.union(self.password_users))
+            # Сохраняем только реальные изменения
+            if chats_changed:
+                self.chat_manager.save_chat_ids_to_file()
+            if admins_changed:
+                self.chat_manager.save_admins_ids_to_file(self.allowed_users.union(self.password_users))
 
-        logging.info("Обновление администраторов завершено.")
-        logging.debug(f"Текущие group_chat_id: {self.group_chat_id}")
-        logging.debug(f"Текущие allowed_users: {self.allowed_users}")
\ No newline at end of file
+            logger.info("Обновление администраторов завершено.")
+            logger.debug("Текущие group_chat_id: %s", self.group_chat_id)
+            logger.debug("Текущие allowed_users: %s", self.allowed_users)
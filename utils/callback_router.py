@@ -0,0 +1,177 @@
+import logging
+import time
+
+from telegram.ext import CallbackQueryHandler
+
+logger = logging.getLogger(__name__)
+
+
+class RouteStats:
+    __slots__ = ('hits', 'errors', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.hits = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, failed=False):
+        self.hits += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
+class Route:
+    __slots__ = ('key', 'prefix', 'parse', 'handlers')
+
+    def __init__(self, key, prefix, parse):
+        self.key = key
+        self.prefix = prefix  # True — key является префиксом callback_data
+        self.parse = parse  # Разбор остатка callback_data после префикса (int, str...) или None
+        self.handlers = {}  # область -> обработчик
+
+
+class CallbackRouter:
+    """
+    Единая таблица маршрутов для callback_data кнопок.
+
+    Точные значения ищутся в словаре, префиксы — в префиксном дереве по
+    самому длинному совпадению, поэтому разбор не зависит от числа маршрутов
+    и их порядка ('select_all_groups' не перехватывается префиксом 'select_').
+    Обработчики регистрируются по областям: 'global' — общий обработчик
+    кнопок вне диалогов, остальные области — состояния ConversationHandler,
+    которые получают CallbackQueryHandler через handler(). Для каждого
+    маршрута считаются число вызовов, ошибки и время обработки.
+    """
+
+    GLOBAL = 'global'
+
+    def __init__(self):
+        self._exact = {}  # callback_data -> Route
+        self._trie = {}  # символ -> узел; маршрут префикса хранится в узле под ключом None
+        self._fallback = None
+        self.stats = {}  # (область, ключ маршрута) -> RouteStats
+
+    def add(self, key, handler, prefix=False, parse=None, scope=GLOBAL):
+        """
+        Регистрирует обработчик маршрута в области. Обработчик вызывается как
+        handler(update, context) или, если задан parse, как
+        handler(update, context, payload), где payload = parse(остаток данных).
+        """
+        route = self._get_route(key, prefix)
+        if route is None:
+            route = Route(key, prefix, parse)
+            if prefix:
+                node = self._trie
+                for char in key:
+                    node = node.setdefault(char, {})
+                node[None] = route
+            else:
+                self._exact[key] = route
+        elif parse is not None:
+            route.parse = parse
+        if scope in route.handlers:
+            raise ValueError(f"Маршрут '{key}' уже зарегистрирован в области '{scope}'")
+        route.handlers[scope] = handler
+        return route
+
+    def set_fallback(self, handler):
+        """Обработчик для callback_data без маршрута (вызывается в глобальной области)."""
+        self._fallback = handler
+
+    def _get_route(self, key, prefix):
+        if not prefix:
+            return self._exact.get(key)
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get(None)
+
+    def resolve(self, data, scope=None):
+        """
+        Маршрут для callback_data: точное совпадение или самый длинный префикс.
+        Если задана область, учитываются только маршруты с обработчиком в ней:
+        'select_chat_...' вне диалога инвентаризации ведёт к 'select_', а не
+        к более длинному префиксу диалога.
+        """
+        route = self._exact.get(data)
+        if route is not None and (scope is None or scope in route.handlers):
+            return route
+        route = None
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            candidate = node.get(None)
+            if candidate is not None and (scope is None or scope in candidate.handlers):
+                route = candidate
+        return route
+
+    async def dispatch(self, update, context, scope=GLOBAL, route=None):
+        """Вызывает обработчик маршрута в области. Возвращает результат обработчика."""
+        data = update.callback_query.data or ''
+        route = route or self.resolve(data, scope)
+        handler = route.handlers.get(scope) if route is not None else None
+        if handler is None:
+            if scope == self.GLOBAL and self._fallback is not None:
+                return await self._timed(scope, None, self._fallback, update, context)
+            owner = ', '.join(route.handlers) if route is not None else 'нет'
+            logger.debug("Нет обработчика для '%s' в области '%s' (маршрут обслуживают: %s).", data, scope, owner)
+            return None
+
+        if route.parse is None:
+            return await self._timed(scope, route.key, handler, update, context)
+        try:
+            payload = route.parse(data[len(route.key):])
+        except (TypeError, ValueError) as e:
+            logger.warning("Некорректные данные кнопки '%s': %s", data, e)
+            return None
+        return await self._timed(scope, route.key, handler, update, context, payload)
+
+    async def _timed(self, scope, key, handler, *args):
+        stats = self.stats.get((scope, key))
+        if stats is None:
+            stats = self.stats[(scope, key)] = RouteStats()
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await handler(*args)
+            failed = False
+            return result
+        finally:
+            stats.record(time.perf_counter() - start, failed)
+
+    def handler(self, scope, *keys):
+        """
+        CallbackQueryHandler для состояния ConversationHandler: принимает только
+        callback_data, ведущие к перечисленным маршрутам (ключам точных или
+        префиксных маршрутов), и вызывает их обработчики из области scope.
+        """
+        routes = [self._get_route(key, False) or self._get_route(key, True) for key in keys]
+        missing = [key for key, route in zip(keys, routes) if route is None or scope not in route.handlers]
+        if missing:
+            raise ValueError(f"В области '{scope}' нет маршрутов: {', '.join(missing)}")
+        allowed = {id(route) for route in routes}
+
+        def matches(data):
+            route = self.resolve(data, scope) if isinstance(data, str) else None
+            return route is not None and id(route) in allowed
+
+        async def callback(update, context):
+            return await self.dispatch(update, context, scope)
+
+        callback.__qualname__ = f"CallbackRouter[{scope}]"  # Имя в метриках и логах обработчиков
+        return CallbackQueryHandler(callback, pattern=matches)
+
+    def format_stats(self):
+        """Сводка по маршрутам: вызовы, ошибки, среднее и максимальное время."""
+        lines = []
+        for (scope, key), stats in sorted(self.stats.items(), key=lambda item: -item[1].hits):
+            average = stats.total_time / stats.hits * 1e3 if stats.hits else 0.0
+            lines.append(f"{scope}:{key or '*'} — {stats.hits} вызовов, ошибок {stats.errors}, "
+                         f"среднее {average:.1f} мс, максимум {stats.max_time * 1e3:.1f} мс")
+        return '\n'.join(lines)
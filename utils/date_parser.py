@@ -2,36 +2,38 @@ import logging
 import re
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 
 def parse_event_input(input_text):
-    logging.debug(f"Входные данные для парсинга: {input_text}")
+    logger.debug("Входные данные для парсинга: %s", input_text)
     current_date = datetime.now()
     current_year = current_date.year
 
     # Регулярное выражение для формата 'день.месяц часы:минуты' и 'день часы:минуты'
     match = re.match(r'(\d{1,2})(?:\.(\d{1,2}))? (\d{1,2}:\d{2})', input_text)
     if not match:
-        logging.error("Ошибка: Неверный формат ввода.")
+        logger.error("Ошибка: Неверный формат ввода.")
         raise ValueError("Неверный формат ввода. Используйте: DD или DD.MM HH:MM описание.")
 
     # Извлечение части строки, соответствующей дате и времени
     day, month, time_str = match.groups()
     month = int(month) if month else current_date.month
 
-    logging.debug(f"День: {day}, Месяц: {month}, Время: {time_str}")
+    logger.debug("День: %s, Месяц: %s, Время: %s", day, month, time_str)
 
     try:
         # Форматирование даты
         date_str = f"{current_year}-{month:02d}-{int(day):02d}"
     except ValueError:
-        logging.error("Ошибка: Неверный формат даты.")
+        logger.error("Ошибка: Неверный формат даты.")
         raise ValueError("Неверный формат даты.")
 
     # Извлечение описания
     remaining_text = input_text[match.end():].strip()
     if not remaining_text:
-        logging.error("Ошибка: Описание события не может быть пустым.")
+        logger.error("Ошибка: Описание события не может быть пустым.")
         raise ValueError("Описание не может быть пустым.")
 
     
@@ -41,7 +43,7 @@ def parse_event_input(input_text):
         'description': remaining_text
     }
     
-    logging.debug(f"Успешно распарсенные данные: {parsed_data}")
+    logger.debug("Успешно распарсенные данные: %s", parsed_data)
 
     return parsed_data
 
@@ -49,8 +51,9 @@ def calculate_delay(event_datetime_str):
     event_datetime = datetime.strptime(event_datetime_str, '%Y-%m-%d %H:%M')
     current_datetime = datetime.now()
     delay = (event_datetime - current_datetime).total_seconds()
-    logging.debug(f"Текущее время: {current_datetime}, Время события: {event_datetime}, Вычисленная задержка: {delay} сек.")
+    logger.debug("Текущее время: %s, Время события: %s, Вычисленная задержка: %s сек.",
+                 current_datetime, event_datetime, delay)
     if delay < 0:
-        logging.error("Ошибка: Время события должно быть в будущем.")
+        logger.error("Ошибка: Время события должно быть в будущем.")
         raise ValueError("Время события должно быть в будущем.")
     return delay
\ No newline at end of file
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+
+from utils.metrics import REGISTRY
+
+JSON_SECONDS = REGISTRY.histogram('json_file_seconds', "Чтение и запись JSON-файлов", ('operation', 'file'))
+
+
+def atomic_write_json(file_path, data, **dump_kwargs):
+    """
+    Атомарно записывает данные в JSON-файл.
+
+    Данные сначала пишутся во временный файл в той же директории,
+    затем он подменяет целевой файл через os.replace, поэтому при сбое
+    на диске остаётся либо старая, либо новая версия целиком.
+    """
+    with JSON_SECONDS.time(operation='save', file=os.path.basename(file_path)):
+        _write_json(file_path, data, dump_kwargs)
+
+
+def _write_json(file_path, data, dump_kwargs):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def copy_json_tree(value):
+    """
+    Быстрая копия JSON-подобных данных (вложенные dict/list/set).
+
+    Дешевле copy.deepcopy: не ведёт memo-словарь и не копирует скаляры.
+    Используется для снимков перед записью в фоновом потоке.
+    """
+    if isinstance(value, dict):
+        return {key: copy_json_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json_tree(item) for item in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
@@ -0,0 +1,86 @@
+import itertools
+
+# Версии общие для всех филиалов: новый объект счётчиков никогда не повторит старую версию
+_versions = itertools.count(1)
+
+
+class InventoryFillStatus:
+    """
+    Счётчики заполненности инвентаря одного филиала.
+
+    Для каждого товара и каждой категории хранится число незаполненных опций
+    (сырьё/полуфабрикат), для инвентаря — число незаполненных категорий.
+    Счётчики строятся один раз за проход по инвентарю и дальше обновляются
+    при каждом изменении опции, поэтому проверки заполненности стоят O(1).
+    version меняется при каждой смене статуса опции — по ней кэшируются
+    клавиатуры категорий и товаров.
+    """
+
+    def __init__(self, inventory):
+        self.rebuild(inventory)
+
+    def rebuild(self, inventory):
+        """Пересчитывает счётчики полным проходом по инвентарю."""
+        self.version = next(_versions)
+        self._unfilled_by_item = {}  # category -> {item: число незаполненных опций}
+        self._unfilled_by_category = {}  # category -> число незаполненных опций
+        self._unfilled_categories = 0
+        self.total_options = 0
+        self.filled_options = 0
+
+        for category, items in inventory.items():
+            if not isinstance(items, dict):
+                continue
+            item_counts = {}
+            category_unfilled = 0
+            for item, options in items.items():
+                if not isinstance(options, dict):
+                    continue
+                unfilled = 0
+                for option in options.values():
+                    if not isinstance(option, dict):
+                        continue
+                    self.total_options += 1
+                    if option.get('filled', False):
+                        self.filled_options += 1
+                    else:
+                        unfilled += 1
+                item_counts[item] = unfilled
+                category_unfilled += unfilled
+            self._unfilled_by_item[category] = item_counts
+            self._unfilled_by_category[category] = category_unfilled
+            if category_unfilled:
+                self._unfilled_categories += 1
+
+    def update(self, category, item, was_filled, is_filled):
+        """Учитывает смену статуса одной опции товара."""
+        if was_filled == is_filled:
+            return
+        item_counts = self._unfilled_by_item.get(category)
+        if item_counts is None or item not in item_counts:
+            return
+
+        self.version = next(_versions)
+        delta = -1 if is_filled else 1
+        item_counts[item] += delta
+        self.filled_options -= delta
+
+        before = self._unfilled_by_category[category]
+        after = before + delta
+        self._unfilled_by_category[category] = after
+        if before == 0 and after > 0:
+            self._unfilled_categories += 1
+        elif before > 0 and after == 0:
+            self._unfilled_categories -= 1
+
+    def is_item_filled(self, category, item):
+        return self._unfilled_by_item.get(category, {}).get(item, 0) == 0
+
+    def is_category_filled(self, category):
+        return self._unfilled_by_category.get(category, 0) == 0
+
+    def is_complete(self):
+        return self._unfilled_categories == 0
+
+    def unfilled_in_category(self, category):
+        return self._unfilled_by_category.get(category, 0)
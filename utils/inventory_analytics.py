@@ -0,0 +1,180 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryAnalytics:
+    """
+    Сводная аналитика инвентаризации по всем филиалам.
+
+    Инвентари филиалов (CompactInventory) складываются в матрицу
+    филиал × слот каталога: количества float64, маска заданных количеств
+    (в CompactInventory не заданное количество — NaN, в матрице — 0)
+    и маска заполненности. Все сводки считаются векторными операциями NumPy
+    по матрице. Слоты одной категории в каталоге идут подряд, поэтому суммы
+    по категориям — одна операция np.add.reduceat.
+    """
+
+    def __init__(self, catalog, branches):
+        import numpy as np  # Импорт только при построении аналитики: NumPy заметно замедляет запуск бота
+
+        self.np = np
+        self.catalog = catalog
+        self.branch_ids = list(branches)
+        size = catalog.size
+        self.quantities = np.empty((len(self.branch_ids), size), dtype=np.float64)
+        self.known = np.empty((len(self.branch_ids), size), dtype=bool)
+        self.filled = np.empty((len(self.branch_ids), size), dtype=bool)
+        for row, compact in enumerate(branches.values()):
+            quantities = self.quantities[row]
+            quantities[:] = np.frombuffer(compact.quantities, dtype=np.float64)
+            np.isnan(quantities, out=self.known[row])
+            quantities[self.known[row]] = 0.0
+            np.logical_not(self.known[row], out=self.known[row])
+            bits = np.frombuffer(compact.filled, dtype=np.uint8)
+            self.filled[row] = np.unpackbits(bits, count=size, bitorder='little').view(bool)
+
+        self.categories = list(catalog.layout)
+        self._category_starts = []
+        for category in self.categories:
+            slots = catalog.category_slots(category)
+            self._category_starts.append(slots[0] if slots else size)
+        logger.debug("Аналитика инвентаризации: %s филиалов × %s слотов.", len(self.branch_ids), size)
+
+    def totals(self):
+        """Сумма количеств по всем филиалам для каждого слота."""
+        return self.quantities.sum(axis=0)
+
+    def item_total(self, category, item, item_type=None):
+        """Сумма по всем филиалам для товара (всех типов или одного типа); None, если товара нет."""
+        slots = self.catalog.item_slots(category, item) if item_type is None else \
+            [self.catalog.slot(category, item, item_type)]
+        if not slots or None in slots:
+            return None
+        return float(self.quantities[:, slots].sum())
+
+    def category_totals(self):
+        """Сумма количеств по категориям: {категория: сумма по всем филиалам}."""
+        np = self.np
+        if not self.branch_ids or not self.categories:
+            return {category: 0.0 for category in self.categories}
+        per_slot = self.totals()
+        # Пустые категории (начало == размер) reduceat не принимает: считаем их отдельно
+        valid = [(category, start) for category, start in zip(self.categories, self._category_starts)
+                 if start < self.catalog.size]
+        sums = np.add.reduceat(per_slot, [start for _, start in valid]) if valid else []
+        result = {category: 0.0 for category in self.categories}
+        result.update((category, float(total)) for (category, _), total in zip(valid, sums))
+        return result
+
+    def fill_rates(self):
+        """Доля заполненных позиций по филиалам: {chat_id: 0..1}."""
+        if not self.catalog.size:
+            return {chat_id: 1.0 for chat_id in self.branch_ids}
+        rates = self.filled.mean(axis=1)
+        return dict(zip(self.branch_ids, rates.tolist()))
+
+    def missing_counts(self):
+        """Число незаполненных позиций по филиалам: {chat_id: количество}."""
+        return dict(zip(self.branch_ids, (~self.filled).sum(axis=1).tolist()))
+
+    def branches_missing(self, category, item, item_type=None):
+        """Филиалы, у которых товар (любой из типов или указанный тип) не заполнен."""
+        slots = self.catalog.item_slots(category, item) if item_type is None else \
+            [self.catalog.slot(category, item, item_type)]
+        if not slots or None in slots:
+            return []
+        missing = ~self.filled[:, slots].all(axis=1)
+        return [self.branch_ids[row] for row in self.np.flatnonzero(missing)]
+
+    def outliers(self, threshold=3.0, limit=20):
+        """
+        Позиции, где количество филиала отклоняется от среднего по филиалам
+        больше чем на threshold стандартных отклонений. Возвращает список
+        (chat_id, (категория, товар, тип), количество, z), по убыванию |z|.
+        """
+        np = self.np
+        if len(self.branch_ids) < 2:
+            return []
+        # Среднее и отклонение только по заданным количествам; позиции без разброса дают z = 0
+        known = self.known
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.quantities.sum(axis=0) / known.sum(axis=0)
+            z = self.quantities - mean
+            z[~known] = 0.0
+            std = np.sqrt(np.einsum('ij,ij->j', z, z) / known.sum(axis=0))
+            z /= std
+        z[~np.isfinite(z)] = 0.0
+        magnitude = np.abs(z)
+        candidates = np.flatnonzero(magnitude.ravel() > threshold)
+        if candidates.size > limit:
+            top = np.argpartition(magnitude.ravel()[candidates], -limit)[-limit:]
+            candidates = candidates[top]
+        rows, slots = np.unravel_index(candidates, z.shape)
+        result = [
+            (self.branch_ids[row], self.catalog.slots[slot], float(self.quantities[row, slot]), float(z[row, slot]))
+            for row, slot in zip(rows.tolist(), slots.tolist())
+        ]
+        result.sort(key=lambda entry: -abs(entry[3]))
+        return result
+
+    def ranking(self):
+        """Филиалы по убыванию доли заполненных позиций, при равенстве — по сумме количеств."""
+        np = self.np
+        if not self.branch_ids:
+            return []
+        rates = self.filled.mean(axis=1) if self.catalog.size else np.ones(len(self.branch_ids))
+        totals = self.quantities.sum(axis=1)
+        order = np.lexsort((-totals, -rates))
+        return [(self.branch_ids[row], float(rates[row]), float(totals[row])) for row in order.tolist()]
+
+    def summary(self, chat_name=None, top=5):
+        """Текстовая сводка для администратора."""
+        chat_name = chat_name or (lambda chat_id: chat_id)
+        if not self.branch_ids:
+            return "Нет инвентаризаций филиалов."
+        ranking = self.ranking()
+        average = sum(rate for _, rate, _ in ranking) / len(ranking)
+        lines = [f"Филиалов: {len(self.branch_ids)}, позиций: {self.catalog.size}, "
+                 f"средняя заполненность: {average:.0%}"]
+
+        lines.append("Лучшие филиалы:")
+        lines.extend(f"  {chat_name(chat_id)} — {rate:.0%}" for chat_id, rate, _ in ranking[:top])
+        lagging = [entry for entry in reversed(ranking) if entry[1] < 1.0][:top]
+        if lagging:
+            missing = self.missing_counts()
+            lines.append("Отстающие филиалы:")
+            lines.extend(f"  {chat_name(chat_id)} — {rate:.0%}, не заполнено позиций: {missing[chat_id]}"
+                         for chat_id, rate, _ in lagging)
+
+        category_totals = sorted(self.category_totals().items(), key=lambda entry: -entry[1])
+        lines.append("Итого по категориям:")
+        lines.extend(f"  {category}: {total:g}" for category, total in category_totals[:top])
+
+        outliers = self.outliers(limit=top)
+        if outliers:
+            lines.append("Выбросы:")
+            lines.extend(f"  {chat_name(chat_id)}: {item} ({item_type}) = {quantity:g}, z = {z:.1f}"
+                         for chat_id, (_, item, item_type), quantity, z in outliers)
+        return '\n'.join(lines)
+
+    def item_report(self, query, chat_name=None, limit=10):
+        """Итоги по товарам, в названии которых есть query, и филиалы, где они не заполнены."""
+        chat_name = chat_name or (lambda chat_id: chat_id)
+        needle = query.casefold()
+        lines = []
+        for category, items in self.catalog.layout.items():
+            for item in items:
+                if needle not in item.casefold():
+                    continue
+                parts = ', '.join(f"{item_type}: {self.item_total(category, item, item_type):g}"
+                                  for item_type in items[item])
+                lines.append(f"{item} ({category}) — всего {self.item_total(category, item):g} ({parts})")
+                missing = self.branches_missing(category, item)
+                if missing:
+                    names = ', '.join(str(chat_name(chat_id)) for chat_id in missing[:limit])
+                    more = f" и ещё {len(missing) - limit}" if len(missing) > limit else ""
+                    lines.append(f"  не заполнено в {len(missing)} филиалах: {names}{more}")
+                if len(lines) >= 4 * limit:
+                    return '\n'.join(lines)
+        return '\n'.join(lines) or f"Товары по запросу '{query}' не найдены."
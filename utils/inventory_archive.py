@@ -0,0 +1,250 @@
+import calendar
+import json
+import logging
+import math
+import os
+import re
+import struct
+from array import array
+from datetime import date, timedelta
+
+from utils.file_utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+_MONTH_FILE = re.compile(r'^(\d{4})-(\d{2})\.rows$')
+
+
+def _quantity(value):
+    if value != value:  # NaN — количество не задано или снимка за день нет
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class InventoryArchive:
+    """
+    Архив ежедневных снимков инвентаризации в колоночном двоичном формате.
+
+    Для каждого филиала данные лежат по месяцам в каталоге архива:
+      * <chat_id>/YYYY-MM.rows — снимки текущего месяца, по строке на день
+        (заголовок: день, число колонок; дальше float64 по колонкам). Снимок
+        дописывается в конец файла, поэтому стоит одну запись;
+      * <chat_id>/YYYY-MM.cols — закрытый месяц, транспонированный по колонкам:
+        для каждой позиции подряд лежат значения за все дни месяца,
+        перед ними — маска дней, за которые есть снимок.
+
+    Колонки — позиции (категория, товар, тип) в порядке первого появления;
+    список хранится в columns.json и только дополняется, поэтому номера
+    колонок не меняются при правке шаблона. Запрос по одной позиции
+    за N дней читает по одному блоку на закрытый месяц и по 8 байт на день
+    текущего месяца, не загружая остальную историю.
+    """
+
+    ROW_HEADER = struct.Struct('<II')  # день (date.toordinal()), число колонок
+    COLUMN_HEADER = struct.Struct('<4sHBBI')  # сигнатура, год, месяц, дней в месяце, число колонок
+    MAGIC = b'INVC'
+    VALUE_SIZE = 8
+
+    def __init__(self, directory='inventory_archive'):
+        self.directory = directory
+        self.columns_path = os.path.join(directory, 'columns.json')
+        self.columns = []  # номер колонки -> (категория, товар, тип)
+        self._column_index = {}
+        self._mapping = (None, None)  # (каталог, номера колонок по слотам каталога)
+        if os.path.exists(self.columns_path):
+            with open(self.columns_path, 'r', encoding='utf-8') as f:
+                for key in json.load(f):
+                    self._add_column(tuple(key))
+            logger.info("Архив инвентаризации: %s колонок в %s", len(self.columns), directory)
+
+    def _add_column(self, key):
+        self._column_index[key] = len(self.columns)
+        self.columns.append(key)
+
+    def _column_map(self, catalog):
+        """Номера колонок архива для слотов каталога; новые позиции добавляются в columns.json."""
+        cached_catalog, mapping = self._mapping
+        if cached_catalog is catalog:
+            return mapping
+        added = [key for key in catalog.slots if key not in self._column_index]
+        for key in added:
+            self._add_column(key)
+        if added:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write_json(self.columns_path, [list(key) for key in self.columns], ensure_ascii=False)
+            logger.info("В архив инвентаризации добавлено колонок: %s", len(added))
+        mapping = [self._column_index[key] for key in catalog.slots]
+        if mapping == list(range(len(mapping))) and len(mapping) == len(self.columns):
+            mapping = None  # Порядок колонок совпадает со слотами: строка пишется без перестановки
+        self._mapping = (catalog, mapping)
+        return mapping
+
+    def _month_path(self, chat_id, year, month, kind):
+        return os.path.join(self.directory, str(chat_id), f"{year:04d}-{month:02d}.{kind}")
+
+    def write_snapshot(self, day, catalog, branches):
+        """
+        Дописывает снимок дня для филиалов branches (chat_id -> CompactInventory).
+        Перед записью закрытые месяцы филиала переводятся в колоночный формат.
+        Вызывается в потоке: branches должны быть копиями.
+        """
+        mapping = self._column_map(catalog)
+        width = len(self.columns)
+        header = self.ROW_HEADER.pack(day.toordinal(), width)
+        for chat_id, compact in branches.items():
+            if mapping is None:
+                values = compact.quantities
+            else:
+                values = array('d', [math.nan]) * width
+                for slot, column in enumerate(mapping):
+                    values[column] = compact.quantities[slot]
+
+            os.makedirs(os.path.join(self.directory, str(chat_id)), exist_ok=True)
+            self.compact_closed_months(chat_id, day)
+            rows_path = self._month_path(chat_id, day.year, day.month, 'rows')
+            if os.path.exists(rows_path):
+                self._truncate_partial_record(rows_path)
+            with open(rows_path, 'ab') as f:
+                f.write(header + values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        logger.debug("Снимок инвентаризации за %s записан: %s филиалов, %s колонок.", day, len(branches), width)
+
+    def compact_closed_months(self, chat_id, today):
+        """Переводит строки месяцев до текущего в колоночный формат."""
+        branch_dir = os.path.join(self.directory, str(chat_id))
+        for name in os.listdir(branch_dir):
+            match = _MONTH_FILE.match(name)
+            if match and (int(match[1]), int(match[2])) < (today.year, today.month):
+                self.compact_month(chat_id, int(match[1]), int(match[2]))
+
+    def compact_month(self, chat_id, year, month):
+        import numpy as np  # Транспонирование месяца — раз в месяц на филиал; NumPy не нужен при запуске
+
+        rows_path = self._month_path(chat_id, year, month, 'rows')
+        cols_path = self._month_path(chat_id, year, month, 'cols')
+        days = calendar.monthrange(year, month)[1]
+        records = list(self._read_rows(rows_path))
+        width = max([len(self.columns)] + [len(values) for _, values in records])
+
+        matrix = np.full((days, width), np.nan)
+        present = np.zeros(days, dtype=np.uint8)
+        if os.path.exists(cols_path):
+            # Месяц уже уплотнялся (например, снимок задним числом): сохраняем прежние дни
+            old_present, old_width, old_columns = self._read_column_block(cols_path)
+            matrix[:, :old_width] = old_columns.T
+            present[:] = old_present
+        first = date(year, month, 1).toordinal()
+        for ordinal, values in records:  # Более поздний снимок за тот же день заменяет ранний
+            matrix[ordinal - first, :len(values)] = values
+            present[ordinal - first] = 1
+
+        tmp_path = cols_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.COLUMN_HEADER.pack(self.MAGIC, year, month, days, width))
+            f.write(present.tobytes())
+            f.write(np.ascontiguousarray(matrix.T).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, cols_path)
+        os.remove(rows_path)
+        logger.info("Архив филиала %s за %04d-%02d переведён в колоночный формат.", chat_id, year, month)
+
+    def _truncate_partial_record(self, rows_path):
+        """Обрезает недописанную запись после сбоя, чтобы следующий снимок начался с границы записи."""
+        size = os.path.getsize(rows_path)
+        end = 0
+        with open(rows_path, 'rb') as f:
+            while end + self.ROW_HEADER.size <= size:
+                f.seek(end)
+                _, width = self.ROW_HEADER.unpack(f.read(self.ROW_HEADER.size))
+                record_end = end + self.ROW_HEADER.size + width * self.VALUE_SIZE
+                if record_end > size:
+                    break
+                end = record_end
+        if end < size:
+            logger.warning("Недописанная запись архива в %s обрезана (%s байт).", rows_path, size - end)
+            os.truncate(rows_path, end)
+
+    def _read_rows(self, rows_path):
+        """Записи файла строк: (день, array значений). Недописанная последняя запись пропускается."""
+        with open(rows_path, 'rb') as f:
+            while True:
+                header = f.read(self.ROW_HEADER.size)
+                if len(header) < self.ROW_HEADER.size:
+                    return
+                ordinal, width = self.ROW_HEADER.unpack(header)
+                data = f.read(width * self.VALUE_SIZE)
+                if len(data) < width * self.VALUE_SIZE:
+                    logger.warning("Пропущена недописанная запись архива в %s.", rows_path)
+                    return
+                values = array('d')
+                values.frombytes(data)
+                yield ordinal, values
+
+    def _read_column_block(self, cols_path):
+        import numpy as np
+
+        with open(cols_path, 'rb') as f:
+            _, _, _, days, width = self.COLUMN_HEADER.unpack(f.read(self.COLUMN_HEADER.size))
+            present = np.frombuffer(f.read(days), dtype=np.uint8)
+            columns = np.frombuffer(f.read(), dtype=np.float64).reshape(width, days)
+        return present, width, columns
+
+    def history(self, chat_id, category, item, item_type, days=90, end=None):
+        """Значения позиции филиала за последние days дней по end включительно: [(дата, количество)]."""
+        column = self._column_index.get((category, item, item_type))
+        if column is None:
+            return []
+        end = end or date.today()
+        start = end - timedelta(days=days - 1)
+
+        values = {}
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            cols_path = self._month_path(chat_id, year, month, 'cols')
+            rows_path = self._month_path(chat_id, year, month, 'rows')
+            if os.path.exists(cols_path):
+                values.update(self._read_column(cols_path, column))
+            if os.path.exists(rows_path):
+                values.update(self._scan_rows(rows_path, column))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        first, last = start.toordinal(), end.toordinal()
+        return [(date.fromordinal(ordinal), _quantity(value))
+                for ordinal, value in sorted(values.items()) if first <= ordinal <= last]
+
+    def _read_column(self, cols_path, column):
+        """Значения одной колонки закрытого месяца: {день: значение} (один блок чтения)."""
+        with open(cols_path, 'rb') as f:
+            _, year, month, days, width = self.COLUMN_HEADER.unpack(f.read(self.COLUMN_HEADER.size))
+            if column >= width:
+                return {}
+            present = f.read(days)
+            f.seek(self.COLUMN_HEADER.size + days + column * days * self.VALUE_SIZE)
+            values = array('d')
+            values.frombytes(f.read(days * self.VALUE_SIZE))
+        first = date(year, month, 1).toordinal()
+        return {first + day: values[day] for day in range(days) if present[day]}
+
+    def _scan_rows(self, rows_path, column):
+        """Значения одной колонки текущего месяца: по 8 байт из каждой записи."""
+        result = {}
+        offset = column * self.VALUE_SIZE
+        with open(rows_path, 'rb') as f:
+            while True:
+                header = f.read(self.ROW_HEADER.size)
+                if len(header) < self.ROW_HEADER.size:
+                    break
+                ordinal, width = self.ROW_HEADER.unpack(header)
+                record_end = f.tell() + width * self.VALUE_SIZE
+                if column < width:
+                    f.seek(offset, os.SEEK_CUR)
+                    data = f.read(self.VALUE_SIZE)
+                    if len(data) < self.VALUE_SIZE:
+                        break
+                    value = array('d')
+                    value.frombytes(data)
+                    result[ordinal] = value[0]
+                f.seek(record_end)
+        return result
@@ -0,0 +1,244 @@
+import logging
+import math
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+logger = logging.getLogger(__name__)
+
+_NONE = math.nan  # quantity = None хранится как NaN
+
+
+def _to_float(quantity):
+    return _NONE if quantity is None else float(quantity)
+
+
+def _to_quantity(value):
+    if value != value:  # NaN
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class InventoryCatalog:
+    """
+    Скомпилированный шаблон инвентаризации.
+
+    Каждой позиции (категория, товар, тип) шаблона присваивается плотный
+    номер слота в порядке обхода шаблона, поэтому инвентарь филиала
+    умещается в два плоских массива: количества array('d') и битовую
+    маску заполненности. Номера слотов стабильны, пока не меняется шаблон,
+    и общие для всех филиалов — по ним же строятся матрица филиалов
+    и архив снимков.
+    """
+
+    def __init__(self, template):
+        self.slots = []  # номер слота -> (категория, товар, тип)
+        self.index = {}  # (категория, товар, тип) -> номер слота
+        self.layout = {}  # категория -> {товар: {тип: номер слота}}
+        quantities = array('d')
+        filled = []
+
+        for category, items in template.items():
+            if not isinstance(items, dict):
+                continue
+            category_layout = self.layout.setdefault(category, {})
+            for item, options in items.items():
+                if not isinstance(options, dict):
+                    continue
+                item_layout = category_layout.setdefault(item, {})
+                for item_type, option in options.items():
+                    if not isinstance(option, dict):
+                        continue
+                    slot = len(self.slots)
+                    self.slots.append((category, item, item_type))
+                    self.index[(category, item, item_type)] = slot
+                    item_layout[item_type] = slot
+                    quantities.append(_to_float(option.get('quantity')))
+                    filled.append(bool(option.get('filled', False)))
+
+        self.size = len(self.slots)
+        self._template = CompactInventory(self, quantities, _pack_bits(filled))
+        self._zeros = array('d', bytes(8 * self.size))
+        logger.debug("Каталог инвентаризации: %s категорий, %s слотов.", len(self.layout), self.size)
+
+    def slot(self, category, item, item_type):
+        """Номер слота позиции или None, если позиции нет в шаблоне."""
+        return self.index.get((category, item, item_type))
+
+    def item_slots(self, category, item):
+        """Номера слотов всех типов товара."""
+        return list(self.layout.get(category, {}).get(item, {}).values())
+
+    def category_slots(self, category):
+        """Номера слотов всех позиций категории."""
+        return [slot for options in self.layout.get(category, {}).values() for slot in options.values()]
+
+    def new_inventory(self):
+        """Компактный инвентарь нового филиала (копия шаблона)."""
+        return self._template.copy()
+
+    def new_inventory_dict(self):
+        """Инвентарь нового филиала во вложенных словарях — замена copy.deepcopy(шаблон)."""
+        return self._template.to_dict()
+
+    def compact(self, inventory):
+        """
+        Компактный снимок инвентаря во вложенных словарях. Обходится раскладка
+        каталога, а не инвентарь: позиции, которых нет в шаблоне, не переносятся,
+        отсутствующие в инвентаре берутся из шаблона.
+        """
+        compact = self.new_inventory()
+        quantities = compact.quantities
+        filled = compact.filled
+        for category, items_layout in self.layout.items():
+            items = inventory.get(category)
+            if not isinstance(items, dict):
+                continue
+            for item, options_layout in items_layout.items():
+                options = items.get(item)
+                if not isinstance(options, dict):
+                    continue
+                for item_type, slot in options_layout.items():
+                    option = options.get(item_type)
+                    if not isinstance(option, dict):
+                        continue
+                    quantity = option.get('quantity')
+                    quantities[slot] = _NONE if quantity is None else float(quantity)
+                    if option.get('filled', False):
+                        filled[slot >> 3] |= 1 << (slot & 7)
+                    else:
+                        filled[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+        return compact
+
+
+def _pack_bits(flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for slot, flag in enumerate(flags):
+        if flag:
+            bits[slot >> 3] |= 1 << (slot & 7)
+    return bits
+
+
+class CompactInventory:
+    """
+    Инвентарь одного филиала в плоских массивах по слотам InventoryCatalog.
+
+    quantities — array('d') (None хранится как NaN), filled — битовая маска
+    в bytearray. Копия и сброс — копирование двух буферов вместо обхода
+    вложенных словарей; view() даёт прежний интерфейс
+    инвентарь[категория][товар][тип]['quantity'] поверх массивов.
+
+    Основным хранилищем бота этот формат не стал: рабочее состояние филиала
+    остаётся во вложенных словарях (журнал, хранилища, экспорт, обработчики).
+    CompactInventory — снимок, который InventoryCatalog.compact() строит по
+    запросу для аналитики и архива; постоянно в памяти он не хранится.
+    """
+
+    __slots__ = ('catalog', 'quantities', 'filled')
+
+    def __init__(self, catalog, quantities, filled):
+        self.catalog = catalog
+        self.quantities = quantities
+        self.filled = filled
+
+    def copy(self):
+        return CompactInventory(self.catalog, array('d', self.quantities), bytearray(self.filled))
+
+    def clear(self):
+        """Обнуляет все количества и снимает отметки заполненности."""
+        self.quantities[:] = self.catalog._zeros
+        self.filled[:] = bytes(len(self.filled))
+
+    def get_quantity(self, slot):
+        return _to_quantity(self.quantities[slot])
+
+    def is_filled(self, slot):
+        return bool(self.filled[slot >> 3] >> (slot & 7) & 1)
+
+    def set_filled(self, slot, filled):
+        if filled:
+            self.filled[slot >> 3] |= 1 << (slot & 7)
+        else:
+            self.filled[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def set_quantity(self, slot, quantity):
+        """Устанавливает количество и, как apply_quantity, отметку заполненности."""
+        self.quantities[slot] = _to_float(quantity)
+        self.set_filled(slot, quantity is not None and quantity > 0)
+
+    def filled_count(self):
+        return sum(bin(byte).count('1') for byte in self.filled)
+
+    @property
+    def nbytes(self):
+        return self.quantities.itemsize * len(self.quantities) + len(self.filled)
+
+    def to_dict(self):
+        """Инвентарь во вложенных словарях (формат inventory.json)."""
+        quantities = self.quantities
+        return {
+            category: {
+                item: {
+                    item_type: {'quantity': _to_quantity(quantities[slot]), 'filled': self.is_filled(slot)}
+                    for item_type, slot in options.items()
+                }
+                for item, options in items.items()
+            }
+            for category, items in self.catalog.layout.items()
+        }
+
+    def view(self):
+        """Отображение категория -> товар -> тип -> {'quantity', 'filled'} поверх массивов."""
+        return _NestedView(self, self.catalog.layout)
+
+
+class _NestedView(Mapping):
+    __slots__ = ('_inventory', '_layout')
+
+    def __init__(self, inventory, layout):
+        self._inventory = inventory
+        self._layout = layout
+
+    def __getitem__(self, key):
+        value = self._layout[key]
+        if isinstance(value, int):
+            return _OptionView(self._inventory, value)
+        return _NestedView(self._inventory, value)
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+
+class _OptionView(MutableMapping):
+    __slots__ = ('_inventory', '_slot')
+    _KEYS = ('quantity', 'filled')
+
+    def __init__(self, inventory, slot):
+        self._inventory = inventory
+        self._slot = slot
+
+    def __getitem__(self, key):
+        if key == 'quantity':
+            return self._inventory.get_quantity(self._slot)
+        if key == 'filled':
+            return self._inventory.is_filled(self._slot)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'quantity':
+            self._inventory.quantities[self._slot] = _to_float(value)
+        elif key == 'filled':
+            self._inventory.set_filled(self._slot, value)
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError("Поля позиции инвентаря нельзя удалить")
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
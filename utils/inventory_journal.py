@@ -0,0 +1,180 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+from utils.file_utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryJournal:
+    """
+    Журнал изменений инвентаризации (append-only, одна JSON-строка на изменение).
+
+    Каждое введённое количество дописывается в конец журнала, поэтому стоимость
+    записи не зависит от числа филиалов. Полный снимок в inventory.json
+    пишется только при уплотнении (compact), после чего журнал обнуляется.
+
+    Уплотнение можно разделить на две фазы: rotate() в момент снимка
+    откладывает текущий журнал в rotated_path, а finish_compaction() удаляет
+    его после записи снимка. Записи, сделанные между фазами, попадают уже
+    в новый журнал и не теряются.
+
+    append() только ставит строку в буфер; на диск буфер пишет flush(),
+    который вызывается в потоке PersistenceActor, — цикл событий не ждёт
+    записи и flush() на каждое введённое количество.
+    """
+
+    def __init__(self, journal_path, compact_threshold=1000):
+        self.journal_path = journal_path
+        base, ext = os.path.splitext(journal_path)
+        self.rotated_path = f"{base}.compacting{ext}"
+        self.compact_threshold = compact_threshold
+        self.entries_count = 0
+        self._file = None
+        self._pending = []  # Строки, ещё не записанные в файл
+        self._partial = False  # Прошлая запись прервалась: строка в файле может быть недописана
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self._file
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, chat_id, category, item, item_type, quantity):
+        """Ставит одно изменение количества в буфер журнала."""
+        entry = {
+            'chat_id': str(chat_id),
+            'category': category,
+            'item': item,
+            'item_type': item_type,
+            'quantity': quantity,
+            'ts': time.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._pending.append(line)
+        self.entries_count += 1
+
+    def has_pending_writes(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Дописывает буфер в файл журнала. При ошибке записи строки остаются в буфере."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            lines, self._pending = self._pending, []
+            try:
+                f = self._open()
+                # Недописанную строку отделяем: при чтении журнала она будет пропущена
+                f.write(('\n' if self._partial else '') + ''.join(lines))
+                f.flush()
+                self._partial = False
+            except OSError:
+                # Часть строк могла дойти до файла: повтор безопасен, записи задают абсолютные значения
+                self._pending[:0] = lines
+                self._partial = True
+                self._close_file()
+                raise
+            return len(lines)
+
+    def has_entries(self):
+        return self.entries_count > 0
+
+    def needs_compaction(self):
+        return self.entries_count >= self.compact_threshold
+
+    def replay(self, inventories, inventory_template):
+        """Применяет записи журнала поверх загруженного снимка. Возвращает число применённых записей."""
+        self.entries_count = 0
+        applied = 0
+        # Сначала журнал незавершённого уплотнения, затем текущий
+        for path in (self.rotated_path, self.journal_path):
+            if os.path.exists(path):
+                applied += self._replay_file(path, inventories, inventory_template)
+        return applied
+
+    def _replay_file(self, journal_path, inventories, inventory_template):
+        applied = 0
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Недописанная строка после аварийной остановки
+                    logger.warning("Пропущена повреждённая строка %s журнала %s.", line_number, journal_path)
+                    continue
+
+                self.entries_count += 1
+                inventory = inventories.get(entry['chat_id'])
+                if inventory is None:
+                    inventory = copy.deepcopy(inventory_template)
+                    inventories[entry['chat_id']] = inventory
+
+                option = inventory.get(entry['category'], {}).get(entry['item'], {}).get(entry['item_type'])
+                if option is None:
+                    logger.warning("Запись журнала не применена, позиция не найдена: %s", entry)
+                    continue
+
+                quantity = entry['quantity']
+                option['quantity'] = quantity
+                option['filled'] = quantity is not None and quantity > 0
+                applied += 1
+
+        logger.info("Из журнала %s применено изменений: %s.", journal_path, applied)
+        return applied
+
+    def rotate(self):
+        """
+        Откладывает текущий журнал до окончания уплотнения; новые записи идут в пустой журнал.
+        Незаписанные строки буфера (уже вошедшие в снимок) попадут в новый журнал:
+        повторное применение безопасно.
+        """
+        with self._lock:
+            self._rotate()
+            self.entries_count = len(self._pending)
+
+    def _rotate(self):
+        self._close_file()
+        self._partial = False
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.rotated_path):
+                # Предыдущее уплотнение не завершилось: дописываем к отложенному журналу
+                with open(self.journal_path, 'r', encoding='utf-8') as src, \
+                        open(self.rotated_path, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+
+    def finish_compaction(self):
+        """Удаляет отложенный журнал: его записи уже вошли в снимок."""
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def compact(self, inventories, inventory_file):
+        """Записывает полный снимок инвентаризации и очищает журнал."""
+        # Сначала снимок, потом очистка журнала: повторное применение записей безопасно,
+        # так как каждая запись задаёт абсолютное значение количества.
+        self.rotate()
+        atomic_write_json(inventory_file, inventories, ensure_ascii=False, indent=4)
+        self.finish_compaction()
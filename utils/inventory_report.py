@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from date_manager import EXPORT_COLUMN_WIDTHS, EXPORT_HEADERS, iter_inventory_rows, rows_to_excel_streaming
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADERS = ["Категория", "Товар", "Сырьё (всего)", "Полуфабрикаты (всего)", "Филиалов"]
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\[\]]')
+
+
+def safe_name(name, max_length=31):
+    """Имя, допустимое и для листа Excel (до 31 символа), и для файла."""
+    return _UNSAFE_CHARS.sub('_', str(name)).strip()[:max_length] or "Филиал"
+
+
+def _branch_totals(rows):
+    return {(category, item): (raw or 0, semi or 0) for category, item, raw, semi in rows}
+
+
+def collect_branch(branch_name, inventory):
+    """Выполняется в процессе пула: строки отчёта филиала и итоги для сводки."""
+    rows = list(iter_inventory_rows(inventory))
+    return branch_name, rows, _branch_totals(rows)
+
+
+def render_branch(branch_name, inventory, file_path):
+    """Выполняется в процессе пула: пишет отдельный xlsx филиала."""
+    rows = list(iter_inventory_rows(inventory))
+    rows_to_excel_streaming(rows, file_path, branch_name)
+    return branch_name, file_path, _branch_totals(rows)
+
+
+def merge_totals(branch_totals):
+    """Складывает итоги филиалов: (категория, товар) -> [сырьё, полуфабрикаты, число филиалов]."""
+    summary = {}
+    for totals in branch_totals:
+        for key, (raw, semi) in totals.items():
+            entry = summary.setdefault(key, [0, 0, 0])
+            entry[0] += raw
+            entry[1] += semi
+            entry[2] += 1
+    return summary
+
+
+def _append_summary_sheet(workbook, summary, title="Сводка"):
+    sheet = workbook.create_sheet(title)
+    for column, width in EXPORT_COLUMN_WIDTHS.items():
+        sheet.column_dimensions[column].width = width
+    sheet.append(SUMMARY_HEADERS)
+    for (category, item), (raw, semi, branches) in sorted(summary.items()):
+        sheet.append([category, item, raw, semi, branches])
+
+
+def write_summary_workbook(summary, file_path):
+    from openpyxl import Workbook  # Импорт тяжёлый: нужен только процессам пула
+
+    workbook = Workbook(write_only=True)
+    _append_summary_sheet(workbook, summary)
+    workbook.save(file_path)
+
+
+def write_consolidated_workbook(branch_results, summary, file_path):
+    """Одна книга: лист «Сводка» и по листу на филиал (запись потоковая)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    _append_summary_sheet(workbook, summary)
+
+    used_titles = {"Сводка"}
+    for branch_name, rows, _ in branch_results:
+        title = safe_name(branch_name)
+        suffix = 2
+        while title in used_titles:
+            title = f"{safe_name(branch_name, 27)} ({suffix})"
+            suffix += 1
+        used_titles.add(title)
+
+        sheet = workbook.create_sheet(title)
+        for column, width in EXPORT_COLUMN_WIDTHS.items():
+            sheet.column_dimensions[column].width = width
+        sheet.append([f"Филиал: {branch_name}"])
+        sheet.append(EXPORT_HEADERS)
+        for row in rows:
+            sheet.append(row)
+
+    workbook.save(file_path)
+
+
+def write_zip(file_paths, zip_path):
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for path in file_paths:
+            archive.write(path, arcname=os.path.basename(path))
+
+
+async def build_consolidated_report(branches, output_dir, mode='zip', max_workers=None):
+    """
+    Сводный отчёт по всем филиалам.
+
+    branches — список (имя филиала, инвентарь); пул сериализует инвентари
+    позже, в своём потоке, поэтому передаются копии, а не рабочие словари.
+    Филиалы обрабатываются параллельно в ProcessPoolExecutor:
+      * mode='zip'  — каждый процесс пишет xlsx своего филиала, затем файлы
+        и summary.xlsx упаковываются в архив (масштабируется по ядрам);
+      * mode='xlsx' — процессы готовят строки и итоги, а одна книга с листом
+        на филиал и сводным листом пишется в отдельном потоке.
+    Возвращает путь к архиву или книге.
+    """
+    if mode not in ('zip', 'xlsx'):
+        raise ValueError(f"Неизвестный режим сводного отчёта: {mode}")
+    os.makedirs(output_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        if mode == 'zip':
+            used_names = set()
+            tasks = []
+            for branch_name, inventory in branches:
+                file_name = safe_name(branch_name, 64)
+                suffix = 2
+                while file_name in used_names:
+                    file_name = f"{safe_name(branch_name, 60)}_{suffix}"
+                    suffix += 1
+                used_names.add(file_name)
+                file_path = os.path.join(output_dir, f"{file_name}.xlsx")
+                tasks.append(loop.run_in_executor(pool, render_branch, branch_name, inventory, file_path))
+            results = await asyncio.gather(*tasks)
+        else:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, collect_branch, branch_name, inventory)
+                for branch_name, inventory in branches
+            ))
+
+    summary = merge_totals(totals for _, _, totals in results)
+
+    if mode == 'zip':
+        summary_path = os.path.join(output_dir, "summary.xlsx")
+        report_path = f"{output_dir.rstrip(os.sep)}.zip"
+        await asyncio.to_thread(write_summary_workbook, summary, summary_path)
+        await asyncio.to_thread(write_zip, [path for _, path, _ in results] + [summary_path], report_path)
+    else:
+        report_path = os.path.join(output_dir, "consolidated.xlsx")
+        await asyncio.to_thread(write_consolidated_workbook, results, summary, report_path)
+
+    logger.info("Сводный отчёт по %s филиалам сохранён в %s.", len(results), report_path)
+    return report_path
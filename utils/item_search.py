@@ -0,0 +1,99 @@
+import heapq
+import itertools
+import logging
+import re
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+# Не больше стольких найденных товаров (кнопок) на один запрос
+SEARCH_RESULTS_LIMIT = 20
+
+
+def normalize_name(name):
+    """Приводит название к виду для поиска: нижний регистр, «ё» -> «е», без пунктуации и лишних пробелов."""
+    name = name.lower().replace('ё', 'е')
+    name = _PUNCTUATION.sub(' ', name)
+    return _SPACES.sub(' ', name).strip()
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemSearchIndex:
+    """
+    Индекс нечёткого поиска товаров по шаблону инвентаризации.
+
+    Названия нормализуются один раз при построении. Запрос сначала отбирает
+    кандидатов по общим триграммам (инвертированный индекс): кандидаты
+    упорядочиваются по числу общих триграмм, и fuzz.partial_ratio считается
+    только для max_candidates лучших из них. Для запросов короче триграммы
+    кандидаты — названия, содержащие запрос подстрокой (для одной-двух букв
+    partial_ratio выше порога только у них).
+
+    В отличие от прежнего перебора, который возвращал все товары с похожестью
+    выше порога, search() возвращает не больше limit (SEARCH_RESULTS_LIMIT) самых похожих:
+    столько кнопок помещается в клавиатуру выбора товара.
+    """
+
+    def __init__(self, template, threshold=60, max_candidates=64):
+        self.threshold = threshold  # Минимальная похожесть (строго больше), как в прежнем поиске
+        self.max_candidates = max_candidates
+        self.build(template)
+
+    def build(self, template):
+        self._items = []  # (category, item, нормализованное название)
+        self._postings = defaultdict(list)  # триграмма -> номера товаров
+        self.categories_by_item = {}
+
+        for category, items in template.items():
+            if not isinstance(items, dict):
+                continue
+            for item in items:
+                position = len(self._items)
+                normalized = normalize_name(item)
+                self._items.append((category, item, normalized))
+                self.categories_by_item.setdefault(item, category)
+                for gram in trigrams(normalized):
+                    self._postings[gram].append(position)
+
+        logger.info("Индекс поиска товаров построен: %s товаров, %s триграмм.", len(self._items), len(self._postings))
+
+    def __len__(self):
+        return len(self._items)
+
+    def _candidates(self, query):
+        if len(query) < 3:
+            matches = (position for position, (_, _, normalized) in enumerate(self._items) if query in normalized)
+            return list(itertools.islice(matches, self.max_candidates))
+
+        overlap = defaultdict(int)
+        for gram in trigrams(query):
+            for position in self._postings.get(gram, ()):
+                overlap[position] += 1
+
+        # Дорогой partial_ratio — только для товаров с наибольшим числом общих триграмм
+        return heapq.nlargest(self.max_candidates, overlap, key=overlap.__getitem__)
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Возвращает до limit пар (category, item), наиболее похожих на запрос."""
+        from fuzzywuzzy import fuzz  # Загружается при первом поиске, а не при запуске бота
+
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        scored = []
+        for position in self._candidates(query):
+            category, item, normalized = self._items[position]
+            score = fuzz.partial_ratio(query, normalized)
+            if score > self.threshold:
+                scored.append((score, -position))
+
+        best = heapq.nlargest(limit, scored)
+        return [self._items[-position][:2] for _, position in best]
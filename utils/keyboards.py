@@ -0,0 +1,63 @@
+import logging
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Главное меню не зависит от состояния: одна неизменяемая разметка на все ответы
+MAIN_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Добавить событие", callback_data='add_event')],
+    [InlineKeyboardButton("Показать события", callback_data='show_events')],
+    [InlineKeyboardButton("Инвентаризация", callback_data='inventory')],
+    [InlineKeyboardButton("Помощь", callback_data='help')]
+])
+
+
+class KeyboardCache:
+    """
+    LRU-кэш готовых InlineKeyboardMarkup.
+
+    Ключ — кортеж, первый элемент которого вид меню ('categories', 'items',
+    'chat_picker'...), остальные — всё, от чего зависит разметка: выбранные
+    элементы и версия данных (InventoryFillStatus.version,
+    ChatManager.chat_ids_version). Смена версии сама делает старые ключи
+    недостижимыми, а invalidate() освобождает их сразу, не дожидаясь
+    вытеснения. Разметки PTB неизменяемы, поэтому одну и ту же можно
+    отправлять в разные сообщения.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """Разметка по ключу; при промахе строится вызовом build() и запоминается."""
+        markup = self._entries.get(key)
+        if markup is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return markup
+        self.misses += 1
+        markup = build()
+        self._entries[key] = markup
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return markup
+
+    def invalidate(self, kind=None, *prefix):
+        """Удаляет разметки вида kind (и с заданным началом ключа); без аргументов — все."""
+        if kind is None:
+            self._entries.clear()
+            return
+        head = (kind,) + prefix
+        stale = [key for key in self._entries if key[:len(head)] == head]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logger.debug("Сброшено клавиатур '%s': %s", kind, len(stale))
+
+    def __len__(self):
+        return len(self._entries)
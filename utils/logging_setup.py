@@ -0,0 +1,160 @@
+"""
+Настройка логирования бота: записи из обработчиков кладутся в очередь
+(QueueHandler), а форматирование и вывод выполняет фоновый поток
+(QueueListener), поэтому медленный терминал или диск не задерживает ответы.
+
+Уровни задаются для корневого логгера и отдельно для модулей
+('components.inventory_manager=DEBUG,httpx=WARNING'); частые сообщения ниже
+WARNING можно прореживать: из каждых N записей с одним шаблоном выводится одна.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_listener = None
+
+
+def parse_levels(spec):
+    """'httpx=WARNING,components.inventory_manager=DEBUG' -> {'httpx': 30, 'components.inventory_manager': 10}"""
+    levels = {}
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, level = part.partition('=')
+        level = level.strip().upper()
+        value = int(level) if level.isdigit() else logging.getLevelName(level)
+        if not isinstance(value, int):
+            raise ValueError(f"Неизвестный уровень логирования: {part}")
+        levels[name.strip()] = value
+    return levels
+
+
+def parse_sampling(spec):
+    """'components.inventory_manager=20,utils.send_queue=5' -> {имя логгера: N}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, rate = part.partition('=')
+        rates[name.strip()] = max(1, int(rate))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание частых сообщений: для логгеров из rates (с учётом дочерних,
+    'components' действует на 'components.inventory_manager') пропускает
+    первую и далее каждую N-ю запись ниже WARNING. Счёт ведётся по шаблону
+    сообщения (record.msg до подстановки аргументов), поэтому редкие сообщения
+    того же модуля не теряются за частыми. Предупреждения и ошибки проходят всегда.
+
+    Шаблонов обычно немного, но сообщение, собранное заранее (f-строка,
+    сторонняя библиотека), даёт новый ключ на каждую запись. Поэтому счётчиков
+    не больше max_keys: при переполнении они сбрасываются и счёт начинается
+    заново — после сброса снова проходит первая запись каждого шаблона.
+    """
+
+    def __init__(self, rates, max_keys=10_000):
+        super().__init__()
+        self.rates = dict(rates)
+        self.max_keys = max_keys
+        self.dropped = 0
+        self._seen = {}  # (логгер, шаблон) -> число записей
+        self._rate_cache = {}  # имя логгера -> N
+
+    def _rate(self, name):
+        rate = self._rate_cache.get(name)
+        if rate is None:
+            rate = 1
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._rate_cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate == 1:
+            return True
+        key = (record.name, record.msg)
+        seen = self._seen.get(key)
+        if seen is None:
+            if len(self._seen) >= self.max_keys:
+                self._seen.clear()
+            seen = 0
+        self._seen[key] = seen + 1
+        if seen % rate:
+            self.dropped += 1
+            return False
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: стандартный prepare()
+    собирает итоговую строку сразу, здесь подстановка аргументов и время
+    форматируются в потоке QueueListener. Аргументы изменяемых типов (dict,
+    list, set) подставляются сразу — к моменту вывода их содержимое могло
+    измениться; трассировка исключения тоже форматируется сразу, чтобы кадры
+    стека не жили в очереди.
+    """
+
+    _MUTABLE = (dict, list, set)
+
+    def prepare(self, record):
+        if record.args and (isinstance(record.args, dict) or
+                            any(isinstance(arg, self._MUTABLE) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=logging.INFO, module_levels=None, sampling=None, stream=None, use_queue=True,
+                      fmt=LOG_FORMAT):
+    """
+    Перенастраивает корневой логгер. use_queue=False — прежний синхронный
+    вывод в StreamHandler (для отладки и сравнения в benchmarks.bench_logging).
+    Возвращает фильтр прореживания (или None), чтобы можно было посмотреть число отброшенных записей.
+    """
+    global _listener
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logging.Formatter(fmt))
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        front = DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+    else:
+        front = output
+
+    sampling_filter = SamplingFilter(sampling) if sampling else None
+    if sampling_filter is not None:
+        front.addFilter(sampling_filter)
+    root.addHandler(front)
+    root.setLevel(level)
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+    return sampling_filter
+
+
+def stop_logging():
+    """Останавливает фоновый поток, дописав записи из очереди."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -2,6 +2,10 @@ import json
 import os
 import logging
 import copy
+
+logger = logging.getLogger(__name__)
+
+
 class Mediator:
     def __init__(self, inventory_file_path="inventory.json"):  # Задаем путь по умолчанию
         self.inventory_manager = None
@@ -26,6 +30,10 @@ class Mediator:
     def register_chat_manager(self, chat_manager):
         self.chat_manager = chat_manager
 
+    def notify_reminders_changed(self):
+        if self.scheduler:
+            self.scheduler.reschedule_reminders()
+
     def notify_inventory_update(self):
         if self.inventory_manager:
             self.inventory_manager.update_status()
@@ -65,22 +73,22 @@ class Mediator:
                 with open(inventory_file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     if data:  # Проверка, пустой или нет
-                        logging.info(f"Данные загружены из {inventory_file_path}.")
+                        logger.info("Данные загружены из %s.", inventory_file_path)
                         return data
                     else:
-                        logging.info(f"Файл {inventory_file_path} пуст.")
+                        logger.info("Файл %s пуст.", inventory_file_path)
             else:
-                logging.info(f"Файл {inventory_file_path} не найден.")
+                logger.info("Файл %s не найден.", inventory_file_path)
 
             # Если основной JSON пустой или отсутствует, загружаем шаблон
             with open(template_file_path, 'r', encoding='utf-8') as template_file:
                 data = json.load(template_file)
-                logging.info(f"Данные загружены из {template_file_path}.")
+                logger.info("Данные загружены из %s.", template_file_path)
 
         except json.JSONDecodeError:
-            logging.error("Ошибка в формате JSON.")
+            logger.error("Ошибка в формате JSON.")
         except IOError as e:
-            logging.error(f"Ошибка при работе с файлами: {e}")
+            logger.error("Ошибка при работе с файлами: %s", e)
 
         return data
     
@@ -89,10 +97,10 @@ class Mediator:
         try:
             with open(template_file_path, 'r', encoding='utf-8') as template_file:
                 data = json.load(template_file)
-                logging.info(f"Шаблон инвентаризации загружен из {template_file_path}.")
+                logger.info("Шаблон инвентаризации загружен из %s.", template_file_path)
                 return data
         except (json.JSONDecodeError, IOError) as e:
-            logging.error(f"Ошибка при загрузке шаблона инвентаризации: {e}")
+            logger.error("Ошибка при загрузке шаблона инвентаризации: %s", e)
             return {}
 
     def remove_duplicates(self, data):
@@ -114,6 +122,6 @@ class Mediator:
             with open(inventory_file, 'w', encoding='utf-8') as f:
                 json.dump(sanitized_inventories, f, ensure_ascii=False, indent=4)
             
-            logging.info("Инвентаризация успешно сохранена в файл.")
+            logger.info("Инвентаризация успешно сохранена в файл.")
         except Exception as e:
-            logging.error(f"Ошибка при сохранении инвентаризации: {e}")
+            logger.error("Ошибка при сохранении инвентаризации: %s", e)
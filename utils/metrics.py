@@ -0,0 +1,365 @@
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды (как у клиентов Prometheus по умолчанию)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и значения по наборам меток."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # кортеж значений меток -> значение
+        self._lock = threading.Lock()  # Наблюдения приходят и из потоков записи
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Строки выборок в текстовом формате Prometheus."""
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Значение, которое задаётся явно (set) или читается функцией в момент выгрузки (set_function)."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}  # кортеж значений меток -> функция без аргументов
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        self._functions[self._key(labels)] = function
+
+    def value(self, **labels):
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return function() if function else self._values.get(key, 0)
+
+    def samples(self):
+        lines = super().samples()
+        for key, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception as e:
+                logger.warning("Не удалось получить значение метрики %s: %s", self.name, e)
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(float(value))}")
+        return lines
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'count', 'sum', 'max')
+
+    def __init__(self, size):
+        self.buckets = [0] * size  # Без накопления: счётчик только своей корзины
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными корзинами. Наблюдение — двоичный поиск
+    корзины и три сложения; накопленные счётчики le считаются только при выгрузке.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = _HistogramValue(len(self.bounds) + 1)
+            state.buckets[index] += 1
+            state.count += 1
+            state.sum += value
+            if value > state.max:
+                state.max = value
+
+    def time(self, **labels):
+        """Контекстный менеджер: наблюдает время выполнения блока."""
+        return _Timer(self, labels)
+
+    def stats(self):
+        """{кортеж меток: (число, сумма, максимум, p50, p99)}; квантили — по верхним границам корзин."""
+        with self._lock:
+            items = [(key, list(state.buckets), state.count, state.sum, state.max)
+                     for key, state in self._values.items()]
+        result = {}
+        for key, buckets, count, total, maximum in items:
+            result[key] = (count, total, maximum,
+                           self._quantile(buckets, count, maximum, 0.5),
+                           self._quantile(buckets, count, maximum, 0.99))
+        return result
+
+    def _quantile(self, buckets, count, maximum, q):
+        rank = q * count
+        seen = 0
+        for index, bucket in enumerate(buckets):
+            seen += bucket
+            if seen >= rank and seen:
+                return min(self.bounds[index], maximum) if index < len(self.bounds) else maximum
+        return maximum
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state.buckets), state.count, state.sum) for key, state in self._values.items()]
+        lines = []
+        for key, buckets, count, total in items:
+            cumulative = 0
+            for bound, bucket in zip(self.bounds + (math.inf,), buckets):
+                cumulative += bucket
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик бота: счётчики, гистограммы и датчики.
+
+    Повторная регистрация метрики с тем же именем возвращает уже созданную,
+    поэтому модули объявляют свои метрики при импорте, не заботясь о порядке.
+    render() выдаёт все метрики в текстовом формате Prometheus, format_summary() —
+    короткую сводку для команды /stats.
+    """
+
+    def __init__(self):
+        self._metrics = {}  # имя -> метрика, в порядке регистрации
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом или метками")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def format_summary(self, limit=10):
+        """Сводка для администратора: самые нагруженные наборы меток каждой гистограммы, счётчики и датчики."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Histogram):
+                stats = sorted(metric.stats().items(), key=lambda item: -item[1][1])[:limit]
+                if not stats:
+                    continue
+                lines.append(f"{metric.documentation}:")
+                for key, (count, total, maximum, p50, p99) in stats:
+                    label = ', '.join(key) or 'всего'
+                    lines.append(f"  {label} — {count} раз, среднее {total / count * 1e3:.1f} мс, "
+                                 f"p50 ≤ {p50 * 1e3:.0f} мс, p99 ≤ {p99 * 1e3:.0f} мс, максимум {maximum * 1e3:.0f} мс")
+            else:
+                values = [line.rsplit(' ', 1) for line in metric.samples()]
+                values = [(sample, value) for sample, value in values if value not in ('0', '0.0')]
+                if not values:
+                    continue
+                lines.append(f"{metric.documentation}:")
+                lines.extend(f"  {sample[len(metric.name):] or 'всего'} = {value}" for sample, value in values[:limit])
+        return '\n'.join(lines) or "Метрик пока нет."
+
+
+# Общий реестр процесса: хранилище, очередь отправки и обработчики пишут в него
+REGISTRY = MetricsRegistry()
+
+HANDLER_SECONDS = REGISTRY.histogram('bot_handler_seconds', "Время обработчиков", ('handler',))
+HANDLER_ERRORS = REGISTRY.counter('bot_handler_errors_total', "Ошибки обработчиков", ('handler',))
+
+
+def handler_name(callback):
+    """Имя обработчика для метки: функция, метод или partial (по вложенной функции)."""
+    while isinstance(callback, functools.partial):
+        callback = callback.func
+    return getattr(callback, '__qualname__', None) or type(callback).__name__
+
+
+def instrument_callback(callback, name=None):
+    """Оборачивает асинхронный обработчик: время и ошибки попадают в метрики с меткой handler."""
+    if getattr(callback, '_metrics_wrapped', False):
+        return callback
+    name = name or handler_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name)
+
+    wrapper._metrics_wrapped = True
+    return wrapper
+
+
+def instrument_handlers(handlers, state_names=None, prefix=''):
+    """
+    Оборачивает callback каждого обработчика PTB из списка. У ConversationHandler
+    оборачиваются точки входа, обработчики всех состояний и fallbacks; к метке
+    добавляется состояние (имя из state_names: {номер состояния: имя}).
+    Возвращает число обёрнутых обработчиков.
+    """
+    from telegram.ext import ConversationHandler
+
+    state_names = state_names or {}
+    count = 0
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            count += instrument_handlers(handler.entry_points, state_names, prefix + 'conversation.entry:')
+            for state, state_handlers in handler.states.items():
+                label = f"{prefix}conversation.{state_names.get(state, state)}:"
+                count += instrument_handlers(state_handlers, state_names, label)
+            count += instrument_handlers(handler.fallbacks, state_names, prefix + 'conversation.fallback:')
+        elif hasattr(handler, 'callback'):
+            handler.callback = instrument_callback(handler.callback, prefix + handler_name(handler.callback))
+            count += 1
+    return count
+
+
+def instrument_application(application, state_names=None):
+    """Оборачивает все обработчики, зарегистрированные в приложении (все группы)."""
+    count = sum(instrument_handlers(group, state_names) for group in application.handlers.values())
+    logger.info("Метрики: обёрнуто обработчиков %s.", count)
+    return count
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-сервер метрик на asyncio: GET /metrics отдаёт registry.render()
+    в текстовом формате Prometheus. Без зависимостей; рассчитан на редкие
+    запросы сборщика, поэтому соединение закрывается после ответа.
+    """
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9108, path='/metrics'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Метрики доступны на http://%s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass  # Заголовки запроса не нужны
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == self.path:
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                status, body, content_type = '404 Not Found', b'Not Found\n', 'text/plain'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug("Запрос метрик прерван: %s", e)
+        finally:
+            writer.close()
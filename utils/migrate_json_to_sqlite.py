@@ -0,0 +1,66 @@
+"""
+Однократный перенос данных бота из JSON-файлов в SQLite.
+
+Запуск из корня репозитория:
+    python -m utils.migrate_json_to_sqlite --db bot.db
+"""
+import argparse
+import logging
+
+from utils.storage import JsonStorage, SqliteStorage
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(json_storage, sqlite_storage):
+    """Переносит все сущности из json_storage в sqlite_storage. Возвращает счётчики перенесённых записей."""
+    counts = {}
+
+    loaders = [
+        ('chat_ids', json_storage.load_chat_ids, sqlite_storage.save_chat_ids),
+        ('events', json_storage.load_events, sqlite_storage.save_events),
+        ('admins', json_storage.load_admins, sqlite_storage.save_admins),
+        ('chat_members', json_storage.load_chat_members, sqlite_storage.save_chat_members),
+        ('preferences', json_storage.load_preferences, sqlite_storage.save_preferences),
+        ('user_states', json_storage.load_user_states,
+         lambda states: sqlite_storage.save_user_states(states, list(states))),
+    ]
+    for name, load, save in loaders:
+        try:
+            data = load()
+        except FileNotFoundError:
+            logger.info("Нет данных для переноса: %s.", name)
+            continue
+        save(data)
+        counts[name] = len(data)
+        logger.info("Перенесено %s: %s.", name, len(data))
+
+    # Инвентаризация: снимок плюс непримененный журнал
+    inventories = json_storage.load_inventories({})
+    sqlite_storage.save_inventories(inventories)
+    counts['inventory_rows'] = sum(1 for _ in SqliteStorage.iter_inventory_rows(inventories))
+    logger.info("Перенесено строк инвентаризации: %s.", counts['inventory_rows'])
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос данных бота из JSON в SQLite.")
+    parser.add_argument('--db', default='bot.db', help="Путь к файлу базы SQLite")
+    parser.add_argument('--inventory', default='inventory.json', help="Путь к inventory.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    sqlite_storage = SqliteStorage(args.db)
+    try:
+        counts = migrate(JsonStorage(inventory_path=args.inventory), sqlite_storage)
+    finally:
+        sqlite_storage.close()
+
+    for name, count in counts.items():
+        print(f"{name}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceActor:
+    """
+    Единственный фоновый писатель данных бота.
+
+    Обработчики не пишут файлы сами, а сообщают, что сущность изменилась
+    (mark_dirty). Задача актора ждёт окно coalesce_delay, собирает все
+    пометки пачкой и для каждой сущности делает одну запись: снимок данных
+    берётся в цикле событий, а сериализация и запись на диск выполняются
+    в отдельном потоке (один поток — записи не перемешиваются).
+
+    Пока актор не запущен (нет цикла событий: загрузка, скрипты), mark_dirty
+    пишет сразу и синхронно.
+    """
+
+    def __init__(self, coalesce_delay=2.0):
+        self.coalesce_delay = coalesce_delay
+        self._writers = {}  # name -> (snapshot, write)
+        self._dirty = set()
+        self._executor = None
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self.writes_count = 0
+
+    def register(self, name, write, snapshot=None):
+        """
+        Регистрирует сущность.
+
+        snapshot() вызывается в цикле событий и возвращает копию данных,
+        write(data) пишет её в потоке. Без snapshot вызывается write() —
+        сущность сама отвечает за согласованность (например, UserStateStore.flush).
+        """
+        self._writers[name] = (snapshot, write)
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def mark_dirty(self, name):
+        if name not in self._writers:
+            raise KeyError(f"Сущность '{name}' не зарегистрирована в PersistenceActor")
+        if not self.running:
+            self._write_now(name)
+            return
+        self._dirty.add(name)
+        self._wakeup.set()
+
+    def has_pending_changes(self):
+        return bool(self._dirty)
+
+    def pending_count(self):
+        return len(self._dirty)
+
+    def _write_now(self, name):
+        snapshot, write = self._writers[name]
+        try:
+            if snapshot is None:
+                write()
+            else:
+                write(snapshot())
+            self.writes_count += 1
+        except Exception as e:
+            logger.error("Ошибка при сохранении '%s': %s", name, e)
+
+    def start(self):
+        """Запускает фоновую задачу; вызывается из работающего цикла событий."""
+        if self.running:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persistence')
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        if self._dirty:
+            self._wakeup.set()
+        logger.info("Фоновое сохранение данных запущено (окно %s сек.).", self.coalesce_delay)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Даём накопиться пачке изменений
+            await asyncio.sleep(self.coalesce_delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает все помеченные сущности. Возвращает число выполненных записей."""
+        async with self._flush_lock:
+            names = self._dirty
+            self._dirty = set()
+            loop = asyncio.get_running_loop()
+            written = 0
+            pending = sorted(names)
+            while pending:
+                name = pending[0]
+                snapshot, write = self._writers[name]
+                try:
+                    if snapshot is None:
+                        await loop.run_in_executor(self._executor, write)
+                    else:
+                        await loop.run_in_executor(self._executor, write, snapshot())
+                    written += 1
+                except asyncio.CancelledError:
+                    # Остановка посреди сброса: недописанное сохранит stop()
+                    self._dirty.update(pending)
+                    raise
+                except Exception as e:
+                    # Повторим запись при следующем сбросе
+                    logger.error("Ошибка при сохранении '%s': %s", name, e)
+                    self._dirty.add(name)
+                pending.pop(0)
+            if self._dirty:
+                self._wakeup.set()
+            self.writes_count += written
+            if written:
+                logger.debug("Фоновое сохранение: записано сущностей %s (%s).", written, ', '.join(sorted(names)))
+            return written
+
+    async def stop(self):
+        """Останавливает задачу и сбрасывает всё несохранённое (хук остановки приложения)."""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+        self._task = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        logger.info("Фоновое сохранение данных остановлено, изменения записаны.")
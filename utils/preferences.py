@@ -0,0 +1,204 @@
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Версии общие для всех счётчиков: порядок нового филиала никогда не повторит старую версию
+_versions = itertools.count(1)
+
+
+class RankedCounter:
+    """
+    Счётчики ключей с порядком по убыванию счёта.
+
+    Порядок хранится списком с индексом позиций и поддерживается при каждом
+    увеличении: счёт только растёт, поэтому ключ сдвигается вверх на столько
+    позиций, сколько соседей он обогнал, — полной сортировки нет. version
+    меняется только при смене порядка; по ней кэшируются клавиатуры.
+    """
+
+    __slots__ = ('scores', 'order', '_position', 'version')
+
+    def __init__(self, scores=None):
+        self.scores = {key: float(score) for key, score in (scores or {}).items()}
+        self.order = sorted(self.scores, key=lambda key: -self.scores[key])
+        self._position = {key: index for index, key in enumerate(self.order)}
+        self.version = next(_versions)
+
+    def add(self, key, amount):
+        """Увеличивает счёт ключа; возвращает True, если порядок изменился."""
+        scores, order, position = self.scores, self.order, self._position
+        score = scores.get(key, 0.0) + amount
+        scores[key] = score
+        index = position.get(key)
+        if index is None:
+            index = len(order)
+            order.append(key)
+            position[key] = index
+            moved = True
+        else:
+            moved = False
+        while index > 0 and scores[order[index - 1]] < score:
+            neighbour = order[index - 1]
+            order[index] = neighbour
+            position[neighbour] = index
+            index -= 1
+            moved = True
+        order[index] = key
+        position[key] = index
+        if moved:
+            self.version = next(_versions)
+        return moved
+
+    def scale(self, factor):
+        """Умножает все счета на factor; порядок не меняется."""
+        for key in self.scores:
+            self.scores[key] *= factor
+
+    def ordered(self, keys):
+        """
+        Ключи keys в порядке убывания счёта; ключи без счёта идут после
+        в исходном порядке. Проход по списку без сортировки.
+        """
+        keys = list(keys)
+        present = set(keys)
+        ranked = [key for key in self.order if key in present]
+        if len(ranked) == len(keys):
+            return ranked
+        position = self._position
+        return ranked + [key for key in keys if key not in position]
+
+
+class BranchPreferences:
+    """Предпочтения одного филиала: счётчики категорий и товаров по категориям."""
+
+    __slots__ = ('categories', 'items')
+
+    def __init__(self, categories=None, items=None):
+        self.categories = RankedCounter(categories)
+        self.items = {category: RankedCounter(scores) for category, scores in (items or {}).items()}
+
+    def item_counter(self, category):
+        counter = self.items.get(category)
+        if counter is None:
+            counter = self.items[category] = RankedCounter()
+        return counter
+
+    def scale(self, factor):
+        self.categories.scale(factor)
+        for counter in self.items.values():
+            counter.scale(factor)
+
+
+class PreferenceStore:
+    """
+    Предпочтения пользователей филиалов с затуханием по времени.
+
+    Вклад нажатия растёт как 2 ** (t / half_life) от эпохи хранилища, поэтому
+    при сравнении счетов нажатие давностью half_life весит вдвое меньше
+    свежего, а старые счета не приходится пересчитывать на каждом нажатии.
+    Когда вклад становится слишком большим, все счета делятся на него
+    и эпоха переносится на текущий момент (порядок при этом не меняется).
+
+    Счётчики живут в памяти; pending — число нажатий после последнего
+    сохранения, по нему владелец решает, когда сбросить их на диск.
+    В файл пишутся счета, приведённые к моменту сохранения, в прежнем
+    формате {chat_id: {"categories": {...}, "items": {...}}} и отметка
+    времени "updated", по которой затухание продолжается после перезапуска.
+    """
+
+    RESCALE_LIMIT = 2.0 ** 40
+
+    def __init__(self, data=None, half_life_days=14, clock=time.time):
+        self.half_life = half_life_days * 86400
+        self.clock = clock
+        self.epoch = clock()
+        self.branches = {}
+        self.pending = 0
+        for chat_id, branch in (data or {}).items():
+            if not isinstance(branch, dict):
+                continue
+            # Счета, сохранённые раньше, затухают за время простоя; у старых файлов отметки нет
+            age = max(0.0, self.epoch - branch.get('updated', self.epoch))
+            factor = self._weight(-age)
+            preferences = BranchPreferences(branch.get('categories'), branch.get('items'))
+            if factor != 1.0:
+                preferences.scale(factor)
+            self.branches[str(chat_id)] = preferences
+        logger.debug("Предпочтения загружены: %s филиалов.", len(self.branches))
+
+    def _weight(self, seconds):
+        return 2.0 ** (seconds / self.half_life)
+
+    def _increment(self):
+        weight = self._weight(self.clock() - self.epoch)
+        if weight > self.RESCALE_LIMIT:
+            for preferences in self.branches.values():
+                preferences.scale(1.0 / weight)
+            self.epoch = self.clock()
+            weight = 1.0
+            logger.debug("Счета предпочтений приведены к новой эпохе.")
+        return weight
+
+    def branch(self, chat_id):
+        chat_id_str = str(chat_id)
+        preferences = self.branches.get(chat_id_str)
+        if preferences is None:
+            preferences = self.branches[chat_id_str] = BranchPreferences()
+        return preferences
+
+    def record(self, chat_id, category, item=None):
+        """Учитывает выбор категории (и товара в ней); возвращает True, если порядок изменился."""
+        amount = self._increment()
+        preferences = self.branch(chat_id)
+        if item:
+            moved = preferences.item_counter(category).add(item, amount)
+        else:
+            moved = preferences.categories.add(category, amount)
+        self.pending += 1
+        return moved
+
+    def category_order(self, chat_id, categories):
+        """Категории филиала по убыванию предпочтения."""
+        preferences = self.branches.get(str(chat_id))
+        if preferences is None:
+            return list(categories)
+        return preferences.categories.ordered(categories)
+
+    def item_order(self, chat_id, category, items):
+        """Товары категории по убыванию предпочтения."""
+        preferences = self.branches.get(str(chat_id))
+        counter = preferences.items.get(category) if preferences else None
+        if counter is None:
+            return list(items)
+        return counter.ordered(items)
+
+    def category_order_version(self, chat_id):
+        """Версия порядка категорий филиала (0 — предпочтений нет) для ключей кэша."""
+        preferences = self.branches.get(str(chat_id))
+        return preferences.categories.version if preferences else 0
+
+    def item_order_version(self, chat_id, category):
+        """Версия порядка товаров категории филиала (0 — предпочтений нет)."""
+        preferences = self.branches.get(str(chat_id))
+        counter = preferences.items.get(category) if preferences else None
+        return counter.version if counter else 0
+
+    def to_json(self):
+        """Снимок для сохранения: счета, приведённые к текущему моменту."""
+        now = self.clock()
+        factor = 1.0 / self._weight(now - self.epoch)
+        self.pending = 0
+
+        def scores(counter):
+            return {key: round(score * factor, 6) for key, score in counter.scores.items()}
+
+        return {
+            chat_id: {
+                "categories": scores(preferences.categories),
+                "items": {category: scores(counter) for category, counter in preferences.items.items()},
+                "updated": now,
+            }
+            for chat_id, preferences in self.branches.items()
+        }
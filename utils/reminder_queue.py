@@ -0,0 +1,67 @@
+import heapq
+import itertools
+
+
+class ReminderQueue:
+    """
+    Очередь напоминаний на мин-куче, упорядоченная по времени срабатывания.
+
+    Добавление и удаление стоят O(log n). Удалённые записи не вычищаются
+    из кучи сразу, а пропускаются при извлечении (ленивое удаление).
+    """
+
+    def __init__(self):
+        self._heap = []  # (due, seq, key)
+        self._entries = {}  # key -> (due, seq, payload)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def push(self, key, due, payload):
+        """Добавляет напоминание или переносит существующее с тем же ключом."""
+        seq = next(self._counter)
+        self._entries[key] = (due, seq, payload)
+        heapq.heappush(self._heap, (due, seq, key))
+
+    def remove(self, key):
+        """Удаляет напоминание. Возвращает True, если оно было в очереди."""
+        return self._entries.pop(key, None) is not None
+
+    def rebuild(self, items):
+        """Пересобирает очередь из итерируемого (key, due, payload) за O(n)."""
+        self._entries = {}
+        self._heap = []
+        for key, due, payload in items:
+            seq = next(self._counter)
+            self._entries[key] = (due, seq, payload)
+            self._heap.append((due, seq, key))
+        heapq.heapify(self._heap)
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap:
+            due, seq, key = heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(heap)
+
+    def next_due(self):
+        """Время ближайшего напоминания или None, если очередь пуста."""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Извлекает все напоминания со временем срабатывания не позже now."""
+        due_items = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due_items
+            due, seq, key = heapq.heappop(self._heap)
+            _, _, payload = self._entries.pop(key)
+            due_items.append((key, due, payload))
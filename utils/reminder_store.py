@@ -0,0 +1,118 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderJobStore:
+    """
+    Долговременное хранилище запланированных отправок напоминаний (SQLite).
+
+    Каждая задача — одна отправка напоминания о событии в один чат. Задача
+    записывается сразу при создании события и удаляется после попытки
+    отправки, поэтому после перезапуска бот досылает всё, что не успел:
+    и напоминания, время которых наступило во время простоя, и недоотправленную
+    часть рассылки, прерванной падением.
+
+    Изменения (add_jobs, remove_jobs, remove_event) только ставятся в очередь;
+    в базу их пишет flush() одной транзакцией — в боте из потока
+    PersistenceActor, чтобы цикл событий не ждал фиксации на каждое напоминание.
+    Чтение сначала дописывает очередь.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reminder_jobs (
+            job_id TEXT PRIMARY KEY,
+            event_id TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            due REAL NOT NULL,
+            text TEXT NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS reminder_jobs_event ON reminder_jobs (event_id);
+
+        CREATE TABLE IF NOT EXISTS reminder_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path='reminders.db'):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._pending = []  # (sql, [params]) в порядке вызовов, ещё не записанные в базу
+        logger.info("Хранилище задач напоминаний открыто: %s", db_path)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            self.flush()
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, sql, params):
+        with self._lock:
+            if self._pending and self._pending[-1][0] == sql:
+                # Подряд идущие однотипные изменения — один executemany
+                self._pending[-1][1].extend(params)
+            else:
+                self._pending.append((sql, list(params)))
+
+    def has_pending_writes(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Записывает накопленные изменения одной транзакцией. Возвращает число операторов."""
+        with self._lock:
+            statements, self._pending = self._pending, []
+            if not statements:
+                return 0
+            try:
+                with self._conn:
+                    for sql, params in statements:
+                        self._conn.executemany(sql, params)
+            except sqlite3.Error:
+                self._pending[:0] = statements
+                raise
+            return len(statements)
+
+    def is_seeded(self):
+        """True, если задачи уже переносились из событий (первый запуск с хранилищем пройден)."""
+        return bool(self._query("SELECT 1 FROM reminder_meta WHERE key = 'seeded'"))
+
+    def mark_seeded(self):
+        self._write("INSERT OR REPLACE INTO reminder_meta (key, value) VALUES ('seeded', ?)",
+                    [(datetime.now().isoformat(),)])
+
+    def add_jobs(self, jobs):
+        """Сохраняет задачи (job_id, event_id, chat_id, due, text) одной транзакцией."""
+        rows = [(job_id, event_id, chat_id, due.timestamp(), text) for job_id, event_id, chat_id, due, text in jobs]
+        self._write("INSERT OR REPLACE INTO reminder_jobs (job_id, event_id, chat_id, due, text) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def remove_jobs(self, job_ids):
+        self._write("DELETE FROM reminder_jobs WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+
+    def remove_event(self, event_id):
+        self._write("DELETE FROM reminder_jobs WHERE event_id = ?", [(event_id,)])
+
+    def load_pending(self):
+        """Все ожидающие задачи в виде списка (job_id, event_id, chat_id, due, text)."""
+        fromtimestamp = datetime.fromtimestamp
+        return [
+            (job_id, event_id, chat_id, fromtimestamp(due), text)
+            for job_id, event_id, chat_id, due, text in
+            self._query("SELECT job_id, event_id, chat_id, due, text FROM reminder_jobs")
+        ]
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM reminder_jobs")[0][0]
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
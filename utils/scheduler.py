@@ -2,11 +2,14 @@ import logging
 import asyncio
 from telegram.ext import CallbackContext, JobQueue
 from datetime import datetime,time,timedelta
-from utils.access_control import AccessControl
-from chat_manager import ChatManager
-from utils.mediator import Mediator
+from time import monotonic
 import pytz
-from components.inventory_manager import InventoryManager
+from utils.metrics import REGISTRY
+from utils.send_queue import BROADCAST
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LAG_SECONDS = REGISTRY.histogram('scheduler_lag_seconds', "Опоздание задач планировщика")
 
 
 # Настройка уровней логирования для HTTP-библиотек
@@ -24,6 +27,9 @@ class Scheduler:
         self.job_queue = job_queue
         self.chat_manager = chat_manager
         self.inventory_manager = None
+        self._reminder_job = None  # Единственная задача JobQueue, ждущая ближайшее напоминание
+        self._reminder_due = None
+        self.consolidated_report_mode = 'zip'  # 'zip', 'xlsx' или None — не формировать отчёт при закрытии
     
     def attach_inventory_manager(self, inventory_manager):
         # Привязываем inventory_manager к scheduler
@@ -36,15 +42,54 @@ class Scheduler:
 
 
     def schedule_daily_check(self):
-        # Запускаем асинхронный метод напрямую в JobQueue
+        # Вместо опроса раз в минуту ждём ровно до ближайшего напоминания
+        self.reschedule_reminders()
+
+    def reschedule_reminders(self):
+        """Переставляет задачу пробуждения на время ближайшего напоминания в очереди."""
+        next_due = self.chat_manager.reminders.next_due()
+        if next_due == self._reminder_due and (next_due is None or self._reminder_job is not None):
+            return
+
+        if self._reminder_job is not None:
+            self._reminder_job.schedule_removal()
+            self._reminder_job = None
+        self._reminder_due = next_due
+
+        if next_due is None:
+            logger.debug("Очередь напоминаний пуста.")
+            return
+
+        delay = max(0, (next_due - datetime.now()).total_seconds())
+        self._reminder_job = self.job_queue.run_once(self.async_check_events, when=delay)
+        logger.debug("Следующее напоминание в %s (через %.0f сек.).", next_due, delay)
+
+    def schedule_inventory_compaction(self, interval=300):
+        # Периодически уплотняем журнал изменений инвентаризации в inventory.json
         self.job_queue.run_repeating(
-            self.async_check_events,
-            interval=60,
-            first=0
+            self.compact_inventory,
+            interval=interval,
+            first=interval
         )
 
+    def schedule_lag_probe(self, interval=5):
+        # Периодическая задача-зонд: насколько позже срока JobQueue её запускает
+        self._lag_probe_due = monotonic() + interval
+        self._lag_probe_interval = interval
+        self.job_queue.run_repeating(self.measure_lag, interval=interval, first=interval)
+
+    async def measure_lag(self, context: CallbackContext):
+        now = monotonic()
+        SCHEDULER_LAG_SECONDS.observe(max(0.0, now - self._lag_probe_due))
+        while self._lag_probe_due <= now:  # Пропущенные запуски не копят опоздание
+            self._lag_probe_due += self._lag_probe_interval
+
+    async def compact_inventory(self, context: CallbackContext):
+        if self.inventory_manager:
+            self.inventory_manager.compact_inventory()
+
     def schedule_daily_update(self):
-        logging.info("Планирование ежедневного обновления...")
+        logger.info("Планирование ежедневного обновления...")
         # Установите временную зону Красноярска
         krsk_tz = pytz.timezone('Asia/Krasnoyarsk')
         
@@ -54,7 +99,7 @@ class Scheduler:
         # Переведите его в UTC
         utc_time = local_time.astimezone(pytz.utc).time()
         
-        logging.info(f"Запланировано обновление на {utc_time} UTC.")
+        logger.info("Запланировано обновление на %s UTC.", utc_time)
         
         # Запланируйте задачу
         self.job_queue.run_daily(
@@ -63,7 +108,7 @@ class Scheduler:
         )
 
     def schedule_daily_clear_inventory(self):
-        logging.info("Планирование ежедневной очистки инвентаризации...")
+        logger.info("Планирование ежедневной очистки инвентаризации...")
         # Временная зона Красноярска
         krsk_tz = pytz.timezone('Asia/Krasnoyarsk')
         
@@ -73,7 +118,7 @@ class Scheduler:
         # Преобразуем его в UTC
         utc_time = local_time.astimezone(pytz.utc).time()
         
-        logging.info(f"Запланирована очистка инвентаризации на {utc_time} UTC.")
+        logger.info("Запланирована очистка инвентаризации на %s UTC.", utc_time)
 
         # Добавляем задачу в планировщик
         self.job_queue.run_daily(
@@ -82,53 +127,84 @@ class Scheduler:
         )    
 
     async def clear_inventory(self, context: CallbackContext):
-        logging.info("Очистка данных инвентаризации...")
+        logger.info("Очистка данных инвентаризации...")
         if self.inventory_manager:
+            # Вчерашние количества сначала уходят в архив снимков
+            try:
+                await self.inventory_manager.archive_inventories()
+            except OSError as e:
+                logger.error("Ошибка записи архива инвентаризации: %s. Очистка выполняется без снимка.", e)
             self.inventory_manager.clear_all_inventories()
-            logging.info("Очистка инвентаризации завершена.")
+            logger.info("Очистка инвентаризации завершена.")
         else:
-            logging.error("InventoryManager не установлен. Очистка не может быть выполнена.")
+            logger.error("InventoryManager не установлен. Очистка не может быть выполнена.")
+
+    def inventory_analytics(self):
+        """Сводная аналитика инвентаризации по филиалам; None, если InventoryManager не подключён."""
+        if not self.inventory_manager:
+            logger.error("InventoryManager не установлен. Аналитика недоступна.")
+            return None
+        return self.inventory_manager.build_analytics()
 
     async def disable_editing(self, context: CallbackContext):
-        logging.info("Обновление статуса инвентаризации: редактирование отключено.")
+        logger.info("Обновление статуса инвентаризации: редактирование отключено.")
         self.inventory_manager.set_inventory_status_complete()
 
+        # После закрытия редактирования формируем сводный отчёт по всем филиалам
+        if self.consolidated_report_mode:
+            report_path = await self.inventory_manager.save_consolidated_report(self.consolidated_report_mode)
+            if report_path:
+                logger.info("Сводный отчёт сформирован: %s", report_path)
+
+        analytics = self.inventory_analytics()
+        if analytics is not None:
+            logger.info("Итоги инвентаризации:\n%s", analytics.summary(self.inventory_manager.branch_name))
+
+    @staticmethod
+    def broadcast_kwargs(bot):
+        # Рассылки идут в низкоприоритетной полосе очереди исходящих сообщений
+        return {'rate_limit_args': BROADCAST} if getattr(bot, 'rate_limiter', None) else {}
+
     async def send_scheduled_message(self, context: CallbackContext):
         chat_id = context.job.data['chat_id']
         message = context.job.data['message']
 
         try:
-            await context.bot.send_message(chat_id=chat_id, text=message)
-            logging.info(f"Сообщение отправлено в чат ID: {chat_id}")
+            await context.bot.send_message(chat_id=chat_id, text=message, **self.broadcast_kwargs(context.bot))
+            logger.info("Сообщение отправлено в чат ID: %s", chat_id)
         except Exception as e:
-            logging.error(f"Ошибка при отправке сообщения: {e}")
+            logger.error("Ошибка при отправке сообщения: %s", e)
 
 
     def sync_check_events(self, context: CallbackContext):
         # Использование asyncio для асинхронного вызова
         asyncio.ensure_future(self.async_check_events(context))
 
+    async def send_reminder(self, bot, job_id, chat_id, message):
+        try:
+            await bot.send_message(chat_id=chat_id, text=message, **self.broadcast_kwargs(bot))
+            logger.info("Сообщение отправлено в чат ID: %s: %s", chat_id, message)
+        except Exception as e:
+            logger.error("Ошибка при отправке напоминания в чат %s: %s", chat_id, e)
+        # Задача снимается после попытки: при падении до неё отправка повторится после перезапуска
+        self.chat_manager.complete_reminder(job_id)
+
     async def async_check_events(self, context: CallbackContext):
-        # Вся логика проверки событий
+        # Отправляем все наступившие напоминания и ждём следующее
+        self._reminder_job = None
+        self._reminder_due = None
         try:
-            current_time = datetime.now()
-            logging.info("Проверка событий началась...")
-
-            for user_id, events in self.chat_manager.events.items():
-                for event in events:
-                    event_time_str = f"{event['date']} {event['time']}"
-                    event_time = datetime.strptime(event_time_str, '%Y-%m-%d %H:%M')
-                    time_diff = (event_time - current_time).total_seconds()
-
-                    if 0 < time_diff < 15:
-                        message = f"Напоминание: {event['description']} "\
-                                f"запланировано на {event['date']} в {event['time']}"
-                        chat_ids = self.chat_manager.get_chat_ids_by_user(user_id)
-                        for chat_id in chat_ids:
-                            await context.bot.send_message(chat_id=chat_id, text=message)
-                            logging.info(f"Сообщение отправлено в чат ID: {chat_id} об событии {event['description']}")
-
-            logging.info("Проверка событий завершена.")
+            due_reminders = self.chat_manager.reminders.pop_due(datetime.now())
+            logger.info("Наступивших напоминаний: %s.", len(due_reminders))
+
+            # Все отправки ставятся в очередь сразу; темп задаёт очередь исходящих сообщений
+            sends = [
+                self.send_reminder(context.bot, job_id, chat_id, message)
+                for job_id, due, (event_id, chat_id, message) in due_reminders
+            ]
+            await asyncio.gather(*sends)
         except Exception as e:
-            logging.error(f"Ошибка в async_check_events: {e}")
+            logger.error("Ошибка в async_check_events: %s", e)
+        finally:
+            self.reschedule_reminders()
 
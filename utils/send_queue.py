@@ -0,0 +1,248 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньше — раньше
+PRIORITY_INTERACTIVE = 0  # Ответы пользователю в диалоге
+PRIORITY_BROADCAST = 10  # Напоминания и рассылки по филиалам
+
+BROADCAST = {'priority': PRIORITY_BROADCAST}  # rate_limit_args для рассылок
+
+API_SECONDS = REGISTRY.histogram('telegram_api_seconds', "Вызовы Telegram Bot API", ('method',))
+API_ERRORS = REGISTRY.counter('telegram_api_errors_total', "Ошибки вызовов Telegram Bot API", ('method',))
+QUEUE_WAIT_SECONDS = REGISTRY.histogram('telegram_send_queue_wait_seconds', "Ожидание в очереди отправки")
+RETRIES = REGISTRY.counter('telegram_api_retries_total', "Повторы после RetryAfter")
+
+# Методы, которые отправляют или меняют сообщения в чате и попадают под лимиты Telegram
+_LIMITED_PREFIXES = ('send', 'edit', 'forward', 'copy')
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: токены могут уходить в минус, а reserve() сообщает, сколько ждать."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # Токенов в секунду
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now=None):
+        """Занимает один токен; возвращает задержку в секундах до момента, когда он станет доступен."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_acquire(self, now=None):
+        """Берёт токен, если он есть; иначе ничего не занимает и возвращает, сколько ждать до следующего."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateAwareSendQueue(BaseRateLimiter):
+    """
+    Центральная очередь исходящих запросов бота (rate limiter для ExtBot).
+
+    Все запросы бота проходят через process_request. Отправка сообщений
+    ставится в приоритетную очередь: интерактивные ответы обгоняют рассылки.
+    Воркеры соблюдают глобальный лимит (по умолчанию 28 сообщений/с — с запасом
+    до 30/с Telegram) и лимит на групповой чат (20 сообщений/мин): место
+    в ведре чата резервируется заранее, и запрос откладывается, не занимая
+    воркер. При RetryAfter вся отправка ставится на
+    паузу на указанное Telegram время, запрос возвращается в очередь и
+    повторяется до max_retries раз.
+    """
+
+    def __init__(self, overall_rate=28, group_rate_per_minute=20, workers=8, max_retries=3):
+        self.overall_rate = overall_rate
+        self.group_rate_per_minute = group_rate_per_minute
+        # Всплеск + пополнение за минуту не превышают лимит в любом скользящем окне
+        self.group_capacity = max(1, group_rate_per_minute // 4)
+        self.group_rate = (group_rate_per_minute - self.group_capacity) / 60
+        self.workers_count = workers
+        self.max_retries = max_retries
+        # Общий лимит без запаса на всплеск: отправки равномерно распределяются по секунде
+        self._global_bucket = TokenBucket(overall_rate, 1)
+        self._chat_buckets = {}  # chat_id -> TokenBucket
+        self._heap = []  # (priority, seq, request)
+        self._counter = itertools.count()
+        self._ready = None
+        self._workers = []
+        self._paused_until = 0.0
+        self._pending_delayed = {}  # Хендл отложенной постановки в очередь -> запрос
+        self.sent_count = 0
+        self.retry_count = 0
+
+    async def initialize(self):
+        if self._workers:
+            return
+        self._ready = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+        logger.info("Очередь исходящих сообщений запущена: воркеров %s, лимит %s/с, группы %s/мин.",
+                    self.workers_count, self.overall_rate, self.group_rate_per_minute)
+
+    async def shutdown(self):
+        for handle in self._pending_delayed:
+            handle.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Ожидающие запросы завершаем ошибкой, чтобы вызывающие не зависли
+        waiting = [request for _, _, request in self._heap] + list(self._pending_delayed.values())
+        for future, *_ in waiting:
+            if not future.done():
+                future.set_exception(RuntimeError("Очередь исходящих сообщений остановлена"))
+        self._heap = []
+        self._pending_delayed = {}
+
+    def queue_size(self):
+        return len(self._heap) + len(self._pending_delayed)
+
+    @staticmethod
+    def _priority(rate_limit_args):
+        if isinstance(rate_limit_args, dict):
+            return rate_limit_args.get('priority', PRIORITY_INTERACTIVE)
+        if isinstance(rate_limit_args, int):
+            return rate_limit_args
+        return PRIORITY_INTERACTIVE
+
+    def _chat_delay(self, chat_id, now):
+        """Резервирует место в ведре группового чата. Личные чаты ограничены только общим лимитом."""
+        try:
+            is_group = int(chat_id) < 0
+        except (TypeError, ValueError):
+            is_group = isinstance(chat_id, str) and chat_id.startswith('@')
+        if not is_group:
+            return 0.0
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10_000:
+                # Полные вёдра ничего не ограничивают — их можно забыть
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.is_idle(now)}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.group_rate, self.group_capacity)
+        return bucket.reserve(now)
+
+    @staticmethod
+    async def _call(callback, args, kwargs, endpoint):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(method=endpoint)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method=endpoint)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(_LIMITED_PREFIXES) or not self._workers:
+            return await self._call(callback, args, kwargs, endpoint)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request = (future, callback, args, kwargs, endpoint, 0, time.perf_counter())
+        priority = self._priority(rate_limit_args)
+
+        delay = self._chat_delay(data.get('chat_id'), time.monotonic())
+        if delay > 0:
+            logger.debug("Запрос %s в чат %s отложен на %.1f сек. (лимит чата).", endpoint, data.get('chat_id'), delay)
+            self._schedule(priority, request, delay)
+        else:
+            await self._push(priority, request)
+        return await future
+
+    def _schedule(self, priority, request, delay):
+        loop = asyncio.get_running_loop()
+
+        def enqueue():
+            self._pending_delayed.pop(handle, None)
+            loop.create_task(self._push(priority, request))
+
+        handle = loop.call_later(delay, enqueue)
+        self._pending_delayed[handle] = request
+
+    async def _push(self, priority, request):
+        async with self._ready:
+            heapq.heappush(self._heap, (priority, next(self._counter), request))
+            self._ready.notify()
+
+    async def _worker(self):
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._heap)
+                # Отменённые вызывающими запросы не должны занимать токен
+                while self._heap and self._heap[0][2][0].done():
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    continue
+                # Токен общего лимита берётся вместе с запросом под одной блокировкой:
+                # токен не пропадает, если запрос забрал другой воркер, а приоритет
+                # решается в момент отправки
+                delay = self._send_delay()
+                if delay <= 0:
+                    priority, _, request = heapq.heappop(self._heap)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            future, callback, args, kwargs, endpoint, attempt, queued = request
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued)
+            try:
+                result = await self._call(callback, args, kwargs, endpoint)
+                self.sent_count += 1
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    # Вызывающий мог уже отменить запрос: InvalidStateError остановил бы воркер
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                self._pause(e.retry_after, endpoint, attempt)
+                await self._push(priority, (future, callback, args, kwargs, endpoint, attempt + 1, time.perf_counter()))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _send_delay(self):
+        """0 — токен общего лимита взят и можно отправлять; иначе сколько ждать (пауза после RetryAfter или лимит)."""
+        now = time.monotonic()
+        pause = self._paused_until - now
+        if pause > 0:
+            return pause
+        return self._global_bucket.try_acquire(now)
+
+    def _pause(self, retry_after, endpoint, attempt):
+        seconds = retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta) else float(retry_after)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.retry_count += 1
+        RETRIES.inc()
+        logger.warning("Telegram ограничил отправку (%s): пауза %.0f сек., попытка %s из %s.",
+                       endpoint, seconds, attempt + 1, self.max_retries)
@@ -0,0 +1,410 @@
+import copy
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from utils.file_utils import JSON_SECONDS, atomic_write_json, copy_json_tree
+from utils.inventory_journal import InventoryJournal
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SECONDS = REGISTRY.histogram('sqlite_seconds', "Запросы и транзакции SQLite", ('operation',))
+
+
+class JsonStorage:
+    """
+    Хранилище на JSON-файлах (поведение по умолчанию).
+
+    Каждая сущность лежит в своём файле и загружается/сохраняется целиком.
+    Изменения инвентаризации дописываются в журнал (см. InventoryJournal).
+    Методы load_* пробрасывают FileNotFoundError, если файла ещё нет.
+    """
+
+    def __init__(self, chat_ids_path='chat_ids.json', events_path='events.json',
+                 admins_path='admins_ids.json', chat_members_path='chat_members.json',
+                 inventory_path='inventory.json', preferences_path='user_preferences.json',
+                 user_states_path='user_data.json'):
+        self.chat_ids_path = chat_ids_path
+        self.events_path = events_path
+        self.admins_path = admins_path
+        self.chat_members_path = chat_members_path
+        self.inventory_path = inventory_path
+        self.preferences_path = preferences_path
+        self.user_states_path = user_states_path
+        self.journal = InventoryJournal(os.path.splitext(inventory_path)[0] + '.journal.jsonl')
+
+    def _read(self, path):
+        with JSON_SECONDS.time(operation='load', file=os.path.basename(path)):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    # Чаты
+    def load_chat_ids(self):
+        return self._read(self.chat_ids_path)
+
+    def save_chat_ids(self, chat_ids):
+        atomic_write_json(self.chat_ids_path, chat_ids, ensure_ascii=False)
+
+    # События
+    def load_events(self):
+        return self._read(self.events_path)
+
+    def save_events(self, events):
+        atomic_write_json(self.events_path, events, ensure_ascii=False)
+
+    # Администраторы
+    def load_admins(self):
+        return set(self._read(self.admins_path).get("allowed_users", []))
+
+    def save_admins(self, allowed_users):
+        atomic_write_json(self.admins_path, {"allowed_users": list(allowed_users)}, ensure_ascii=False, indent=4)
+
+    # Участники чатов
+    def load_chat_members(self):
+        data = self._read(self.chat_members_path)
+        # Преобразуем list обратно в set
+        return {int(user_id): set(chats) for user_id, chats in data.items()}
+
+    def save_chat_members(self, chat_members):
+        # Преобразовываем set в list для возможности сериализации в JSON
+        data = {str(user_id): list(chats) for user_id, chats in chat_members.items()}
+        atomic_write_json(self.chat_members_path, data, ensure_ascii=False, indent=4)
+
+    def add_chat_member(self, user_id, chat_id, chat_members):
+        self.save_chat_members(chat_members)
+
+    # Инвентаризация
+    def load_inventories(self, inventory_template):
+        inventories = None
+        if os.path.exists(self.inventory_path):
+            try:
+                with JSON_SECONDS.time(operation='load', file=os.path.basename(self.inventory_path)):
+                    with open(self.inventory_path, 'r', encoding='utf-8') as f:
+                        content = f.read().strip()
+                    if content:
+                        inventories = json.loads(content)
+                if inventories is not None:
+                    logger.info("Инвентарь успешно загружен из файла.")
+            except json.JSONDecodeError as e:
+                logger.error("Ошибка декодирования JSON: %s. Используем шаблон для инициализации инвентаря.", e)
+        else:
+            logger.info("Файл инвентаризации не найден. Используем шаблон.")
+
+        if inventories is None:
+            inventories = copy.deepcopy(inventory_template)
+
+        # Досчитываем изменения, сделанные после последнего уплотнения
+        self.journal.replay(inventories, inventory_template)
+        return inventories
+
+    def save_inventories(self, inventories):
+        self.journal.compact(inventories, self.inventory_path)
+
+    def prepare_inventory_snapshot(self, inventories):
+        """Первая фаза фонового уплотнения (в цикле событий): копия данных и ротация журнала."""
+        self.journal.rotate()
+        return copy_json_tree(inventories)
+
+    def write_inventory_snapshot(self, snapshot):
+        """Вторая фаза (в потоке записи): атомарная запись снимка и удаление отложенного журнала."""
+        atomic_write_json(self.inventory_path, snapshot, ensure_ascii=False, indent=4)
+        self.journal.finish_compaction()
+
+    def record_inventory_change(self, inventories, chat_id, category, item, item_type, quantity):
+        """Ставит изменение в буфер журнала; на диск его пишет flush_inventory_changes()."""
+        self.journal.append(chat_id, category, item, item_type, quantity)
+
+    def flush_inventory_changes(self):
+        """Дописывает накопленные изменения в журнал (в потоке записи)."""
+        return self.journal.flush()
+
+    def has_pending_inventory_changes(self):
+        return self.journal.has_entries()
+
+    def needs_inventory_compaction(self):
+        return self.journal.needs_compaction()
+
+    # Предпочтения
+    def load_preferences(self):
+        return self._read(self.preferences_path)
+
+    def save_preferences(self, preferences):
+        atomic_write_json(self.preferences_path, preferences, ensure_ascii=False, indent=4)
+
+    # Состояния пользователей
+    def load_user_states(self):
+        return self._read(self.user_states_path)
+
+    def save_user_states(self, states, dirty_user_ids):
+        atomic_write_json(self.user_states_path, states, ensure_ascii=False)
+
+    def close(self):
+        self.journal.close()
+
+
+class SqliteStorage:
+    """
+    Хранилище на SQLite (WAL, индексированные таблицы).
+
+    Точечные изменения (количество, участник чата, состояние пользователя)
+    пишутся одной строкой, полные сохранения выполняются одной транзакцией.
+    """
+
+    UPSERT_INVENTORY = (
+        "INSERT INTO inventory (chat_id, category, item, item_type, quantity, filled) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (chat_id, category, item, item_type) "
+        "DO UPDATE SET quantity = excluded.quantity, filled = excluded.filled"
+    )
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            name TEXT PRIMARY KEY,
+            chat_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_chats_chat_id ON chats (chat_id);
+
+        CREATE TABLE IF NOT EXISTS events (
+            user_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id INTEGER PRIMARY KEY
+        );
+
+        CREATE TABLE IF NOT EXISTS chat_members (
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, chat_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_chat_members_chat_id ON chat_members (chat_id);
+
+        CREATE TABLE IF NOT EXISTS inventory (
+            chat_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            item TEXT NOT NULL,
+            item_type TEXT NOT NULL,
+            quantity NUMERIC,
+            filled INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, category, item, item_type)
+        );
+
+        CREATE TABLE IF NOT EXISTS preferences (
+            chat_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path='bot.db'):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        # Снимки инвентаря, ещё не записанные в базу: номер -> точечные изменения после снимка
+        self._snapshot_ids = itertools.count(1)
+        self._snapshot_changes = {}
+        self._pending_changes = []  # Точечные изменения инвентаря, ещё не записанные в базу
+        logger.info("SQLite-хранилище открыто: %s", db_path)
+
+    def _query(self, sql, params=()):
+        with self._lock, SQLITE_SECONDS.time(operation='query'):
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, statements):
+        """Выполняет набор (sql, params | [params]) в одной транзакции."""
+        with self._lock, SQLITE_SECONDS.time(operation='write'), self._conn:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    self._conn.executemany(sql, params)
+                else:
+                    self._conn.execute(sql, params)
+
+    # Чаты
+    def load_chat_ids(self):
+        return {name: chat_id for name, chat_id in self._query("SELECT name, chat_id FROM chats ORDER BY rowid")}
+
+    def save_chat_ids(self, chat_ids):
+        self._write([
+            ("DELETE FROM chats", ()),
+            ("INSERT INTO chats (name, chat_id) VALUES (?, ?)", list(chat_ids.items())),
+        ])
+
+    # События
+    def load_events(self):
+        events = {}
+        for user_id, data in self._query("SELECT user_id, data FROM events ORDER BY user_id, position"):
+            events.setdefault(user_id, []).append(json.loads(data))
+        return events
+
+    def save_events(self, events):
+        rows = [
+            (str(user_id), position, json.dumps(event, ensure_ascii=False))
+            for user_id, user_events in events.items()
+            for position, event in enumerate(user_events)
+        ]
+        self._write([
+            ("DELETE FROM events", ()),
+            ("INSERT INTO events (user_id, position, data) VALUES (?, ?, ?)", rows),
+        ])
+
+    # Администраторы
+    def load_admins(self):
+        return {user_id for (user_id,) in self._query("SELECT user_id FROM admins")}
+
+    def save_admins(self, allowed_users):
+        self._write([
+            ("DELETE FROM admins", ()),
+            ("INSERT INTO admins (user_id) VALUES (?)", [(user_id,) for user_id in allowed_users]),
+        ])
+
+    # Участники чатов
+    def load_chat_members(self):
+        chat_members = {}
+        for user_id, chat_id in self._query("SELECT user_id, chat_id FROM chat_members"):
+            chat_members.setdefault(user_id, set()).add(chat_id)
+        return chat_members
+
+    def save_chat_members(self, chat_members):
+        rows = [(int(user_id), chat_id) for user_id, chats in chat_members.items() for chat_id in chats]
+        self._write([
+            ("DELETE FROM chat_members", ()),
+            ("INSERT INTO chat_members (user_id, chat_id) VALUES (?, ?)", rows),
+        ])
+
+    def add_chat_member(self, user_id, chat_id, chat_members):
+        self._write([("INSERT OR IGNORE INTO chat_members (user_id, chat_id) VALUES (?, ?)", (int(user_id), chat_id))])
+
+    # Инвентаризация
+    def load_inventories(self, inventory_template):
+        inventories = {}
+        rows = self._query(
+            "SELECT chat_id, category, item, item_type, quantity, filled FROM inventory ORDER BY rowid"
+        )
+        for chat_id, category, item, item_type, quantity, filled in rows:
+            if chat_id not in inventories:
+                # Позиции, которых нет в базе, берём из шаблона
+                inventories[chat_id] = copy.deepcopy(inventory_template)
+            item_types = inventories[chat_id].setdefault(category, {}).setdefault(item, {})
+            item_types[item_type] = {'quantity': quantity, 'filled': bool(filled)}
+        logger.info("Инвентарь загружен из SQLite: %s филиалов.", len(inventories))
+        return inventories
+
+    @staticmethod
+    def iter_inventory_rows(inventories):
+        for chat_id, inventory in inventories.items():
+            for category, items in inventory.items():
+                for item, item_types in items.items():
+                    if not isinstance(item_types, dict):
+                        continue
+                    for item_type, option in item_types.items():
+                        # Пропускаем записи не в формате филиал -> категория -> товар -> тип
+                        if not isinstance(option, dict):
+                            continue
+                        yield (str(chat_id), category, item, item_type,
+                               option.get('quantity'), int(bool(option.get('filled'))))
+
+    def save_inventories(self, inventories):
+        self.write_inventory_snapshot(self.prepare_inventory_snapshot(inventories))
+
+    def prepare_inventory_snapshot(self, inventories):
+        """
+        Снимок строк инвентаря (снимается в цикле событий, пишется позже в потоке).
+        Точечные изменения, сделанные между снимком и его записью, запоминаются
+        и применяются поверх снимка в той же транзакции, иначе DELETE + INSERT
+        вернул бы устаревшие значения.
+        """
+        with self._lock:
+            snapshot_id = next(self._snapshot_ids)
+            self._snapshot_changes[snapshot_id] = []
+        return snapshot_id, list(self.iter_inventory_rows(inventories))
+
+    def write_inventory_snapshot(self, snapshot):
+        snapshot_id, rows = snapshot
+        with self._lock:
+            # Под той же блокировкой, что и record_inventory_change: новые изменения либо
+            # уже в списке, либо будут записаны после транзакции
+            changes = self._snapshot_changes.pop(snapshot_id, [])
+            self._write([
+                ("DELETE FROM inventory", ()),
+                ("INSERT INTO inventory (chat_id, category, item, item_type, quantity, filled) "
+                 "VALUES (?, ?, ?, ?, ?, ?)", rows),
+                (self.UPSERT_INVENTORY, changes),
+            ])
+
+    def record_inventory_change(self, inventories, chat_id, category, item, item_type, quantity):
+        """Ставит изменение в очередь; в базу его пишет flush_inventory_changes() пачкой."""
+        row = (str(chat_id), category, item, item_type, quantity, int(quantity is not None and quantity > 0))
+        with self._lock:
+            for changes in self._snapshot_changes.values():
+                changes.append(row)
+            self._pending_changes.append(row)
+
+    def flush_inventory_changes(self):
+        """Записывает накопленные изменения одной транзакцией (в потоке записи)."""
+        with self._lock:
+            rows, self._pending_changes = self._pending_changes, []
+            if not rows:
+                return 0
+            try:
+                self._write([(self.UPSERT_INVENTORY, rows)])
+            except sqlite3.Error:
+                self._pending_changes[:0] = rows
+                raise
+            return len(rows)
+
+    def has_pending_inventory_changes(self):
+        return False
+
+    def needs_inventory_compaction(self):
+        return False
+
+    # Предпочтения
+    def load_preferences(self):
+        return {chat_id: json.loads(data) for chat_id, data in self._query("SELECT chat_id, data FROM preferences")}
+
+    def save_preferences(self, preferences):
+        rows = [(str(chat_id), json.dumps(data, ensure_ascii=False)) for chat_id, data in preferences.items()]
+        self._write([
+            ("DELETE FROM preferences", ()),
+            ("INSERT INTO preferences (chat_id, data) VALUES (?, ?)", rows),
+        ])
+
+    # Состояния пользователей
+    def load_user_states(self):
+        return {user_id: json.loads(state) for user_id, state in self._query("SELECT user_id, state FROM user_states")}
+
+    def save_user_states(self, states, dirty_user_ids):
+        rows = [(user_id, json.dumps(states[user_id], ensure_ascii=False)) for user_id in dirty_user_ids if user_id in states]
+        self._write([(
+            "INSERT INTO user_states (user_id, state) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET state = excluded.state",
+            rows,
+        )])
+
+    def close(self):
+        with self._lock:
+            self.flush_inventory_changes()
+            self._conn.close()
+
+
+def create_storage(backend='json', db_path='bot.db', inventory_path='inventory.json'):
+    """Создаёт хранилище по имени бэкенда ('json' или 'sqlite')."""
+    if backend == 'sqlite':
+        return SqliteStorage(db_path)
+    if backend == 'json':
+        return JsonStorage(inventory_path=inventory_path)
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
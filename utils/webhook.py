@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import json
+import logging
+import signal
+from http import HTTPStatus
+
+import telegram
+import tornado.web
+from telegram import Update
+from telegram.ext import ExtBot
+
+# У PTB нет публичной точки расширения вебхук-сервера (приём пачек обновлений),
+# поэтому используются его внутренние tornado-классы. Они не входят в публичный
+# API и меняются между версиями: режим webhook проверен только с этой версией.
+PTB_WEBHOOK_VERSION = '22.8'
+
+try:
+    from telegram.ext._utils.webhookhandler import TelegramHandler, WebhookAppClass, WebhookServer
+except ImportError as exc:
+    raise RuntimeError(
+        f"Режим webhook требует python-telegram-bot=={PTB_WEBHOOK_VERSION} "
+        f"(установлена {telegram.__version__}): внутренний модуль вебхука PTB недоступен: {exc}"
+    ) from exc
+
+logger = logging.getLogger(__name__)
+
+# Что используется из внутренних классов: (класс, атрибут, параметры, которые передаём)
+_PTB_INTERNALS = (
+    (TelegramHandler, 'initialize', ('bot', 'update_queue', 'secret_token')),
+    (TelegramHandler, '_validate_post', ()),
+    (WebhookServer, '__init__', ('listen', 'port', 'webhook_app', 'ssl_ctx')),
+    (WebhookServer, 'serve_forever', ('ready',)),
+    (WebhookServer, 'shutdown', ()),
+)
+
+
+def check_webhook_support():
+    """
+    Проверка при запуске: установлена проверенная версия PTB, и внутренние
+    классы вебхука имеют ожидаемые методы и параметры. Иначе — RuntimeError
+    с объяснением, а не ошибка на первом запросе к вебхуку.
+    """
+    problems = []
+    if telegram.__version__ != PTB_WEBHOOK_VERSION:
+        problems.append(f"установлена версия {telegram.__version__}")
+    for cls, name, params in _PTB_INTERNALS:
+        method = getattr(cls, name, None)
+        if method is None:
+            problems.append(f"нет {cls.__name__}.{name}")
+            continue
+        missing = set(params) - set(inspect.signature(method).parameters)
+        if missing:
+            problems.append(f"{cls.__name__}.{name} без параметров {', '.join(sorted(missing))}")
+    if problems:
+        raise RuntimeError(
+            f"Режим webhook проверен только с python-telegram-bot=={PTB_WEBHOOK_VERSION}: "
+            f"{'; '.join(problems)}. Установите эту версию или используйте BOT_MODE=polling."
+        )
+
+
+class BatchTelegramHandler(TelegramHandler):
+    """
+    Обработчик вебхука, принимающий как одно обновление, так и JSON-массив
+    обновлений (пачку от обратного прокси). Каждое обновление кладётся
+    в очередь приложения; ответ — число принятых обновлений.
+    """
+
+    async def post(self):
+        self._validate_post()
+
+        try:
+            data = json.loads(self.request.body)
+        except ValueError as exc:
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST, reason="Invalid JSON") from exc
+
+        payloads = data if isinstance(data, list) else [data]
+        updates = []
+        for payload in payloads:
+            try:
+                update = Update.de_json(payload, self.bot)
+            except Exception as exc:
+                logger.error("Не удалось разобрать обновление из вебхука: %s", exc)
+                raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST, reason="Update could not be processed") from exc
+            if update:
+                updates.append(update)
+
+        for update in updates:
+            if isinstance(self.bot, ExtBot):
+                self.bot.insert_callback_data(update)
+            await self.update_queue.put(update)
+
+        self.set_status(HTTPStatus.OK)
+        self.write({"accepted": len(updates)})
+
+
+class BatchWebhookApp(WebhookAppClass):
+    def __init__(self, webhook_path, bot, update_queue, secret_token=None):
+        self.shared_objects = {
+            "bot": bot,
+            "update_queue": update_queue,
+            "secret_token": secret_token,
+        }
+        handlers = [(rf"{webhook_path}/?", BatchTelegramHandler, self.shared_objects)]
+        tornado.web.Application.__init__(self, handlers)
+
+
+async def start_webhook_server(application, listen='0.0.0.0', port=8443, url_path='/telegram', secret_token=None):
+    """Поднимает HTTP-сервер вебхука для уже инициализированного приложения."""
+    check_webhook_support()
+    url_path = '/' + url_path.strip('/')
+    app = BatchWebhookApp(url_path, application.bot, application.update_queue, secret_token)
+    server = WebhookServer(listen, port, app, None)
+    ready = asyncio.Event()
+    await server.serve_forever(ready=ready)
+    await ready.wait()
+    logger.info("Вебхук-сервер слушает %s:%s%s.", listen, port, url_path)
+    return server
+
+
+async def run_webhook(application, listen='0.0.0.0', port=8443, url_path='/telegram',
+                      webhook_url=None, secret_token=None, max_connections=100, stop_event=None):
+    """
+    Полный жизненный цикл приложения в режиме вебхука (аналог run_polling):
+    initialize -> post_init -> setWebhook -> сервер + start -> ожидание
+    stop_event -> stop -> post_stop -> shutdown -> post_shutdown.
+    """
+    stop_event = stop_event or asyncio.Event()
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                max_connections=max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("Вебхук зарегистрирован в Telegram: %s", webhook_url)
+
+        server = await start_webhook_server(application, listen, port, url_path, secret_token)
+        await application.start()
+        await stop_event.wait()
+    finally:
+        if server is not None:
+            await server.shutdown()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def serve_webhook(application, **kwargs):
+    """Блокирующий запуск вебхука с остановкой по SIGINT/SIGTERM."""
+    async def main():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        await run_webhook(application, stop_event=stop_event, **kwargs)
+
+    asyncio.run(main())